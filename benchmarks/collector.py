@@ -0,0 +1,47 @@
+"""Per transfer overhead of the TransitionCollector.
+
+Usage: PYTHONPATH=src python benchmarks/collector.py [--transfers N]
+"""
+import argparse
+import time
+
+from flow.analytics import TransitionCollector
+from flow.bases import FlowBase
+from flow.rules import OneToOneRule
+from flow.rules import RuleList
+
+STATES = ['state-%d' % i for i in range(32)]
+
+
+def run(transfers, collector=None):
+    rule = RuleList([
+        OneToOneRule(STATES[i], STATES[(i + 1) % len(STATES)])
+        for i in range(len(STATES))
+    ])
+    flow = FlowBase(rule, STATES[0])
+    if collector is not None:
+        collector.attach(flow)
+
+    values = [STATES[i % len(STATES)] for i in range(1, transfers + 1)]
+
+    started = time.perf_counter()
+    for value in values:
+        flow.value = value
+    return (time.perf_counter() - started) / transfers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--transfers', type=int, default=200000)
+    args = parser.parse_args()
+
+    plain = run(args.transfers)
+    collected = run(args.transfers, TransitionCollector())
+
+    print('plain:     %8.3f us/transfer' % (plain * 1e6))
+    print('collector: %8.3f us/transfer' % (collected * 1e6))
+    print('overhead:  %8.3f us/transfer' % ((collected - plain) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Synthetic rule graphs for the benchmarks."""
+import random
+
+from flow.rules import AllToManyRule
+from flow.rules import AllToOneRule
+from flow.rules import ManyToAllRule
+from flow.rules import ManyToManyRule
+from flow.rules import OneToAllRule
+from flow.rules import OneToManyRule
+from flow.rules import OneToOneRule
+from flow.rules import RuleList
+
+
+def states(count):
+    return ['state-%d' % i for i in range(count)]
+
+
+def ring_rules(values):
+    """One to one rules, every value goes to the next one."""
+    return [
+        OneToOneRule(values[i], values[(i + 1) % len(values)])
+        for i in range(len(values))
+    ]
+
+
+def random_rules(values, count, wildcards=0.0, seed=0):
+    """Random static rules over the values.
+
+    :param values: Values
+    :param count: Number of rules
+    :param wildcards: Share of the rules with ALL inputs or outputs
+    :param seed: Random seed
+    """
+    rng = random.Random(seed)
+    rules = []
+
+    for _ in range(count):
+        many_inputs = rng.sample(values, rng.randint(1, 4))
+        many_outputs = rng.sample(values, rng.randint(1, 4))
+
+        if rng.random() < wildcards:
+            factory = rng.choice((
+                lambda: OneToAllRule(many_inputs[0]),
+                lambda: AllToOneRule(many_outputs[0]),
+                lambda: ManyToAllRule(many_inputs),
+                lambda: AllToManyRule(many_outputs),
+            ))
+        else:
+            factory = rng.choice((
+                lambda: OneToOneRule(many_inputs[0], many_outputs[0]),
+                lambda: OneToManyRule(many_inputs[0], many_outputs),
+                lambda: ManyToManyRule(many_inputs, many_outputs),
+            ))
+        rules.append(factory())
+
+    return rules
+
+
+def flat_rule_list(size, wildcards=0.0, seed=0):
+    """RuleList of the ring rules and `size` random rules."""
+    values = states(max(size // 4, 8))
+    return values, RuleList(
+        ring_rules(values) + random_rules(values, size, wildcards, seed))
+
+
+def nested_rule_list(depth, fanout, seed=0):
+    """Tree of RuleLists, `fanout` inner rules on every level.
+
+    Leaves are ring rules, so every ring transfer is valid on each level.
+    """
+    values = states(fanout * 2)
+    rng = random.Random(seed)
+
+    def build(level):
+        if level == depth:
+            return RuleList(ring_rules(values))
+        inner = [build(level + 1) for _ in range(fanout)]
+        inner.extend(random_rules(values, fanout, seed=rng.random()))
+        return RuleList(inner)
+
+    return values, build(0)
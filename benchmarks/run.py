@@ -0,0 +1,70 @@
+"""Runs the benchmark suite and writes results as JSON.
+
+Usage:
+    PYTHONPATH=src python benchmarks/run.py -o results.json
+    PYTHONPATH=src python benchmarks/run.py -o new.json --baseline results.json
+"""
+import argparse
+import fnmatch
+import json
+import platform
+import sys
+
+from suite import CASES
+
+
+def compare(results, baseline, threshold):
+    """Prints metrics ratios, returns number of regressions."""
+    regressions = 0
+    for name, metrics in sorted(results.items()):
+        for metric, value in sorted(metrics.items()):
+            old = baseline.get(name, {}).get(metric)
+            if not old:
+                continue
+            ratio = value / old
+            mark = ''
+            if ratio > 1 + threshold:
+                mark = '  REGRESSION'
+                regressions += 1
+            print('%-32s %-24s %8.2fx%s' % (name, metric, ratio, mark))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-o', '--output', help='results JSON file')
+    parser.add_argument('-k', '--filter', default='*',
+                        help='glob pattern of the case names')
+    parser.add_argument('--baseline', help='baseline results JSON file')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='allowed slowdown against the baseline')
+    args = parser.parse_args()
+
+    results = {}
+    for name in sorted(CASES):
+        if not fnmatch.fnmatch(name, args.filter):
+            continue
+        results[name] = CASES[name]()
+        for metric, value in sorted(results[name].items()):
+            print('%-32s %-24s %.6g' % (name, metric, value))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'implementation': platform.python_implementation(),
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        print()
+        if compare(results, baseline, args.threshold):
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
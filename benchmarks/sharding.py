@@ -0,0 +1,64 @@
+"""Throughput of the ShardedEngine by the number of workers.
+
+Usage: PYTHONPATH=src python benchmarks/sharding.py [--flows N] [--rounds N]
+"""
+import argparse
+import os
+import time
+
+from flow.rules import OneToOneRule
+from flow.rules import RuleList
+from flow.sharding import ShardedEngine
+
+STATES = ['state-%d' % i for i in range(32)]
+
+
+def build_rule():
+    return RuleList([
+        OneToOneRule(STATES[i], STATES[(i + 1) % len(STATES)])
+        for i in range(len(STATES))
+    ])
+
+
+def run(workers, flows, rounds, batch_size):
+    rule = build_rule()
+
+    with ShardedEngine(rule, workers=workers) as engine:
+        engine.create((key, STATES[0], None) for key in range(flows))
+
+        transfers = 0
+        started = time.perf_counter()
+
+        for step in range(1, rounds + 1):
+            value = STATES[step % len(STATES)]
+            for start in range(0, flows, batch_size):
+                keys = range(start, min(start + batch_size, flows))
+                results = engine.transfer((key, value) for key in keys)
+                transfers += len(results)
+
+        elapsed = time.perf_counter() - started
+
+    return transfers / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--flows', type=int, default=100000)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    workers = 1
+    baseline = None
+    print('workers  transfers/s  speedup')
+    while workers <= args.max_workers:
+        throughput = run(workers, args.flows, args.rounds, args.batch_size)
+        baseline = baseline or throughput
+        print('%7d  %11.0f  %7.2f' % (
+            workers, throughput, throughput / baseline))
+        workers *= 2
+
+
+if __name__ == '__main__':
+    main()
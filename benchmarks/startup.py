@@ -0,0 +1,79 @@
+"""Startup cost: import of the core modules and construction of RuleLists.
+
+Usage: PYTHONPATH=src python benchmarks/startup.py [--rules N] [--repeat N]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from flow.rules import OneToOneRule
+from flow.rules import RuleList
+
+CORE_MODULES = ('flow.bases', 'flow.rules', 'flow.exceptions')
+
+_IMPORT_SCRIPT = '''
+import sys
+import time
+started = time.perf_counter()
+%s
+print(time.perf_counter() - started)
+'''
+
+
+def import_time(modules=CORE_MODULES, repeat=5):
+    """Best time of the modules import in a fresh interpreter, in seconds."""
+    script = _IMPORT_SCRIPT % '\n'.join('import %s' % m for m in modules)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    times = []
+    for _ in range(repeat):
+        output = subprocess.check_output(
+            [sys.executable, '-c', script], env=env)
+        times.append(float(output))
+    return min(times)
+
+
+def pairs(count):
+    """Ring of the (input, output) pairs over `count` values."""
+    values = ['state-%d' % i for i in range(count)]
+    return [(values[i], values[(i + 1) % count]) for i in range(count)]
+
+
+def construction_time(count, repeat=5):
+    """Best times of building RuleList of `count` one to one rules,
+    by the constructor and by `RuleList.from_pairs`, in seconds."""
+    transfers = pairs(count)
+
+    def construct():
+        return RuleList([OneToOneRule(*pair) for pair in transfers])
+
+    def from_pairs():
+        return RuleList.from_pairs(transfers)
+
+    results = []
+    for build in (construct, from_pairs):
+        times = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            build()
+            times.append(time.perf_counter() - started)
+        results.append(min(times))
+    return tuple(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rules', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print('%-24s %8.2f ms' % (
+        'import', import_time(repeat=args.repeat) * 1000))
+    construct, from_pairs = construction_time(args.rules, args.repeat)
+    print('%-24s %8.2f ms' % ('RuleList(rules)', construct * 1000))
+    print('%-24s %8.2f ms' % ('RuleList.from_pairs', from_pairs * 1000))
+
+
+if __name__ == '__main__':
+    main()
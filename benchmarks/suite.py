@@ -0,0 +1,158 @@
+"""Benchmark cases, every case returns a dict of the measured metrics."""
+import gc
+import timeit
+import tracemalloc
+
+from flow.bases import FlowBase
+from flow.graph import TransitionGraph
+from flow.exceptions import RuleListTransferError
+from flow.exceptions import TransferError
+
+import generator
+import startup as startup_module
+
+CASES = {}
+
+
+def case(name):
+    def decorator(func):
+        CASES[name] = func
+        return func
+    return decorator
+
+
+def per_call(func, repeat=5):
+    """Best time of one call, in seconds."""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def allocated(func):
+    """Bytes allocated by the objects, which are alive after the call."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = func()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del result
+    return after - before
+
+
+def _rule_list_case(name, build, accept, reject):
+    @case(name)
+    def run():
+        values, rule = build()
+        accept_pair = accept(values)
+        reject_pair = reject(values)
+        assert rule.is_valid(*accept_pair)[0]
+        assert not rule.is_valid(*reject_pair)[0]
+
+        return {
+            'accept': per_call(lambda: rule.is_valid(*accept_pair)),
+            'reject': per_call(lambda: rule.is_valid(*reject_pair)),
+        }
+
+
+def _ring_pair(values):
+    return values[0], values[1]
+
+
+def _skip_pair(values):
+    return values[0], values[2]
+
+
+def _missing_pair(values):
+    return 'missing', 'also missing'
+
+
+for _size in (10, 100, 1000):
+    _rule_list_case(
+        'flat_%d' % _size,
+        lambda size=_size: generator.flat_rule_list(size),
+        _ring_pair, _missing_pair)
+    _rule_list_case(
+        'wildcards_%d' % _size,
+        lambda size=_size: generator.flat_rule_list(size, wildcards=0.5),
+        _ring_pair, _missing_pair)
+
+for _depth in (1, 2, 3):
+    _rule_list_case(
+        'nested_depth_%d' % _depth,
+        lambda depth=_depth: generator.nested_rule_list(depth, 4),
+        _ring_pair, _skip_pair)
+
+
+@case('error_rendering')
+def error_rendering():
+    values, rule = generator.nested_rule_list(3, 4)
+    is_valid, error = rule.is_valid(*_skip_pair(values))
+    assert isinstance(error, RuleListTransferError)
+
+    return {
+        'get_message': per_call(lambda: RuleListTransferError.get_message(
+            error.rule, error.validation_data)),
+    }
+
+
+@case('flow_transfer')
+def flow_transfer():
+    values, rule = generator.flat_rule_list(100)
+    flow = FlowBase(rule, values[0])
+    ring = values[1:] + values[:1]
+
+    def transfer_ring():
+        for value in ring:
+            flow.value = value
+
+    def transfer_rejected():
+        try:
+            flow.value = 'missing'
+        except TransferError:
+            pass
+
+    return {
+        'accept': per_call(transfer_ring) / len(ring),
+        'reject': per_call(transfer_rejected),
+    }
+
+
+@case('memory')
+def memory():
+    count = 1000
+    values = generator.states(100)
+
+    rules = allocated(lambda: generator.random_rules(values, count))
+    rule_list = allocated(lambda: generator.flat_rule_list(count)[1])
+
+    _, rule = generator.flat_rule_list(count)
+    flows = allocated(
+        lambda: [FlowBase(rule, values[0]) for _ in range(count)])
+
+    return {
+        'bytes_per_rule': rules / count,
+        'bytes_per_indexed_rule': rule_list / count,
+        'bytes_per_flow': flows / count,
+    }
+
+
+@case('startup')
+def startup():
+    construct, from_pairs = startup_module.construction_time(5000)
+    return {
+        'import_core': startup_module.import_time(),
+        'rule_list_5000': construct,
+        'from_pairs_5000': from_pairs,
+    }
+
+
+@case('graph_export')
+def graph_export():
+    values, rule = generator.flat_rule_list(1000, wildcards=0.1)
+    return {
+        'from_rule': per_call(
+            lambda: TransitionGraph.from_rule(rule, values), repeat=3),
+    }
@@ -22,6 +22,14 @@ def main():
         ),
         long_description=long_description,
         long_description_content_type='text/markdown',
+        extras_require={
+            'numpy': ['numpy'],
+        },
+        entry_points={
+            'console_scripts': [
+                'flow-validate=flow.stream:main',
+            ],
+        },
         license='MIT License',
         classifiers=[
             'License :: OSI Approved :: MIT License',
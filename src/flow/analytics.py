@@ -0,0 +1,242 @@
+import csv
+from array import array
+
+from flow.bases import FlowHooks
+
+try:
+    from typing import TYPE_CHECKING
+except ImportError:
+    TYPE_CHECKING = False
+
+if TYPE_CHECKING:
+    from typing import Any
+    from typing import Dict
+    from typing import Iterable
+    from typing import Iterator
+    from typing import List
+    from typing import Optional
+    from typing import TextIO
+    from typing import Tuple
+
+    from flow.bases import FlowBase
+    from flow.bases import Value
+    from flow.exceptions import TransferError
+
+
+class _OtherType(object):
+    """Type of the bucket of the values over the collector limit."""
+    def __reduce__(self):
+        # Keeps the bucket a singleton after unpickling
+        return 'OTHER'
+
+    def __repr__(self):
+        return 'OTHER'
+
+
+OTHER = _OtherType()
+
+
+def _zeros(size):
+    # type: (int) -> array
+    return array('Q', bytes(8 * size))
+
+
+class TransitionMatrix(object):
+    """Counts of the transitions between values.
+
+    Counts are stored row-major, `accepted[i * len(values) + j]` is
+    the number of accepted transitions from `values[i]` to `values[j]`.
+    """
+    def __init__(self, values, accepted, rejected):
+        # type: (List[Value], array, array) -> None
+        """
+        :param values: Values, in the order of the matrix rows
+        :param accepted: Accepted transitions counts
+        :param rejected: Rejected transitions counts
+        """
+        self.values = values  # type: List[Value]
+        self.accepted = accepted  # type: array
+        self.rejected = rejected  # type: array
+
+    def _index(self, input_value, output_value):
+        # type: (Value, Value) -> Optional[int]
+        try:
+            return (self.values.index(input_value) * len(self.values) +
+                    self.values.index(output_value))
+        except ValueError:
+            return None
+
+    def count(self, input_value, output_value, accepted=True):
+        # type: (Value, Value, bool) -> int
+        """Number of the accepted (or rejected) transitions."""
+        index = self._index(input_value, output_value)
+        if index is None:
+            return 0
+        return (self.accepted if accepted else self.rejected)[index]
+
+    def rows(self):
+        # type: () -> Iterator[Tuple[Value, Value, int, int]]
+        """Nonzero (input value, output value, accepted, rejected) rows."""
+        size = len(self.values)
+        for index, (accepted, rejected) in enumerate(
+                zip(self.accepted, self.rejected)):
+            if accepted or rejected:
+                yield (self.values[index // size], self.values[index % size],
+                       accepted, rejected)
+
+    def write_csv(self, file):
+        # type: (TextIO) -> None
+        """Writes nonzero rows to the CSV file, values are written as `str`."""
+        writer = csv.writer(file)
+        writer.writerow(('input', 'output', 'accepted', 'rejected'))
+        writer.writerows(self.rows())
+
+    def to_numpy(self):
+        # type: () -> Tuple[Any, Any]
+        """Accepted and rejected counts as square NumPy arrays."""
+        import numpy
+
+        shape = (len(self.values), len(self.values))
+        return (
+            numpy.frombuffer(self.accepted, dtype=numpy.uint64).reshape(shape),
+            numpy.frombuffer(self.rejected, dtype=numpy.uint64).reshape(shape),
+        )
+
+
+class TransitionCollector(object):
+    """Opt-in collector of the transitions counts.
+
+    Values are interned to dense ids on the first occurrence, counts are
+    kept in flat square arrays, which are grown when values don't fit.
+    Number of the values is limited, so the junk values of the rejected
+    transfers don't grow the arrays without bound: values over the limit
+    are counted as the `OTHER` value. Values given to the collector
+    are interned first, so they are never counted as `OTHER`.
+    """
+    def __init__(self, capacity=16, values=(), max_values=256):
+        # type: (int, Iterable[Value], Optional[int]) -> None
+        """
+        :param capacity: Initial number of values
+        :param values: Values to intern, e.g. the domain of the rules
+        :param max_values: Maximum number of the values, None for
+            the unlimited collector
+        """
+        self._ids = {}  # type: Dict[Value, int]
+        self._values = []  # type: List[Value]
+        self._max_values = max_values  # type: Optional[int]
+        self._capacity = capacity  # type: int
+        self._accepted = _zeros(capacity * capacity)  # type: array
+        self._rejected = _zeros(capacity * capacity)  # type: array
+
+        for value in values:
+            self._add(value)
+
+    def _intern(self, value):
+        # type: (Value) -> int
+        value_id = self._ids.get(value)
+        if value_id is None:
+            limit = self._max_values
+            if limit is not None and (
+                    len(self._values) - (OTHER in self._ids) >= limit):
+                value = OTHER
+            value_id = self._add(value)
+        return value_id
+
+    def _add(self, value):
+        # type: (Value) -> int
+        value_id = self._ids.get(value)
+        if value_id is None:
+            value_id = self._ids[value] = len(self._values)
+            self._values.append(value)
+            if value_id >= self._capacity:
+                capacity = self._capacity * 2
+                if self._max_values is not None:
+                    # Limited values and `OTHER` fit exactly
+                    capacity = max(
+                        min(capacity, self._max_values + 1), value_id + 1)
+                self._grow(capacity)
+        return value_id
+
+    def _grow(self, capacity):
+        # type: (int) -> None
+        old_capacity = self._capacity
+        accepted = _zeros(capacity * capacity)
+        rejected = _zeros(capacity * capacity)
+
+        for row in range(old_capacity):
+            old = slice(row * old_capacity, (row + 1) * old_capacity)
+            new = slice(row * capacity, row * capacity + old_capacity)
+            accepted[new] = self._accepted[old]
+            rejected[new] = self._rejected[old]
+
+        self._capacity = capacity
+        self._accepted = accepted
+        self._rejected = rejected
+
+    def record(self, input_value, output_value, accepted=True):
+        # type: (Value, Value, bool) -> None
+        """Counts the transition."""
+        input_id = self._intern(input_value)
+        output_id = self._intern(output_value)
+        index = input_id * self._capacity + output_id
+        if accepted:
+            self._accepted[index] += 1
+        else:
+            self._rejected[index] += 1
+
+    def _on_commit(self, flow, input_value, output_value, error):
+        # type: (FlowBase, Value, Value, Optional[TransferError]) -> None
+        self.record(input_value, output_value, True)
+
+    def _on_reject(self, flow, input_value, output_value, error):
+        # type: (FlowBase, Value, Value, Optional[TransferError]) -> None
+        self.record(input_value, output_value, False)
+
+    def attach(self, flow):
+        # type: (FlowBase) -> None
+        """Collects transfers of the flow."""
+        flow.add_hook(FlowHooks.POST_COMMIT, self._on_commit)
+        flow.add_hook(FlowHooks.ON_REJECT, self._on_reject)
+
+    def detach(self, flow):
+        # type: (FlowBase) -> None
+        flow.remove_hook(FlowHooks.POST_COMMIT, self._on_commit)
+        flow.remove_hook(FlowHooks.ON_REJECT, self._on_reject)
+
+    def attach_class(self, flow_class):
+        # type: (type) -> None
+        """Collects transfers of all the flows of the class."""
+        flow_class.add_class_hook(FlowHooks.POST_COMMIT, self._on_commit)
+        flow_class.add_class_hook(FlowHooks.ON_REJECT, self._on_reject)
+
+    def detach_class(self, flow_class):
+        # type: (type) -> None
+        flow_class.remove_class_hook(FlowHooks.POST_COMMIT, self._on_commit)
+        flow_class.remove_class_hook(FlowHooks.ON_REJECT, self._on_reject)
+
+    def snapshot(self, reset=False):
+        # type: (bool) -> TransitionMatrix
+        """Copy of the collected counts.
+
+        :param reset: Start counting from zero, values stay interned
+        """
+        size = len(self._values)
+        capacity = self._capacity
+        accepted = array('Q')
+        rejected = array('Q')
+
+        for row in range(size):
+            start = row * capacity
+            accepted.extend(self._accepted[start:start + size])
+            rejected.extend(self._rejected[start:start + size])
+
+        if reset:
+            self.reset()
+
+        return TransitionMatrix(list(self._values), accepted, rejected)
+
+    def reset(self):
+        # type: () -> None
+        """Zeroes the counts."""
+        self._accepted = _zeros(self._capacity * self._capacity)
+        self._rejected = _zeros(self._capacity * self._capacity)
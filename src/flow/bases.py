@@ -1,17 +1,27 @@
 import abc
+import copy
+import time
+from collections.abc import MutableMapping
 from flow.exceptions import TransferError
+from flow.tables import diagnose
+from flow.tables import get_table
 
-try:
-    from typing import TYPE_CHECKING
-except ImportError:
-    TYPE_CHECKING = False
+# typing is slow to import, type checkers treat the name as true
+TYPE_CHECKING = False
 
 if TYPE_CHECKING:
+    from asyncio import Future
     from typing import Any
+    from typing import Awaitable
+    from typing import Callable
+    from typing import Dict
     from typing import Hashable
+    from typing import Iterable
+    from typing import List
     from typing import Optional
     from typing import Set
     from typing import Tuple
+    from typing import Union
 
     Value = Optional[Hashable]
 
@@ -31,18 +41,404 @@ class ValueContainerBase(metaclass=abc.ABCMeta):
         raise NotImplementedError
 
 
-_ALL = type('ALL', (object,), {})()
+class _AllType(object):
+    """Type of the wildcard value, which matches any value."""
+    def __reduce__(self):
+        # Keeps the wildcard a singleton after unpickling
+        return '_ALL'
+
+    def __repr__(self):
+        return 'ALL'
+
+
+_ALL = _AllType()
 
 
 class TransferContext(dict):
-    """Storage for the transfer context data."""
-    pass
+    """Storage for the transfer context data.
+
+    Rules, which keep their state in the context (e.g. `RateLimitRule`),
+    stage it by `stage`. Flows apply the staged state once the transfer
+    is accepted, so rejected transfers don't change it.
+    """
+    # Staged state of the validated transfer
+    _staged = None  # type: Optional[Dict[Hashable, Any]]
+
+    def stage(self, key, value):
+        # type: (Hashable, Any) -> None
+        """Sets the key once the validated transfer is accepted."""
+        if self._staged is None:
+            self._staged = {}
+        self._staged[key] = value
+
+    def _apply_staged(self, accepted):
+        # type: (bool) -> None
+        """Applies the staged state of the accepted transfer,
+        or discards it."""
+        staged = self._staged
+        self._staged = None
+        if accepted:
+            self.update(staged)
+
+
+# Key of the whole context, read by iteration, `keys()`, `len()`, etc.,
+# it is changed by the change of any key
+_WHOLE = object()
+
+
+class TrackedContext(TransferContext):
+    """Transfer context, which tracks context reads of the rules.
+
+    Every key has a version counter, incremented by the key changes.
+    `RuleList` evaluates rules by `evaluate`, results are cached with
+    versions of the keys read by the rule (and by its nested rules),
+    and reused for the same transfer until one of the keys is changed.
+
+    Rules reading the whole context (iteration, `keys()`, `items()`,
+    `len()`, etc.) depend on all the keys. Results of the rules, which
+    change the context or are not `cacheable`, are not cached. Changes
+    of the mutable values inside the context are not tracked, keys
+    should be set again.
+    """
+    def __init__(self, *args, **kwargs):
+        super(TrackedContext, self).__init__(*args, **kwargs)
+        self._versions = {}  # type: Dict[Hashable, int]
+        self._changes = 0  # type: int
+        # Keys read by the rules being evaluated
+        self._reads = []  # type: List[Set[Hashable]]
+        self._cache = {}  # type: Dict[tuple, Tuple[Tuple[bool, Optional[TransferError]], Tuple[Tuple[Hashable, int], ...]]]
+
+    def _read(self, key):
+        # type: (Hashable) -> None
+        if self._reads:
+            self._reads[-1].add(key)
+
+    def _read_all(self):
+        # type: () -> None
+        if self._reads:
+            self._reads[-1].add(_WHOLE)
+
+    def _changed(self, key):
+        # type: (Hashable) -> None
+        self._versions[key] = self._versions.get(key, 0) + 1
+        self._changes += 1
+
+    def __getitem__(self, key):
+        self._read(key)
+        return super(TrackedContext, self).__getitem__(key)
+
+    def __contains__(self, key):
+        self._read(key)
+        return super(TrackedContext, self).__contains__(key)
+
+    def get(self, key, default=None):
+        self._read(key)
+        return super(TrackedContext, self).get(key, default)
+
+    def __iter__(self):
+        self._read_all()
+        return super(TrackedContext, self).__iter__()
+
+    def __len__(self):
+        self._read_all()
+        return super(TrackedContext, self).__len__()
+
+    def __eq__(self, other):
+        self._read_all()
+        return super(TrackedContext, self).__eq__(other)
+
+    def __ne__(self, other):
+        self._read_all()
+        return super(TrackedContext, self).__ne__(other)
+
+    __hash__ = None  # type: ignore
+
+    def keys(self):
+        self._read_all()
+        return super(TrackedContext, self).keys()
+
+    def values(self):
+        self._read_all()
+        return super(TrackedContext, self).values()
+
+    def items(self):
+        self._read_all()
+        return super(TrackedContext, self).items()
+
+    def copy(self):
+        self._read_all()
+        return super(TrackedContext, self).copy()
+
+    def __setitem__(self, key, value):
+        super(TrackedContext, self).__setitem__(key, value)
+        self._changed(key)
+
+    def __delitem__(self, key):
+        super(TrackedContext, self).__delitem__(key)
+        self._changed(key)
+
+    def setdefault(self, key, default=None):
+        self._read(key)
+        if not super(TrackedContext, self).__contains__(key):
+            self[key] = default
+        return super(TrackedContext, self).__getitem__(key)
+
+    def pop(self, key, *default):
+        self._read(key)
+        if super(TrackedContext, self).__contains__(key):
+            self._changed(key)
+        return super(TrackedContext, self).pop(key, *default)
+
+    def popitem(self):
+        key, value = super(TrackedContext, self).popitem()
+        self._changed(key)
+        return key, value
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        for key in list(super(TrackedContext, self).keys()):
+            del self[key]
+
+    def version(self, key):
+        # type: (Hashable) -> int
+        """Version of the key, number of its changes."""
+        if key is _WHOLE:
+            return self._changes
+        return self._versions.get(key, 0)
+
+    def evaluate(self, rule, input_value, output_value):
+        # type: (RuleBase, Value, Value) -> Tuple[bool, Optional[TransferError]]
+        """Result of the rule for the transfer, cached if possible."""
+        if not rule.cacheable:
+            return rule.is_valid(input_value, output_value, self)
+
+        cache_key = (rule, input_value, output_value)
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            result, versions = cached
+            if all(self.version(key) == version
+                   for key, version in versions):
+                if self._reads:
+                    self._reads[-1].update(key for key, _ in versions)
+                return result
+
+        changes = self._changes
+        self._reads.append(set())
+        try:
+            result = rule.is_valid(input_value, output_value, self)
+        finally:
+            keys = self._reads.pop()
+
+        if self._reads:
+            self._reads[-1].update(keys)
+
+        if self._changes == changes:
+            self._cache[cache_key] = (result, tuple(
+                (key, self.version(key)) for key in keys))
+        else:
+            self._cache.pop(cache_key, None)
+        return result
+
+    def __deepcopy__(self, memo):
+        context = type(self)(copy.deepcopy(
+            dict(super(TrackedContext, self).items()), memo))
+        context._versions = dict(self._versions)
+        context._changes = self._changes
+        context._cache = dict(self._cache)
+        return context
+
+    def __reduce__(self):
+        # Versions and cached results are not pickled
+        state = dict(self.__dict__)
+        for name in ('_versions', '_changes', '_reads', '_cache'):
+            state.pop(name, None)
+        return type(self), (dict(super(TrackedContext, self).items()),), state
+
+    def clear_cache(self):
+        # type: () -> None
+        """Drops cached results of the rules."""
+        self._cache.clear()
 
 
-class RuleBase(metaclass=abc.ABCMeta):
+# Value of the missing context key in the deltas
+_MISSING = object()
+# Staged value of the deleted key
+_DELETED = object()
+
+
+class StagedContext(MutableMapping):
+    """Overlay of the transfer context, which stages the changes.
+
+    Reads see the staged changes over the context, writes, deletions
+    and `stage` calls are kept by the overlay, so transfers can be
+    validated without copying the context, and `apply` changes the
+    context once they are accepted.
+    """
+    def __init__(self, context):
+        # type: (dict) -> None
+        """
+        :param context: Underlying context, it isn't changed until `apply`
+        """
+        self.context = context  # type: dict
+        self.changes = {}  # type: Dict[Hashable, Any]
+
+    def __getitem__(self, key):
+        changes = self.changes
+        if key in changes:
+            value = changes[key]
+            if value is _DELETED:
+                raise KeyError(key)
+            return value
+        return self.context[key]
+
+    def get(self, key, default=None):
+        changes = self.changes
+        if key in changes:
+            value = changes[key]
+            return default if value is _DELETED else value
+        return self.context.get(key, default)
+
+    def __contains__(self, key):
+        changes = self.changes
+        if key in changes:
+            return changes[key] is not _DELETED
+        return key in self.context
+
+    def __setitem__(self, key, value):
+        self.changes[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.changes[key] = _DELETED
+
+    def __iter__(self):
+        changes = self.changes
+        for key in self.context:
+            if key not in changes:
+                yield key
+        for key, value in changes.items():
+            if value is not _DELETED:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return '<StagedContext %s>' % repr(dict(self))
+
+    def stage(self, key, value):
+        # type: (Hashable, Any) -> None
+        """Sets the key, the whole overlay is staged already."""
+        self.changes[key] = value
+
+    def apply(self):
+        # type: () -> List[Tuple[Hashable, Any, Any]]
+        """Applies the staged changes to the context.
+
+        :return: Changes as (key, old value, new value), `_MISSING`
+            stands for the missing key
+        """
+        context = self.context
+        delta = []
+        for key, value in self.changes.items():
+            old = context.get(key, _MISSING)
+            if value is _DELETED:
+                if old is _MISSING:
+                    continue
+                del context[key]
+                value = _MISSING
+            else:
+                context[key] = value
+            delta.append((key, old, value))
+        self.changes = {}
+        return delta
+
+
+def _diagnose_rejected(rule, input_value, output_value, context, err):
+    # type: (RuleBase, Value, Value, Optional[dict], TransferError) -> TransferError
+    """Error of the transfer rejected by the non-static rule, with the
+    results of all the matched rules, see `diagnose`. Changes of the
+    context by the re-run are discarded."""
+    if context is not None:
+        context = StagedContext(context)
+    is_valid, full_err = diagnose(rule, input_value, output_value, context)
+    # Rule may accept the re-run, e.g. if it depends on the time
+    return err if is_valid or full_err is None else full_err
+
+
+class Explanation(object):
+    """Diagnostic result of the rule: verdict, error, time of the
+    evaluation and explanations of the evaluated inner rules."""
+    def __init__(self, rule, is_valid, error, time, children=()):
+        # type: (RuleBase, bool, Optional[TransferError], float, Iterable[Explanation]) -> None
+        """
+        :param rule: Evaluated rule
+        :param is_valid: Verdict of the rule
+        :param error: Error of the invalid transfer
+        :param time: Evaluation time, including the inner rules
+        :param children: Explanations of the inner rules, in the order
+        """
+        self.rule = rule  # type: RuleBase
+        self.is_valid = is_valid  # type: bool
+        self.error = error  # type: Optional[TransferError]
+        self.time = time  # type: float
+        self.children = list(children)  # type: List[Explanation]
+
+    def as_dict(self):
+        # type: () -> dict
+        return {
+            'rule': repr(self.rule),
+            'is_valid': self.is_valid,
+            'error': None if self.error is None else str(self.error),
+            'time': self.time,
+            'children': [child.as_dict() for child in self.children],
+        }
+
+    def __repr__(self):
+        return '<Explanation %s: is_valid=%s time=%.6f>' % (
+            repr(self.rule), self.is_valid, self.time)
+
+
+class _RuleMeta(abc.ABCMeta):
+    """Metaclass of the rules.
+
+    Subclass, which overrides the validation of a concrete rule, may
+    depend on the context, so it isn't `static` unless it says so, and
+    its `check` runs the override unless it has its own fast path.
+    """
+    def __init__(cls, name, bases, namespace):
+        super(_RuleMeta, cls).__init__(name, bases, namespace)
+        inherited = getattr(super(cls, cls), 'is_valid', None)
+        if 'is_valid' in namespace and inherited is not None and not getattr(
+                inherited, '__isabstractmethod__', False):
+            if 'static' not in namespace:
+                cls.static = False
+            # Inherited fast path would skip the override
+            if 'check' not in namespace:
+                cls.check = RuleBase.check
+
+
+class RuleBase(metaclass=_RuleMeta):
     """Base rule class."""
     ALL = _ALL
 
+    # Guard only restricts transfers allowed by other rules, RuleList
+    # doesn't allow the transfer if all the matched rules are guards
+    guard = False  # type: bool
+
+    # Result depends only on the transfer values and the context,
+    # so it can be cached by the `TrackedContext`
+    cacheable = True  # type: bool
+
+    # Result depends only on the transfer values, not on the context,
+    # so the rule can be precompiled into the `TransitionTable`.
+    # Overrides of `is_valid` reset it, see `_RuleMeta`
+    static = False  # type: bool
+
     @property  # type: ignore
     @abc.abstractmethod
     def inputs(self):
@@ -69,9 +465,177 @@ class RuleBase(metaclass=abc.ABCMeta):
         """
         raise NotImplementedError
 
+    def check(self, input_value, output_value, context=None):
+        # type: (Value, Value, Optional[TransferContext]) -> bool
+        """Is transfer valid, without the error details.
+
+        Fast path of the validation, rules can skip building errors
+        and results of the inner rules.
+        """
+        return self.is_valid(input_value, output_value, context)[0]
+
+    def explain(self, input_value, output_value, context=None,
+                clock=time.perf_counter):
+        # type: (Value, Value, Optional[TransferContext], Callable[[], float]) -> Explanation
+        """Diagnostic validation of the transfer, see `Explanation`.
+
+        :param clock: Time source
+        """
+        started = clock()
+        is_valid, err = self.is_valid(input_value, output_value, context)
+        return Explanation(self, is_valid, err, clock() - started)
+
+
+class FlowHooks(object):
+    """Registry of the transfer observers.
+
+    Observer is called as `callback(flow, input_value, output_value, error)`,
+    error is passed for the rejected transfers only.
+
+    In the buffered mode events are collected, and observer is called
+    once per `buffer_size` events with the list of
+    (flow, input_value, output_value, error) tuples. Call `flush`
+    to dispatch the rest of the events.
+    """
+    PRE_VALIDATE = 'pre_validate'  # type: str
+    POST_COMMIT = 'post_commit'  # type: str
+    ON_REJECT = 'on_reject'  # type: str
+
+    EVENTS = (PRE_VALIDATE, POST_COMMIT, ON_REJECT)
+
+    def __init__(self, buffer_size=None):
+        # type: (Optional[int]) -> None
+        """
+        :param buffer_size: Enables the buffered mode
+        """
+        self.buffer_size = buffer_size  # type: Optional[int]
+        self._callbacks = {
+            event: [] for event in self.EVENTS
+        }  # type: Dict[str, List[Callable]]
+        self._buffers = {
+            event: [] for event in self.EVENTS
+        }  # type: Dict[str, List[tuple]]
+
+    def _get_callbacks(self, event):
+        # type: (str) -> List[Callable]
+        try:
+            return self._callbacks[event]
+        except KeyError:
+            raise ValueError('Unknown event: %s' % repr(event))
+
+    def add(self, event, callback):
+        # type: (str, Callable) -> None
+        """Registers the observer of the event."""
+        self._get_callbacks(event).append(callback)
+
+    def remove(self, event, callback):
+        # type: (str, Callable) -> None
+        """Unregisters the observer of the event."""
+        self._get_callbacks(event).remove(callback)
+
+    def __bool__(self):
+        return any(self._callbacks.values())
+
+    def dispatch(self, event, flow, input_value, output_value, error=None):
+        # type: (str, FlowBase, Value, Value, Optional[TransferError]) -> None
+        """Notifies observers of the event."""
+        callbacks = self._callbacks[event]
+        if not callbacks:
+            return
+
+        if self.buffer_size is None:
+            for callback in callbacks:
+                callback(flow, input_value, output_value, error)
+        else:
+            buffer = self._buffers[event]
+            buffer.append((flow, input_value, output_value, error))
+            if len(buffer) >= self.buffer_size:
+                self._flush(event)
+
+    def _flush(self, event):
+        # type: (str) -> None
+        events = self._buffers[event]
+        if not events:
+            return
+
+        self._buffers[event] = []
+        for callback in self._callbacks[event]:
+            callback(events)
+
+    def flush(self):
+        # type: () -> None
+        """Dispatches buffered events."""
+        for event in self.EVENTS:
+            self._flush(event)
+
+
+class _Waiters(object):
+    """Pending `FlowBase.wait_for` futures of one flow.
+
+    Value waiters are grouped by the value, so the transfer wakes
+    only the futures of the new value, predicate waiters are checked
+    on every transfer.
+    """
+    def __init__(self):
+        self.values = {}  # type: Dict[Value, Set[Future]]
+        self.predicates = []  # type: List[Tuple[Callable[[Value], bool], Future]]
+
+    def __bool__(self):
+        return bool(self.values or self.predicates)
+
+    def add_value(self, value, future):
+        # type: (Value, Future) -> None
+        futures = self.values.get(value)
+        if futures is None:
+            futures = self.values[value] = set()
+        futures.add(future)
+
+    def discard_value(self, value, future):
+        # type: (Value, Future) -> None
+        futures = self.values.get(value)
+        if futures is not None:
+            futures.discard(future)
+            if not futures:
+                del self.values[value]
+
+    def discard_predicate(self, future):
+        # type: (Future) -> None
+        self.predicates = [
+            (predicate, waiter) for predicate, waiter in self.predicates
+            if waiter is not future
+        ]
+
+    def wake(self, value):
+        # type: (Value) -> None
+        """Resolves futures waiting for the value."""
+        futures = self.values.pop(value, None)
+        if futures:
+            for future in futures:
+                if not future.done():
+                    future.set_result(value)
+
+        if self.predicates:
+            pending = []
+            for predicate, future in self.predicates:
+                if future.done():
+                    continue
+                if predicate(value):
+                    future.set_result(value)
+                else:
+                    pending.append((predicate, future))
+            self.predicates = pending
+
 
 class FlowBase(ValueContainerBase):
-    """Base values flow class."""
+    """Base values flow class.
+
+    Transfers go through the plain path until observers are registered,
+    registering the first observer switches the flow (or the class)
+    to the observed path.
+    """
+    # Class of the transfer context, e.g. `TrackedContext`
+    context_class = TransferContext  # type: type
+
     def __init__(self, rule, init=None, context=None):
         # type: (RuleBase, Value, dict) -> None
         """
@@ -82,13 +646,15 @@ class FlowBase(ValueContainerBase):
         self._rule = rule  # type: RuleBase
         self._value = init  # type: Value
         self._context = None  # type: TransferContext
+        self._hooks = None  # type: Optional[FlowHooks]
+        self._waiters = None  # type: Optional[_Waiters]
 
         self.init_context(context or {})
 
     def init_context(self, context):
         # type: (dict) -> None
         """Initialize transfer context."""
-        self._context = TransferContext(context)  # type: TransferContext
+        self._context = self.context_class(context)  # type: TransferContext
 
     @property
     def context(self):
@@ -100,10 +666,345 @@ class FlowBase(ValueContainerBase):
     def value(self):
         return self._value
 
-    @value.setter
-    def value(self, value):
-        is_valid, err = self._rule.is_valid(self._value, value, self._context)
+    def _check(self, value):
+        # type: (Value) -> Tuple[bool, Optional[TransferError]]
+        """Validates the transfer, static rules are checked by the fast
+        path and re-run for the error only if the transfer is invalid."""
+        rule = self._rule
+        if not rule.static:
+            context = self._context
+            if self._journal is not None:
+                # Changes are applied through the journal
+                staged = StagedContext(context)
+                is_valid, err = rule.is_valid(self._value, value, staged)
+                if is_valid:
+                    self._apply_context(staged)
+            else:
+                is_valid, err = rule.is_valid(self._value, value, context)
+                # Contexts of the subclasses may be plain dicts
+                if getattr(context, '_staged', None) is not None:
+                    context._apply_staged(is_valid)
+            if is_valid:
+                return True, None
+            return False, _diagnose_rejected(
+                rule, self._value, value, context, err)
+        if rule.check(self._value, value):
+            return True, None
+        return diagnose(rule, self._value, value)
+
+    def _transfer(self, value):
+        # type: (Value) -> None
+        """Transfers the flow to the value, setter of the `value`.
+
+        Plain path is inlined, it is the hot path of the flows
+        without observers.
+        """
+        if self._observed:
+            self._transfer_observed(value)
+            return
+
+        rule = self._rule
+        if rule.static:
+            if rule.check(self._value, value):
+                self._value = value
+                return
+            err = diagnose(rule, self._value, value)[1]
+        else:
+            context = self._context
+            is_valid, err = rule.is_valid(self._value, value, context)
+            if getattr(context, '_staged', None) is not None:
+                context._apply_staged(is_valid)
+            if is_valid:
+                self._value = value
+                return
+            err = _diagnose_rejected(rule, self._value, value, context, err)
+        raise err
+
+    def _transfer_observed(self, value):
+        # type: (Value) -> None
+        registries = self._get_registries()
+        input_value = self._value
+
+        for hooks in registries:
+            hooks.dispatch(FlowHooks.PRE_VALIDATE, self, input_value, value)
+
+        is_valid, err = self._check(value)
         if is_valid:
             self._value = value
+            for hooks in registries:
+                hooks.dispatch(
+                    FlowHooks.POST_COMMIT, self, input_value, value)
+            if self._waiters is not None:
+                self._wake_waiters(value)
         else:
+            for hooks in registries:
+                hooks.dispatch(
+                    FlowHooks.ON_REJECT, self, input_value, value, err)
+            raise err
+
+    value = value.setter(_transfer)
+
+    # Observers are registered for the flow (or the class)
+    _observed = False  # type: bool
+
+    # Applied context changes as (key, old value, new value), while it is
+    # set, transfers of the observed flow stage the changes of the rules
+    # (see `StagedContext`), so all of them are recorded, e.g. by `History`
+    _journal = None  # type: Optional[List[Tuple[Hashable, Any, Any]]]
+
+    def explain(self, value):
+        # type: (Value) -> Explanation
+        """Diagnostic validation of the transfer to the value: verdicts,
+        errors and times of all the evaluated rules.
+
+        Rules are evaluated against the `StagedContext` overlay,
+        the flow is not changed and observers are not notified.
+        """
+        return self._rule.explain(
+            self._value, value, StagedContext(self._context))
+
+    def _validate_path(self, values, context=None):
+        # type: (List[Value], Optional[StagedContext]) -> Tuple[StagedContext, int, Optional[TransferError]]
+        """Validates the path of the transfers from the current value.
+
+        Static rule is checked by its transition table, otherwise
+        transfers are validated against the staged context, so
+        the context of the flow isn't changed.
+
+        :param context: Staged context to validate against, by default
+            the new overlay of the flow context
+        :return: (Staged context, Number of the valid transfers, Error)
+        """
+        if context is None:
+            context = StagedContext(self._context)
+        if self._rule.static:
+            steps, err = get_table(self._rule).check_path(self._value, values)
+            return context, steps, err
+
+        input_value = self._value
+        for steps, output_value in enumerate(values):
+            is_valid, err = self._rule.is_valid(
+                input_value, output_value, context)
+            if not is_valid:
+                return context, steps, _diagnose_rejected(
+                    self._rule, input_value, output_value, context, err)
+            input_value = output_value
+        return context, len(values), None
+
+    def transfer_path(self, values):
+        # type: (Iterable[Value]) -> None
+        """Transfers the flow through the values, e.g. DRAFT -> REVIEW -> DONE.
+
+        The whole path is validated first and committed atomically,
+        if any transfer is invalid neither the value nor the context
+        is changed. Staged changes of the context are applied with
+        the last value.
+
+        :param values: Values of the path, without the current value
+        :raise TransferError: Error of the first invalid transfer
+        """
+        values = list(values)
+        if not values:
+            return
+
+        self._dispatch_path(FlowHooks.PRE_VALIDATE, values)
+        context, steps, err = self._validate_path(values)
+        if err is not None:
+            self._reject_path(values, steps, err)
             raise err
+        self._commit_path(values, context)
+
+    def _dispatch_path(self, event, values):
+        # type: (str, List[Value]) -> None
+        registries = self._get_registries()
+        if registries:
+            path = [self._value] + values
+            for hooks in registries:
+                for input_value, output_value in zip(path, values):
+                    hooks.dispatch(event, self, input_value, output_value)
+
+    def _reject_path(self, values, steps, err):
+        # type: (List[Value], int, TransferError) -> None
+        input_value = values[steps - 1] if steps else self._value
+        for hooks in self._get_registries():
+            hooks.dispatch(
+                FlowHooks.ON_REJECT, self, input_value, values[steps], err)
+
+    def _commit_path(self, values, context):
+        # type: (List[Value], StagedContext) -> None
+        """Commits the validated path with its staged context."""
+        input_value = self._value
+        self._apply_path(values, context)
+        self._notify_path(input_value, values)
+
+    def _apply_path(self, values, context):
+        # type: (List[Value], StagedContext) -> None
+        """Changes the value and applies the staged context,
+        observers aren't notified."""
+        self._value = values[-1]
+        self._apply_context(context)
+
+    def _apply_context(self, context):
+        # type: (StagedContext) -> None
+        """Applies the staged context, changes are recorded by the journal."""
+        delta = context.apply()
+        if self._journal is not None:
+            self._journal.extend(delta)
+
+    def _notify_path(self, input_value, values):
+        # type: (Value, List[Value]) -> None
+        """Notifies the observers and the waiters of the applied path."""
+        registries = self._get_registries()
+        if registries:
+            path = [input_value] + values
+            for hooks in registries:
+                for input_value, output_value in zip(path, values):
+                    hooks.dispatch(
+                        FlowHooks.POST_COMMIT, self, input_value, output_value)
+        for value in values:
+            if self._waiters is None:
+                break
+            self._wake_waiters(value)
+
+    def _get_registries(self):
+        # type: () -> List[FlowHooks]
+        registries = [
+            klass.__dict__['_class_hooks']
+            for klass in reversed(type(self).__mro__)
+            if '_class_hooks' in klass.__dict__
+        ]
+        if self._hooks is not None:
+            registries.append(self._hooks)
+        return registries
+
+    @property
+    def hooks(self):
+        # type: () -> Optional[FlowHooks]
+        """Observers registry of the flow."""
+        return self._hooks
+
+    def use_hooks(self, hooks):
+        # type: (Optional[FlowHooks]) -> None
+        """Sets the observers registry, the registry can be shared
+        between flows (e.g. to collect events into one buffer)."""
+        self._hooks = hooks
+        self._update_transfer()
+
+    def _update_transfer(self):
+        # type: () -> None
+        if self._hooks is None and self._waiters is None:
+            self.__dict__.pop('_observed', None)
+        else:
+            self._observed = True
+
+    def add_hook(self, event, callback):
+        # type: (str, Callable) -> None
+        """Registers the observer of the flow transfers.
+
+        :param event: One of the `FlowHooks.EVENTS`
+        :param callback: Observer
+        """
+        if self._hooks is None:
+            self.use_hooks(FlowHooks())
+        self._hooks.add(event, callback)
+
+    def remove_hook(self, event, callback):
+        # type: (str, Callable) -> None
+        """Unregisters the observer of the flow transfers."""
+        self._hooks.remove(event, callback)
+        if not self._hooks:
+            self.use_hooks(None)
+
+    def wait_for(self, value, timeout=None):
+        # type: (Union[Value, Callable[[Value], bool]], Optional[float]) -> Awaitable[Value]
+        """Waits until the flow is transferred to the value.
+
+        Usage: `value = await flow.wait_for(Status.DONE, timeout=10)`
+
+        Callable is used as a predicate of the value. Returned awaitable
+        is resolved at once if the flow value matches already, otherwise
+        by the transfer, so transfers should be done in the event loop
+        thread. Transfer wakes only the waiters of its value, predicate
+        waiters are checked on every transfer of the flow.
+
+        :param value: Expected value or predicate
+        :param timeout: Seconds to wait, `asyncio.TimeoutError` on timeout
+        :return: Awaitable of the flow value
+        """
+        import asyncio
+
+        future = asyncio.get_event_loop().create_future()
+        predicate = value if callable(value) else None
+
+        if predicate is None:
+            is_reached = self._value == value
+        else:
+            is_reached = predicate(self._value)
+
+        if is_reached:
+            future.set_result(self._value)
+        else:
+            if self._waiters is None:
+                self._waiters = _Waiters()
+                self._update_transfer()
+
+            if predicate is None:
+                self._waiters.add_value(value, future)
+                future.add_done_callback(
+                    lambda f: self._discard_waiter(value, f))
+            else:
+                self._waiters.predicates.append((predicate, future))
+                future.add_done_callback(
+                    lambda f: self._discard_waiter(predicate, f))
+
+        if timeout is None:
+            return future
+        return asyncio.wait_for(future, timeout)
+
+    def _discard_waiter(self, value, future):
+        # type: (Union[Value, Callable[[Value], bool]], Future) -> None
+        if self._waiters is None:
+            return
+        if future.cancelled():
+            if callable(value):
+                self._waiters.discard_predicate(future)
+            else:
+                self._waiters.discard_value(value, future)
+        if not self._waiters:
+            self._waiters = None
+            self._update_transfer()
+
+    def _wake_waiters(self, value):
+        # type: (Value) -> None
+        self._waiters.wake(value)
+        if not self._waiters:
+            self._waiters = None
+            self._update_transfer()
+
+    @classmethod
+    def add_class_hook(cls, event, callback):
+        # type: (str, Callable) -> None
+        """Registers the observer of all the class (and subclasses) flows.
+
+        :param event: One of the `FlowHooks.EVENTS`
+        :param callback: Observer
+        """
+        hooks = cls.__dict__.get('_class_hooks')
+        if hooks is None:
+            hooks = FlowHooks()
+            cls._class_hooks = hooks
+        hooks.add(event, callback)
+        cls._observed = True
+
+    @classmethod
+    def remove_class_hook(cls, event, callback):
+        # type: (str, Callable) -> None
+        """Unregisters the observer of all the class flows."""
+        hooks = cls.__dict__['_class_hooks']
+        hooks.remove(event, callback)
+        if not hooks:
+            del cls._class_hooks
+            if cls is FlowBase:
+                cls._observed = False
+            else:
+                del cls._observed
@@ -0,0 +1,209 @@
+import contextlib
+import heapq
+import itertools
+import weakref
+
+from flow.bases import FlowBase
+from flow.bases import FlowHooks
+from flow.exceptions import TransferError
+
+try:
+    from typing import TYPE_CHECKING
+except ImportError:
+    TYPE_CHECKING = False
+
+if TYPE_CHECKING:
+    from typing import Callable
+    from typing import Dict
+    from typing import Iterable
+    from typing import Iterator
+    from typing import List
+    from typing import Optional
+    from typing import Set
+    from typing import Tuple
+
+    from flow.bases import RuleBase
+    from flow.bases import Value
+
+
+class Propagator(object):
+    """Recomputes derived flows after the changes of their sources.
+
+    Derived flows are recomputed in the order of their rank (depth in
+    the dependency graph), so every flow is recomputed once, after all
+    its changed sources, and never sees inconsistent sources.
+
+    Flows are referenced weakly, derived flows, which are not used
+    anymore, are unfollowed when they are collected.
+    """
+    def __init__(self):
+        self._queue = []  # type: List[Tuple[int, int, DerivedFlow]]
+        self._queued = set()  # type: Set[int]
+        self._counter = itertools.count()  # type: Iterator[int]
+        self._batches = 0  # type: int
+        self._running = False  # type: bool
+        # Source flow and its derived flows by the id of the source flow
+        self._dependents = {}  # type: Dict[int, Tuple[weakref.ref, List[weakref.ref]]]
+
+    def follow(self, flow):
+        # type: (DerivedFlow) -> None
+        """Recomputes the flow after the changes of its sources."""
+        source_ids = [id(source) for source in flow.sources]
+        ref = weakref.ref(
+            flow, lambda ref: self._collected(ref, source_ids))
+        for source in flow.sources:
+            entry = self._dependents.get(id(source))
+            if entry is None:
+                entry = self._dependents[id(source)] = (
+                    weakref.ref(source), [])
+                source.add_hook(FlowHooks.POST_COMMIT, self._on_commit)
+            entry[1].append(ref)
+
+    def unfollow(self, flow):
+        # type: (DerivedFlow) -> None
+        """Stops recomputing the flow."""
+        for source in flow.sources:
+            self._remove(id(source), lambda ref: ref() is flow)
+
+    def _collected(self, ref, source_ids):
+        # type: (weakref.ref, List[int]) -> None
+        for source_id in source_ids:
+            self._remove(source_id, lambda item: item is ref)
+
+    def _remove(self, source_id, match):
+        # type: (int, Callable[[weakref.ref], bool]) -> None
+        """Removes the first matching derived flow of the source."""
+        entry = self._dependents.get(source_id)
+        if entry is None:
+            return
+
+        source_ref, dependents = entry
+        for index, ref in enumerate(dependents):
+            if match(ref):
+                del dependents[index]
+                break
+
+        if not dependents:
+            del self._dependents[source_id]
+            source = source_ref()
+            if source is not None:
+                source.remove_hook(FlowHooks.POST_COMMIT, self._on_commit)
+
+    def _on_commit(self, flow, input_value, output_value, error):
+        # type: (FlowBase, Value, Value, Optional[TransferError]) -> None
+        entry = self._dependents.get(id(flow))
+        if entry is not None:
+            for ref in entry[1]:
+                dependent = ref()
+                if dependent is not None:
+                    self.schedule(dependent, run=False)
+
+        if not self._batches:
+            self.run()
+
+    def schedule(self, flow, run=True):
+        # type: (DerivedFlow, bool) -> None
+        """Schedules recomputation of the flow."""
+        if id(flow) not in self._queued:
+            self._queued.add(id(flow))
+            heapq.heappush(
+                self._queue, (flow.rank, next(self._counter), flow))
+
+        if run and not self._batches:
+            self.run()
+
+    @contextlib.contextmanager
+    def batch(self):
+        # type: () -> Iterator[None]
+        """Delays recomputation until the end of the block,
+        so derived flows are recomputed once for all the changes."""
+        self._batches += 1
+        try:
+            yield
+        finally:
+            self._batches -= 1
+            if not self._batches:
+                self.run()
+
+    def run(self):
+        # type: () -> None
+        """Recomputes scheduled flows."""
+        if self._running:
+            return
+
+        self._running = True
+        try:
+            while self._queue:
+                _, _, flow = heapq.heappop(self._queue)
+                self._queued.discard(id(flow))
+                flow.recompute()
+        finally:
+            self._running = False
+
+
+_propagator = Propagator()  # type: Propagator
+
+
+def batch():
+    # type: () -> contextlib.AbstractContextManager
+    """Batch of the changes of the default propagator."""
+    return _propagator.batch()
+
+
+class DerivedFlow(FlowBase):
+    """Flow, which value is a function of the values of the source flows.
+
+    Value is recomputed when any source is changed, and transferred
+    as the usual value, so the transfer is validated by the rules of
+    the derived flow. Invalid transfer leaves the value unchanged,
+    the error is kept in the `error` attribute.
+
+    Derived flows can be sources of other derived flows. Propagator
+    references the flow weakly, so the flow stops following its
+    sources once it is collected.
+    """
+    def __init__(self, rule, sources, function, context=None,
+                 propagator=None):
+        # type: (RuleBase, Iterable[FlowBase], Callable[..., Value], dict, Optional[Propagator]) -> None
+        """
+        :param rule: Values transfer rules
+        :param sources: Source flows
+        :param function: Value of the flow by the values of the sources
+        :param context: Initial context
+        :param propagator: Propagator of the changes, shared by default
+        """
+        self.sources = list(sources)  # type: List[FlowBase]
+        self.function = function  # type: Callable[..., Value]
+        self.propagator = propagator or _propagator  # type: Propagator
+        self.rank = 1 + max(
+            [getattr(source, 'rank', 0) for source in self.sources] or [0]
+        )  # type: int
+        self.error = None  # type: Optional[TransferError]
+
+        super(DerivedFlow, self).__init__(
+            rule, self._compute(), context)
+
+        self.propagator.follow(self)
+
+    def _compute(self):
+        # type: () -> Value
+        return self.function(*[source.value for source in self.sources])
+
+    def recompute(self):
+        # type: () -> None
+        """Transfers the flow to the value computed by the sources."""
+        value = self._compute()
+        if value == self._value:
+            return
+
+        try:
+            self.value = value
+        except TransferError as err:
+            self.error = err
+        else:
+            self.error = None
+
+    def close(self):
+        # type: () -> None
+        """Stops following the sources."""
+        self.propagator.unfollow(self)
@@ -1,7 +1,5 @@
-try:
-    from typing import TYPE_CHECKING
-except ImportError:
-    TYPE_CHECKING = False
+# typing is slow to import, type checkers treat the name as true
+TYPE_CHECKING = False
 
 if TYPE_CHECKING:
     from typing import Iterable
@@ -9,6 +7,7 @@ if TYPE_CHECKING:
     from typing import Optional
     from typing import Tuple
 
+    from flow.bases import FlowBase
     from flow.bases import RuleBase
     from flow.rules import RuleList
 
@@ -90,3 +89,37 @@ class RuleListTransferError(TransferError):
             operator=repr(rule.operator),
             inner_errors='\n'.join(inner_errors)
         )
+
+
+class SnapshotError(BaseFlowException):
+    """Snapshot file is malformed or incompatible."""
+    pass
+
+
+class SerializationError(BaseFlowException):
+    """Serialized rules data is malformed or incompatible."""
+    pass
+
+
+class EngineError(BaseFlowException):
+    """Worker of the sharded engine failed to process a request."""
+    pass
+
+
+class HistoryError(BaseFlowException):
+    """Nothing to undo or redo, or the history doesn't match the flow."""
+    pass
+
+
+class TransactionError(BaseFlowException):
+    """Some transfers of the transaction are invalid, nothing is changed."""
+    def __init__(self, errors):
+        # type: (List[Tuple[FlowBase, TransferError]]) -> None
+        """
+        :param errors: Failed flows with their transfer errors
+        """
+        self.errors = []  # type: List[Tuple[FlowBase, TransferError]]
+        self.errors.extend(errors)
+        super(TransactionError, self).__init__(
+            '%d invalid transfers, first: %s' % (
+                len(self.errors), self.errors[0][1]))
@@ -0,0 +1,257 @@
+"""Export of the rule trees to the sparse adjacency arrays."""
+from array import array
+
+from flow.bases import RuleBase
+from flow.hierarchy import Subtree
+from flow.operators import All
+from flow.operators import Any
+from flow.operators import First
+from flow.operators import Operator
+from flow.registry import ValueRegistry
+from flow.registry import _STRUCTURAL_RULES
+from flow.rules import RuleList
+
+try:
+    from typing import TYPE_CHECKING
+except ImportError:
+    TYPE_CHECKING = False
+
+if TYPE_CHECKING:
+    from typing import Collection
+    from typing import Iterable
+    from typing import Iterator
+    from typing import List
+    from typing import Optional
+    from typing import Set
+    from typing import Tuple
+
+    from flow.bases import Value
+
+    Pairs = Set[Tuple[Value, Value]]
+
+
+class TransitionGraph(object):
+    """Legal transfers of the rule as the sparse adjacency arrays.
+
+    Edges are kept in the COO format, `rows` and `cols` are ids of
+    the input and output values (see `ValueRegistry`), sorted by the
+    input and the output. Transfers, which depend on the non-static
+    rules, are kept apart as unknown edges.
+
+    Usage:
+        graph = TransitionGraph.from_rule(rule, domain=list(Status))
+        indptr, indices = graph.csr()
+        # e.g. scipy.sparse.csr_matrix((data, indices, indptr))
+    """
+    def __init__(self, registry, edges, unknown=(), unknown_rules=()):
+        # type: (ValueRegistry, Iterable[Tuple[int, int]], Iterable[Tuple[int, int]], Iterable[RuleBase]) -> None
+        """
+        :param registry: Registry of the values ids
+        :param edges: Legal transfers as (input id, output id)
+        :param unknown: Transfers, which depend on the non-static rules
+        :param unknown_rules: Non-static rules of the tree
+        """
+        self.registry = registry  # type: ValueRegistry
+        self.rows, self.cols = self._coo(edges)  # type: array, array
+        self.unknown_rows, self.unknown_cols = self._coo(
+            unknown)  # type: array, array
+        self.unknown_rules = list(unknown_rules)  # type: List[RuleBase]
+
+    @staticmethod
+    def _coo(edges):
+        # type: (Iterable[Tuple[int, int]]) -> Tuple[array, array]
+        rows = array('q')
+        cols = array('q')
+        for row, col in sorted(edges):
+            rows.append(row)
+            cols.append(col)
+        return rows, cols
+
+    @property
+    def values(self):
+        # type: () -> List[Value]
+        """Values in the order of their ids."""
+        return self.registry.values
+
+    def __len__(self):
+        return len(self.rows)
+
+    def edges(self, unknown=False):
+        # type: (bool) -> Iterator[Tuple[Value, Value]]
+        """Legal (or unknown) transfers as (input, output) values."""
+        rows, cols = (
+            (self.unknown_rows, self.unknown_cols) if unknown
+            else (self.rows, self.cols))
+        values = self.registry.values
+        for row, col in zip(rows, cols):
+            yield values[row], values[col]
+
+    def csr(self, unknown=False):
+        # type: (bool) -> Tuple[array, array]
+        """Legal (or unknown) transfers in the CSR format.
+
+        :return: (indptr of `len(values) + 1` items, indices)
+        """
+        rows, cols = (
+            (self.unknown_rows, self.unknown_cols) if unknown
+            else (self.rows, self.cols))
+        indptr = array('q', [0]) * (len(self.registry) + 1)
+        for row in rows:
+            indptr[row + 1] += 1
+        for row in range(len(self.registry)):
+            indptr[row + 1] += indptr[row]
+        return indptr, array('q', cols)
+
+    @classmethod
+    def from_rule(cls, rule, domain, registry=None):
+        # type: (RuleBase, Iterable[Value], Optional[ValueRegistry]) -> TransitionGraph
+        """Exports the rule tree without evaluating every pair of values.
+
+        Built-in rules give their edges directly, `ALL` inputs and outputs
+        are expanded to the domain. RuleLists combine edges of the nested
+        rules by their operators, only transfers allowed by some nested
+        rule are combined, so operators, which allow transfers without
+        valid rules (e.g. `AtLeast(0)`), are not supported. Other static
+        rules are evaluated for their inputs and outputs (subtrees are
+        expanded to the domain). Transfers of the non-static rules are
+        unknown.
+
+        :param rule: Rule tree
+        :param domain: Values of the `ALL` wildcards, ids are assigned
+            in the order, values of the rules not in the domain are
+            added after them
+        :param registry: Registry of the values ids
+        """
+        if registry is None:
+            registry = ValueRegistry()
+        exporter = _Exporter(domain, registry)
+        valid, unknown = exporter.export(rule)
+
+        intern = registry.intern
+        return cls(
+            registry,
+            ((intern(input_value), intern(output_value))
+             for input_value, output_value in valid),
+            ((intern(input_value), intern(output_value))
+             for input_value, output_value in unknown),
+            exporter.unknown_rules)
+
+
+class _Exporter(object):
+    """Collects legal and unknown transfers of the rule tree."""
+    def __init__(self, domain, registry):
+        # type: (Iterable[Value], ValueRegistry) -> None
+        self.domain = [registry.values[registry.intern(value)]
+                       for value in domain]  # type: List[Value]
+        self.unknown_rules = []  # type: List[RuleBase]
+
+    def _expand(self, values):
+        # type: (Collection[Value]) -> Collection[Value]
+        if RuleBase.ALL in values or any(
+                isinstance(value, Subtree) for value in values):
+            return self.domain
+        return values
+
+    def _pairs(self, rule):
+        # type: (RuleBase) -> Iterator[Tuple[Value, Value]]
+        outputs = self._expand(rule.outputs)
+        for input_value in self._expand(rule.inputs):
+            for output_value in outputs:
+                yield input_value, output_value
+
+    def export(self, rule):
+        # type: (RuleBase) -> Tuple[Pairs, Pairs]
+        """(Legal transfers, Unknown transfers) of the rule."""
+        if type(rule) is RuleList:
+            return self._export_list(rule)
+
+        if type(rule) in _STRUCTURAL_RULES:
+            return set(self._pairs(rule)), set()
+
+        if rule.static:
+            return {
+                pair for pair in self._pairs(rule)
+                if rule.is_valid(*pair)[0]
+            }, set()
+
+        self._add_unknown(rule)
+        return set(), set(self._pairs(rule))
+
+    def _add_unknown(self, rule):
+        # type: (RuleBase) -> None
+        if not any(known is rule for known in self.unknown_rules):
+            self.unknown_rules.append(rule)
+
+    def _export_list(self, rule_list):
+        # type: (RuleList) -> Tuple[Pairs, Pairs]
+        # Results of the nested rules, which are not decided by the match:
+        # built-in rules are valid and non-static rules are unknown
+        # for all the matched transfers
+        results = {}  # type: dict
+        candidates = set()  # type: Pairs
+        for rule in rule_list.rules:
+            if rule in results:
+                continue
+
+            if type(rule) in _STRUCTURAL_RULES:
+                results[rule] = True
+            elif rule.static or type(rule) is RuleList:
+                results[rule] = self.export(rule)
+            else:
+                self._add_unknown(rule)
+                results[rule] = None
+
+            # Guards don't allow transfers by themselves
+            if rule.guard:
+                continue
+            if isinstance(results[rule], tuple):
+                candidates.update(*results[rule])
+            else:
+                candidates.update(self._pairs(rule))
+
+        # Transfers allowed by any of the built-in rules are valid
+        operator = rule_list.operator
+        if (operator in (all, any) or isinstance(
+                operator, (All, Any, First))) and all(
+                result is True for result in results.values()):
+            return candidates, set()
+
+        valid = set()  # type: Pairs
+        unknown = set()  # type: Pairs
+        for pair in candidates:
+            rules = rule_list._find_rules(*pair)
+            if not rules or rule_list._has_guards and all(
+                    rule.guard for rule in rules):
+                continue
+
+            rules = sorted(rules, key=rule_list._positions.__getitem__)
+            verdicts = [self._verdict(results[rule], pair) for rule in rules]
+            # Unknown results decide if the extremes differ
+            optimistic = self._combine(rule_list, rules, [
+                True if verdict is None else verdict
+                for verdict in verdicts])
+            if None in verdicts and optimistic != self._combine(
+                    rule_list, rules, [bool(verdict) for verdict in verdicts]):
+                unknown.add(pair)
+            elif optimistic:
+                valid.add(pair)
+
+        return valid, unknown
+
+    @staticmethod
+    def _verdict(result, pair):
+        # type: (object, Tuple[Value, Value]) -> Optional[bool]
+        if not isinstance(result, tuple):
+            return result
+        if pair in result[0]:
+            return True
+        if pair in result[1]:
+            return None
+        return False
+
+    @staticmethod
+    def _combine(rule_list, rules, verdicts):
+        # type: (RuleList, List[RuleBase], List[bool]) -> bool
+        if isinstance(rule_list.operator, Operator):
+            return rule_list.operator.combine(rules, iter(verdicts))
+        return bool(rule_list.operator(iter(verdicts)))
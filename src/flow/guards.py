@@ -0,0 +1,370 @@
+import operator
+from collections import Counter
+
+from flow.bases import RuleBase
+from flow.bases import TrackedContext
+from flow.exceptions import RuleListTransferError
+from flow.exceptions import TransferError
+from flow.operators import All
+from flow.rules import RuleList
+
+try:
+    from typing import TYPE_CHECKING
+except ImportError:
+    TYPE_CHECKING = False
+
+if TYPE_CHECKING:
+    from typing import Any
+    from typing import Callable
+    from typing import Collection
+    from typing import Dict
+    from typing import FrozenSet
+    from typing import Hashable
+    from typing import Iterable
+    from typing import Iterator
+    from typing import List
+    from typing import Optional
+    from typing import Sequence
+    from typing import Set
+    from typing import Tuple
+
+    from flow.bases import TransferContext
+    from flow.bases import Value
+
+# Value of the missing context key
+_MISSING = object()
+
+
+def _contains(value, operand):
+    # type: (Any, Collection) -> bool
+    return value in operand
+
+
+class Predicate(object):
+    """Comparison of the context value with the operand,
+    false if the context key is missing."""
+    OPERATORS = {
+        '==': operator.eq,
+        '!=': operator.ne,
+        '<': operator.lt,
+        '<=': operator.le,
+        '>': operator.gt,
+        '>=': operator.ge,
+        'in': _contains,
+    }  # type: Dict[str, Callable[[Any, Any], bool]]
+
+    def __init__(self, key, op, operand):
+        # type: (Hashable, str, Any) -> None
+        """
+        :param key: Context key
+        :param op: One of the `OPERATORS`
+        :param operand: Right operand of the comparison
+        """
+        if op == 'in':
+            operand = frozenset(operand)
+        self.key = key  # type: Hashable
+        self.op = op  # type: str
+        self.operand = operand  # type: Any
+        self._compare = self.OPERATORS[op]  # type: Callable[[Any, Any], bool]
+
+    @property
+    def values(self):
+        # type: () -> Optional[FrozenSet]
+        """Accepted values of the equality predicates, None for others."""
+        if self.op == '==':
+            return frozenset((self.operand,))
+        if self.op == 'in':
+            return self.operand
+        return None
+
+    def __call__(self, context):
+        # type: (TransferContext) -> bool
+        value = context.get(self.key, _MISSING)
+        if value is _MISSING:
+            return False
+        return self._compare(value, self.operand)
+
+    def __repr__(self):
+        return 'context[%s] %s %s' % (
+            repr(self.key), self.op, repr(self.operand))
+
+
+class Key(object):
+    """Context key, comparisons with it build predicates.
+
+    Usage: `GuardRule([Key('role').isin({'admin'}), Key('amount') < 100])`
+    """
+    __hash__ = None  # type: ignore
+
+    def __init__(self, key):
+        # type: (Hashable) -> None
+        self.key = key  # type: Hashable
+
+    def __eq__(self, operand):
+        return Predicate(self.key, '==', operand)
+
+    def __ne__(self, operand):
+        return Predicate(self.key, '!=', operand)
+
+    def __lt__(self, operand):
+        return Predicate(self.key, '<', operand)
+
+    def __le__(self, operand):
+        return Predicate(self.key, '<=', operand)
+
+    def __gt__(self, operand):
+        return Predicate(self.key, '>', operand)
+
+    def __ge__(self, operand):
+        return Predicate(self.key, '>=', operand)
+
+    def isin(self, values):
+        # type: (Iterable) -> Predicate
+        return Predicate(self.key, 'in', values)
+
+
+class GuardRule(RuleBase):
+    """The guard Rule, which is valid if all the predicates
+    of the context are true."""
+    guard = True
+
+    def __init__(self, predicates, inputs=None, outputs=None):
+        # type: (Iterable[Predicate], Optional[Collection[Value]], Optional[Collection[Value]]) -> None
+        """
+        :param predicates: Predicates of the context
+        :param inputs: Restricted inputs, all by default
+        :param outputs: Restricted outputs, all by default
+        """
+        self.predicates = list(predicates)  # type: List[Predicate]
+        self.input_values = inputs  # type: Optional[Collection[Value]]
+        self.output_values = outputs  # type: Optional[Collection[Value]]
+
+        # Accepted values by the context key
+        self.discriminators = {}  # type: Dict[Hashable, FrozenSet]
+        for predicate in self.predicates:
+            values = predicate.values
+            if values is not None:
+                known = self.discriminators.get(predicate.key)
+                self.discriminators[predicate.key] = (
+                    values if known is None else known & values)
+
+    @property
+    def inputs(self):
+        # type: () -> Set[Value]
+        if self.input_values is None:
+            return {self.ALL}
+        return set(self.input_values)
+
+    @property
+    def outputs(self):
+        # type: () -> Set[Value]
+        if self.output_values is None:
+            return {self.ALL}
+        return set(self.output_values)
+
+    def is_valid(self, input_value, output_value, context=None):
+        # type: (Value, Value, Optional[TransferContext]) -> Tuple[bool, Optional[TransferError]]
+        context = context if context is not None else {}
+        for predicate in self.predicates:
+            if not predicate(context):
+                return False, TransferError(self, '%s is false' % predicate)
+        return True, None
+
+
+class _Node(object):
+    """Decision tree node, splits guards by the context value."""
+    def __init__(self, key, branches, default):
+        # type: (Hashable, Dict[Any, Any], Any) -> None
+        self.key = key  # type: Hashable
+        self.branches = branches  # type: Dict[Any, Any]
+        self.default = default  # type: Any
+
+
+class _Leaf(object):
+    """Guards, which can pass for the context."""
+    def __init__(self, candidates):
+        # type: (List[GuardRule]) -> None
+        self.candidates = candidates  # type: List[GuardRule]
+        self.candidate_set = frozenset(candidates)  # type: FrozenSet[GuardRule]
+        # Guards, which can't pass, computed on demand
+        self.failing = None  # type: Optional[FrozenSet[GuardRule]]
+        self.first_failing = None  # type: Optional[GuardRule]
+
+
+def _build_tree(guards, keys):
+    # type: (List[GuardRule], Sequence[Hashable]) -> Any
+    """Decision tree of the guards by the context values."""
+    if not keys:
+        return _Leaf(guards)
+
+    key = keys[0]
+    default = [guard for guard in guards if key not in guard.discriminators]
+    values = set()  # type: Set
+    for guard in guards:
+        values.update(guard.discriminators.get(key, ()))
+
+    branches = {
+        value: _build_tree([
+            guard for guard in guards
+            if value in guard.discriminators.get(key, (value,))
+        ], keys[1:])
+        for value in values
+    }
+    return _Node(key, branches, _build_tree(default, keys[1:]))
+
+
+class GuardList(RuleList):
+    """RuleList, which compiles its guards into the decision tree.
+
+    Guards of all the transfers (without restricted inputs and outputs)
+    are split by the values of the discriminating context keys (keys of
+    the `==` and `in` predicates), so guards, which can't pass for the
+    context (e.g. guards of the other roles), are not evaluated at all.
+    With the `all` operator any of them rejects the transfer at once.
+    """
+    def __init__(self, rules, operator=all, depth=2):
+        # type: (Iterable[RuleBase], Callable[[Iterable[object]], bool], int) -> None
+        """
+        :param rules: List of rules
+        :param operator: Combine operator
+        :param depth: Maximal number of the discriminating keys
+        """
+        super(GuardList, self).__init__(rules, operator)
+        self.depth = depth  # type: int
+
+        guards = [
+            rule for rule in self.rules if isinstance(rule, GuardRule) and
+            rule.input_values is None and rule.output_values is None
+        ]
+        self._guards = guards  # type: List[GuardRule]
+        # Guards are found by the tree instead of the maps
+        for rules_map in (self._input_map, self._output_map):
+            wildcards = rules_map.get(self.ALL)
+            if wildcards:
+                rules_map[self.ALL] = [
+                    rule for rule in wildcards if rule not in guards]
+
+        counts = Counter(
+            key for guard in guards for key in guard.discriminators)
+        self.keys = [
+            key for key, _ in counts.most_common(depth)
+        ]  # type: List[Hashable]
+        self._tree = _build_tree(guards, self.keys)
+        self._all = operator is all or isinstance(operator, All)  # type: bool
+
+    def _get_key(self):
+        # type: () -> Optional[tuple]
+        key = super(GuardList, self)._get_key()
+        if key is None:
+            return None
+        return key + (self.depth,)
+
+    def _rebuild(self, rules):
+        # type: (Iterable[RuleBase]) -> GuardList
+        return type(self)(rules, self.operator, self.depth)
+
+    def _leaf(self, context):
+        # type: (Optional[TransferContext]) -> _Leaf
+        context = context if context is not None else {}
+        node = self._tree
+        while isinstance(node, _Node):
+            try:
+                node = node.branches.get(
+                    context.get(node.key, _MISSING), node.default)
+            except TypeError:
+                # Unhashable value is none of the discriminating values
+                node = node.default
+        return node
+
+    def _failing(self, leaf):
+        # type: (_Leaf) -> FrozenSet[GuardRule]
+        if leaf.failing is None:
+            leaf.failing = frozenset(
+                guard for guard in self._guards
+                if guard not in leaf.candidate_set)
+        return leaf.failing
+
+    def _first_failing(self, leaf):
+        # type: (_Leaf) -> Optional[GuardRule]
+        if leaf.first_failing is None and (
+                len(leaf.candidates) < len(self._guards)):
+            leaf.first_failing = next(
+                guard for guard in self._guards
+                if guard not in leaf.candidate_set)
+        return leaf.first_failing
+
+    def failing_guards(self, context):
+        # type: (Optional[TransferContext]) -> FrozenSet[GuardRule]
+        """Guards, which can't pass for the context."""
+        return self._failing(self._leaf(context))
+
+    def _reject(self, guard):
+        # type: (GuardRule) -> Tuple[bool, TransferError]
+        return False, TransferError(guard, 'Rejected by %s' % ', '.join(
+            repr(predicate) for predicate in guard.predicates
+            if predicate.key in self.keys))
+
+    def is_valid(self, input_value, output_value, context=None):
+        # type: (Value, Value, Optional[TransferContext]) -> Tuple[bool, Optional[TransferError]]
+        rules = self._find_rules(input_value, output_value)
+        if not rules or self._has_guards and all(
+                rule.guard for rule in rules):
+            return super(GuardList, self).is_valid(
+                input_value, output_value, context)
+
+        leaf = self._leaf(context)
+        guard = self._first_failing(leaf)
+        if guard is not None:
+            if self._all:
+                return False, RuleListTransferError(
+                    self, [(guard, self._reject(guard))])
+            rules = set(rules) | self._failing(leaf)
+
+        rules = set(rules).union(leaf.candidates)
+        return self._combine(
+            sorted(rules, key=self._positions.__getitem__),
+            input_value, output_value, context)
+
+    def check(self, input_value, output_value, context=None):
+        # type: (Value, Value, Optional[TransferContext]) -> bool
+        if not self._all or isinstance(context, TrackedContext):
+            return self.is_valid(input_value, output_value, context)[0]
+
+        rules = self._find_rules(input_value, output_value)
+        if not rules or self._has_guards and all(
+                rule.guard for rule in rules):
+            return False
+
+        leaf = self._leaf(context)
+        if self._first_failing(leaf) is not None:
+            return False
+
+        rules = sorted(set(rules).union(leaf.candidates),
+                       key=self._positions.__getitem__)
+        return bool(self._apply_operator(rules, (
+            rule.check(input_value, output_value, context)
+            for rule in rules)))
+
+    def _explained_rules(self, input_value, output_value, context):
+        # type: (Value, Value, Optional[TransferContext]) -> List[RuleBase]
+        rules = self._find_rules(input_value, output_value)
+        if not rules:
+            return []
+        # All the guards are evaluated, not only the candidates
+        return sorted(set(rules).union(self._guards),
+                      key=self._positions.__getitem__)
+
+    def _evaluate(self, rules, input_value, output_value, context,
+                  validation_results):
+        # type: (List[RuleBase], Value, Value, Optional[TransferContext], list) -> Iterator[bool]
+        failing = self._failing(self._leaf(context))
+        tracked = isinstance(context, TrackedContext)
+        for rule in rules:
+            if rule in failing:
+                result = self._reject(rule)
+            elif tracked:
+                result = context.evaluate(rule, input_value, output_value)
+            else:
+                result = rule.is_valid(input_value, output_value, context)
+            validation_results.append((rule, result))
+            yield result[0]
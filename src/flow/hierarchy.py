@@ -0,0 +1,277 @@
+from flow.bases import RuleBase
+from flow.exceptions import TransferError
+from flow.rules import RuleList
+from flow.rules import _ValueRule
+
+try:
+    from typing import TYPE_CHECKING
+except ImportError:
+    TYPE_CHECKING = False
+
+if TYPE_CHECKING:
+    from typing import Callable
+    from typing import Collection
+    from typing import Dict
+    from typing import Iterable
+    from typing import List
+    from typing import Optional
+    from typing import Set
+    from typing import Tuple
+    from typing import Union
+
+    from flow.bases import TransferContext
+    from flow.bases import Value
+
+    Path = Union[str, Tuple]
+
+SEPARATOR = '.'  # type: str
+
+
+def split_path(value, separator=SEPARATOR):
+    # type: (Value, str) -> Optional[tuple]
+    """Segments of the hierarchical value, None for the other values.
+
+    Strings are split by the separator, tuples are paths already.
+    """
+    if isinstance(value, str):
+        return tuple(value.split(separator))
+    if isinstance(value, tuple):
+        return value
+    return None
+
+
+class Subtree(object):
+    """Rule input or output value, which matches the path and
+    all the values under it."""
+    def __init__(self, path):
+        # type: (Path) -> None
+        """
+        :param path: Root of the subtree, e.g. `order.open` or ('order', 'open')
+        """
+        self.path = path  # type: Path
+
+    def __eq__(self, other):
+        return isinstance(other, Subtree) and self.path == other.path
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((Subtree, self.path))
+
+    def __repr__(self):
+        return 'Subtree(%s)' % repr(self.path)
+
+
+class _SubtreeSet(object):
+    """Set of the values and subtrees with the O(depth) membership check."""
+    def __init__(self, values, separator):
+        # type: (Collection[Union[Value, Subtree]], str) -> None
+        self.separator = separator  # type: str
+        self.values = set()  # type: Set[Value]
+        self.subtrees = set()  # type: Set[tuple]
+        self.all = RuleBase.ALL in values  # type: bool
+
+        for value in values:
+            if isinstance(value, Subtree):
+                self.subtrees.add(split_path(value.path, separator))
+            elif value is not RuleBase.ALL:
+                self.values.add(value)
+
+    def __contains__(self, value):
+        # type: (Value) -> bool
+        if self.all or value in self.values:
+            return True
+
+        if self.subtrees:
+            path = split_path(value, self.separator)
+            if path is not None:
+                for depth in range(1, len(path) + 1):
+                    if path[:depth] in self.subtrees:
+                        return True
+
+        return False
+
+
+class SubtreeRule(_ValueRule):
+    """The Rule for the transfers between values and subtrees."""
+    _fields = ('input_values', 'output_values', 'separator')
+
+    def __init__(self, input_values, output_values, separator=SEPARATOR):
+        # type: (Collection[Union[Value, Subtree]], Collection[Union[Value, Subtree]], str) -> None
+        """
+        :param input_values: Allowed input values and subtrees
+        :param output_values: Allowed output values and subtrees
+        :param separator: Path separator of the string values
+        """
+        self.input_values = input_values  # type: Collection[Union[Value, Subtree]]
+        self.output_values = output_values  # type: Collection[Union[Value, Subtree]]
+        self.separator = separator  # type: str
+
+        self._input_set = _SubtreeSet(input_values, separator)  # type: _SubtreeSet
+        self._output_set = _SubtreeSet(output_values, separator)  # type: _SubtreeSet
+
+    @property
+    def inputs(self):
+        # type: () -> Set[Union[Value, Subtree]]
+        return set(self.input_values)
+
+    @property
+    def outputs(self):
+        # type: () -> Set[Union[Value, Subtree]]
+        return set(self.output_values)
+
+    def is_valid(self, input_value, output_value, context=None):
+        # type: (Value, Value, Optional[TransferContext]) -> Tuple[bool, Optional[TransferError]]
+        if input_value not in self._input_set:
+            return False, TransferError(self, '%s not in %s' % (
+                repr(input_value), repr(self.input_values)))
+
+        if output_value not in self._output_set:
+            return False, TransferError(self, '%s not in %s' % (
+                repr(output_value), repr(self.output_values)))
+
+        return True, None
+
+
+class _TrieNode(object):
+    def __init__(self):
+        self.children = {}  # type: Dict[object, _TrieNode]
+        # Rules for the subtree of the node
+        self.subtree_rules = []  # type: List[RuleBase]
+        # Rules for the value of the node only
+        self.value_rules = []  # type: List[RuleBase]
+
+
+class _Trie(object):
+    """Rules by the path segments of their inputs or outputs."""
+    def __init__(self, separator):
+        # type: (str) -> None
+        self.separator = separator  # type: str
+        self.root = _TrieNode()  # type: _TrieNode
+
+    def _node(self, path):
+        # type: (tuple) -> _TrieNode
+        node = self.root
+        for segment in path:
+            child = node.children.get(segment)
+            if child is None:
+                child = node.children[segment] = _TrieNode()
+            node = child
+        return node
+
+    def add(self, value, rules):
+        # type: (Union[Value, Subtree], List[RuleBase]) -> bool
+        """Adds rules of the value, False for not hierarchical values."""
+        if isinstance(value, Subtree):
+            path = split_path(value.path, self.separator)
+            self._node(path).subtree_rules.extend(rules)
+            return True
+
+        path = split_path(value, self.separator)
+        if path is None:
+            return False
+        self._node(path).value_rules.extend(rules)
+        return True
+
+    def match(self, value, matches):
+        # type: (Value, Dict[RuleBase, float]) -> bool
+        """Collects rules matching the value with their match depth.
+
+        Subtree of the depth N matches with depth N, the value of the
+        depth N matches with N + 0.5, so the value is more specific.
+
+        :return: False for not hierarchical values
+        """
+        path = split_path(value, self.separator)
+        if path is None:
+            return False
+
+        node = self.root
+        for depth, segment in enumerate(path, 1):
+            node = node.children.get(segment)
+            if node is None:
+                return True
+            for rule in node.subtree_rules:
+                matches[rule] = depth
+        for rule in node.value_rules:
+            matches[rule] = len(path) + 0.5
+        return True
+
+
+class HierarchicalRuleList(RuleList):
+    """RuleList for the hierarchical values, e.g. `order.open.pending`.
+
+    Rules can target subtrees with the `Subtree` inputs and outputs,
+    matching rules are found by the prefix tries, so the cost depends
+    on the depth of the value, not on the number of values.
+
+    With `most_specific` only rules with the deepest match are used,
+    value match is deeper than the subtree match, wildcard match is
+    the least specific.
+
+    Nested RuleLists with subtree rules should be hierarchical as well.
+    """
+    def __init__(self, rules, operator=all, separator=SEPARATOR,
+                 most_specific=False):
+        # type: (Iterable[RuleBase], Callable[[Iterable[object]], bool], str, bool) -> None
+        """
+        :param rules: List of rules
+        :param operator: Combine operator
+        :param separator: Path separator of the string values
+        :param most_specific: Use only the most specific rules
+        """
+        super(HierarchicalRuleList, self).__init__(rules, operator)
+        self.separator = separator  # type: str
+        self.most_specific = most_specific  # type: bool
+
+        self._input_trie = self._build_trie(self._input_map)  # type: _Trie
+        self._output_trie = self._build_trie(self._output_map)  # type: _Trie
+
+    def _get_key(self):
+        # type: () -> Optional[tuple]
+        key = super(HierarchicalRuleList, self)._get_key()
+        if key is None:
+            return None
+        return key + (self.separator, self.most_specific)
+
+    def _rebuild(self, rules):
+        # type: (Iterable[RuleBase]) -> HierarchicalRuleList
+        return type(self)(
+            rules, self.operator, self.separator, self.most_specific)
+
+    def _build_trie(self, rules_map):
+        # type: (Dict[Union[Value, Subtree], List[RuleBase]]) -> _Trie
+        trie = _Trie(self.separator)
+        for value, rules in rules_map.items():
+            trie.add(value, rules)
+        return trie
+
+    @staticmethod
+    def _match(value, trie, rules_map):
+        # type: (Value, _Trie, Dict[Value, List[RuleBase]]) -> Dict[RuleBase, float]
+        matches = dict.fromkeys(
+            rules_map.get(RuleBase.ALL, ()), 0)  # type: Dict[RuleBase, float]
+        if not trie.match(value, matches):
+            for rule in rules_map.get(value, ()):
+                matches[rule] = 1
+        return matches
+
+    def _find_rules(self, input_value, output_value):
+        # type: (Value, Value) -> Collection[RuleBase]
+        input_matches = self._match(
+            input_value, self._input_trie, self._input_map)
+        output_matches = self._match(
+            output_value, self._output_trie, self._output_map)
+
+        scores = {
+            rule: depth + output_matches[rule]
+            for rule, depth in input_matches.items()
+            if rule in output_matches
+        }
+
+        if self.most_specific and scores:
+            best = max(scores.values())
+            return {rule for rule, score in scores.items() if score == best}
+
+        return set(scores)
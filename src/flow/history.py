@@ -0,0 +1,250 @@
+from array import array
+
+from flow.bases import FlowHooks
+from flow.bases import StagedContext
+from flow.bases import _MISSING
+from flow.exceptions import HistoryError
+from flow.registry import ValueRegistry
+
+try:
+    from typing import TYPE_CHECKING
+except ImportError:
+    TYPE_CHECKING = False
+
+if TYPE_CHECKING:
+    from typing import Hashable
+    from typing import List
+    from typing import Optional
+    from typing import Tuple
+
+    from flow.bases import FlowBase
+    from flow.bases import Value
+    from flow.exceptions import TransferError
+
+    Delta = Tuple[Tuple[Hashable, object, object], ...]
+
+
+def _compact(journal):
+    # type: (List[Tuple[Hashable, object, object]]) -> Optional[Delta]
+    """Changed keys of the journal, None if nothing is changed.
+
+    Values are compared by identity and equality, changes inside
+    mutable values are not detected.
+    """
+    delta = tuple(
+        (key, old, new) for key, old, new in journal
+        if old is not new and old != new)
+    return delta or None
+
+
+def apply_delta(context, delta, reverse=False):
+    # type: (StagedContext, Optional[Delta], bool) -> None
+    """Applies the delta (or reverts it) to the context."""
+    for key, old, new in delta or ():
+        value = old if reverse else new
+        if value is _MISSING:
+            context.pop(key, None)
+        else:
+            context[key] = value
+
+
+class HistoryArena(object):
+    """Shared storage of the histories of many flows.
+
+    Every flow with the history takes a slot of `depth` entries on its
+    first transfer. Entries keep ids of the values (see `ValueRegistry`)
+    in flat arrays, and context deltas.
+    """
+    def __init__(self, depth=16, registry=None):
+        # type: (int, Optional[ValueRegistry]) -> None
+        """
+        :param depth: Number of the entries per flow
+        :param registry: Registry of the values ids
+        """
+        self.depth = depth  # type: int
+        if registry is None:
+            registry = ValueRegistry()
+        self.registry = registry  # type: ValueRegistry
+        self.inputs = array('q')  # type: array
+        self.outputs = array('q')  # type: array
+        self.deltas = []  # type: List[Optional[Delta]]
+        self._free = []  # type: List[int]
+
+    def __len__(self):
+        return len(self.deltas) // self.depth
+
+    def allocate(self):
+        # type: () -> int
+        """Takes a slot, returns the index of its first entry."""
+        if self._free:
+            return self._free.pop()
+
+        base = len(self.deltas)
+        empty = array('q', [-1]) * self.depth
+        self.inputs.extend(empty)
+        self.outputs.extend(empty)
+        self.deltas.extend([None] * self.depth)
+        return base
+
+    def release(self, base):
+        # type: (int) -> None
+        """Returns the slot to the arena."""
+        for index in range(base, base + self.depth):
+            self.deltas[index] = None
+        self._free.append(base)
+
+
+class History(object):
+    """Undo / redo history of the flow transfers.
+
+    Last `depth` transfers are kept in the ring buffer, new transfer
+    drops undone transfers. Undo and redo are validated by the flow
+    rules, unless `validate` is False, and committed as the usual
+    transfers, so observers, waiters and derived flows see them.
+
+    Context deltas are recorded by the journal of the flow (see
+    `FlowBase._journal`), so transfers don't copy the context, and
+    the context keeps its class.
+
+    Flows can share the `HistoryArena`, so the histories are kept in
+    a few large arrays instead of the buffers per flow.
+    """
+    def __init__(self, flow, depth=16, arena=None, validate=True):
+        # type: (FlowBase, int, Optional[HistoryArena], bool) -> None
+        """
+        :param flow: Flow to follow
+        :param depth: Number of the entries, ignored with the arena
+        :param arena: Shared storage of the histories
+        :param validate: Validate undo and redo by the flow rules
+        """
+        self.flow = flow  # type: FlowBase
+        if arena is None:
+            arena = HistoryArena(depth)
+        self.arena = arena  # type: HistoryArena
+        self.validate = validate  # type: bool
+
+        self._base = None  # type: Optional[int]
+        self._start = 0  # type: int
+        self._undo = 0  # type: int
+        self._redo = 0  # type: int
+        self._replaying = False  # type: bool
+
+        flow._journal = []
+        flow.add_hook(FlowHooks.POST_COMMIT, self._on_commit)
+
+    @property
+    def can_undo(self):
+        # type: () -> bool
+        return self._undo > 0
+
+    @property
+    def can_redo(self):
+        # type: () -> bool
+        return self._redo > 0
+
+    def __len__(self):
+        return self._undo
+
+    def _index(self, position):
+        # type: (int) -> int
+        return self._base + (self._start + position) % self.arena.depth
+
+    def _on_commit(self, flow, input_value, output_value, error):
+        # type: (FlowBase, Value, Value, Optional[TransferError]) -> None
+        # Steps of the transfer path after the first one keep
+        # empty deltas, the first step keeps changes of the path
+        journal = flow._journal
+        flow._journal = []
+        if not self._replaying:
+            self.record(input_value, output_value, _compact(journal))
+
+    def record(self, input_value, output_value, delta=None):
+        # type: (Value, Value, Optional[Delta]) -> None
+        """Adds the transfer to the history."""
+        arena = self.arena
+        if self._base is None:
+            self._base = arena.allocate()
+
+        self._redo = 0
+        if self._undo == arena.depth:
+            self._start = (self._start + 1) % arena.depth
+        else:
+            self._undo += 1
+
+        index = self._index(self._undo - 1)
+        arena.inputs[index] = arena.registry.intern(input_value)
+        arena.outputs[index] = arena.registry.intern(output_value)
+        arena.deltas[index] = delta
+
+    def _replay(self, from_id, to_id, delta, reverse, validate):
+        # type: (int, int, Optional[Delta], bool, Optional[bool]) -> None
+        flow = self.flow
+        registry = self.arena.registry
+        if flow.value != registry.value(from_id):
+            raise HistoryError('Flow value %s does not match the history' % (
+                repr(flow.value)))
+
+        value = registry.value(to_id)
+        if validate is None:
+            validate = self.validate
+
+        context = StagedContext(flow.context)
+        apply_delta(context, delta, reverse)
+        if validate:
+            # Context changes of the rules are discarded,
+            # the context is restored by the delta
+            _, _, err = flow._validate_path([value], StagedContext(context))
+            if err is not None:
+                raise err
+
+        self._replaying = True
+        try:
+            flow._commit_path([value], context)
+        finally:
+            self._replaying = False
+
+    def undo(self, validate=None):
+        # type: (Optional[bool]) -> None
+        """Reverts the last transfer.
+
+        :param validate: Overrides validation by the flow rules
+        :raise HistoryError: Nothing to undo
+        :raise TransferError: Reverse transfer is invalid
+        """
+        if not self._undo:
+            raise HistoryError('Nothing to undo')
+
+        index = self._index(self._undo - 1)
+        arena = self.arena
+        self._replay(arena.outputs[index], arena.inputs[index],
+                     arena.deltas[index], True, validate)
+        self._undo -= 1
+        self._redo += 1
+
+    def redo(self, validate=None):
+        # type: (Optional[bool]) -> None
+        """Repeats the last undone transfer.
+
+        :param validate: Overrides validation by the flow rules
+        :raise HistoryError: Nothing to redo
+        :raise TransferError: Transfer is invalid
+        """
+        if not self._redo:
+            raise HistoryError('Nothing to redo')
+
+        index = self._index(self._undo)
+        arena = self.arena
+        self._replay(arena.inputs[index], arena.outputs[index],
+                     arena.deltas[index], False, validate)
+        self._undo += 1
+        self._redo -= 1
+
+    def close(self):
+        # type: () -> None
+        """Stops following the flow and releases the slot."""
+        self.flow.remove_hook(FlowHooks.POST_COMMIT, self._on_commit)
+        self.flow.__dict__.pop('_journal', None)
+        if self._base is not None:
+            self.arena.release(self._base)
+            self._base = None
+        self._start = self._undo = self._redo = 0
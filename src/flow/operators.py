@@ -0,0 +1,126 @@
+# typing is slow to import, type checkers treat the name as true
+TYPE_CHECKING = False
+
+if TYPE_CHECKING:
+    from typing import Dict
+    from typing import Iterable
+    from typing import Iterator
+    from typing import Optional
+    from typing import Sequence
+
+    from flow.bases import RuleBase
+
+
+class Operator(object):
+    """RuleList combine operator, which knows when the result is decided.
+
+    RuleList evaluates rules lazily, in the list order, rules after
+    the decided result are not evaluated at all.
+    """
+    def __call__(self, results):
+        # type: (Iterable[bool]) -> bool
+        """Combines results as a plain operator (e.g. `all`)."""
+        results = list(results)
+        return self.combine([None] * len(results), iter(results))
+
+    def combine(self, rules, results):
+        # type: (Sequence[Optional[RuleBase]], Iterator[bool]) -> bool
+        """Combines results of the rules.
+
+        :param rules: Matched rules, in the evaluation order
+        :param results: Lazy results of the rules, in the same order
+        """
+        raise NotImplementedError
+
+    def __repr__(self):
+        return '%s()' % type(self).__name__
+
+
+class All(Operator):
+    """Valid if all the rules are valid."""
+    def combine(self, rules, results):
+        # type: (Sequence[Optional[RuleBase]], Iterator[bool]) -> bool
+        for is_valid in results:
+            if not is_valid:
+                return False
+        return True
+
+
+class Any(Operator):
+    """Valid if any of the rules is valid."""
+    def combine(self, rules, results):
+        # type: (Sequence[Optional[RuleBase]], Iterator[bool]) -> bool
+        for is_valid in results:
+            if is_valid:
+                return True
+        return False
+
+
+class AtLeast(Operator):
+    """Valid if at least `count` of the rules are valid."""
+    def __init__(self, count):
+        # type: (int) -> None
+        """
+        :param count: Quorum size
+        """
+        self.count = count  # type: int
+
+    def combine(self, rules, results):
+        # type: (Sequence[Optional[RuleBase]], Iterator[bool]) -> bool
+        passed = 0
+        remaining = len(rules)
+
+        for is_valid in results:
+            remaining -= 1
+            if is_valid:
+                passed += 1
+                if passed >= self.count:
+                    return True
+            elif passed + remaining < self.count:
+                return False
+
+        return passed >= self.count
+
+    def __repr__(self):
+        return 'AtLeast(%d)' % self.count
+
+
+class Weighted(Operator):
+    """Valid if the total weight of the valid rules reaches the threshold."""
+    def __init__(self, weights, threshold, default=1.0):
+        # type: (Dict[RuleBase, float], float, float) -> None
+        """
+        :param weights: Not negative weights of the rules
+        :param threshold: Minimal total weight
+        :param default: Weight of the rules missing in the weights
+        """
+        self.weights = weights  # type: Dict[RuleBase, float]
+        self.threshold = threshold  # type: float
+        self.default = default  # type: float
+
+    def combine(self, rules, results):
+        # type: (Sequence[Optional[RuleBase]], Iterator[bool]) -> bool
+        weights = [self.weights.get(rule, self.default) for rule in rules]
+        remaining = sum(weights)
+        score = 0.0
+
+        for weight, is_valid in zip(weights, results):
+            remaining -= weight
+            if is_valid:
+                score += weight
+                if score >= self.threshold:
+                    return True
+            elif score + remaining < self.threshold:
+                return False
+
+        return score >= self.threshold
+
+    def __repr__(self):
+        return 'Weighted(threshold=%s)' % self.threshold
+
+
+class First(Operator):
+    """Priority operator, the first matched rule decides."""
+    def combine(self, rules, results):
+        # type: (Sequence[Optional[RuleBase]], Iterator[bool]) -> bool
+        return next(results, False)
@@ -0,0 +1,169 @@
+from flow.bases import FlowBase
+from flow.bases import RuleBase
+from flow.exceptions import TransferError
+
+try:
+    from typing import TYPE_CHECKING
+except ImportError:
+    TYPE_CHECKING = False
+
+if TYPE_CHECKING:
+    from typing import Dict
+    from typing import Iterable
+    from typing import List
+    from typing import Optional
+    from typing import Sequence
+    from typing import Set
+    from typing import Tuple
+    from typing import Union
+
+    from flow.bases import StagedContext
+    from flow.bases import TransferContext
+    from flow.bases import Value
+
+
+class ProductRule(RuleBase):
+    """The Rule for the composite values, one rule per component.
+
+    Only changed components are validated by their rules, the constraint
+    rule validates the whole (input tuple, output tuple) transfer.
+    All the rules share the transfer context.
+
+    Flows sharing the rule share equal composite values as well.
+    """
+    def __init__(self, rules, constraint=None, names=None):
+        # type: (Iterable[RuleBase], Optional[RuleBase], Optional[Sequence[str]]) -> None
+        """
+        :param rules: Rules of the components
+        :param constraint: Cross-component rule
+        :param names: Names of the components
+        """
+        self.rules = []  # type: List[RuleBase]
+        self.rules.extend(rules)
+        self.constraint = constraint  # type: Optional[RuleBase]
+        self.names = tuple(names or ())  # type: Tuple[str, ...]
+        self.cacheable = all(
+            rule.cacheable for rule in self.rules) and (
+            constraint is None or constraint.cacheable)  # type: bool
+        self.static = all(
+            rule.static for rule in self.rules) and (
+            constraint is None or constraint.static)  # type: bool
+
+        # Equal composite values share one tuple
+        self._states = {}  # type: Dict[tuple, tuple]
+
+    @property
+    def inputs(self):
+        # type: () -> Set[Value]
+        return {self.ALL}
+
+    @property
+    def outputs(self):
+        # type: () -> Set[Value]
+        return {self.ALL}
+
+    def intern(self, value):
+        # type: (Sequence[Value]) -> tuple
+        """Returns the shared tuple equal to the composite value."""
+        value = tuple(value)
+        return self._states.setdefault(value, value)
+
+    def is_valid(self, input_value, output_value, context=None):
+        # type: (tuple, tuple, Optional[TransferContext]) -> Tuple[bool, Optional[TransferError]]
+        if len(output_value) != len(self.rules):
+            return False, TransferError(
+                self, 'Expected %d components, got %d' % (
+                    len(self.rules), len(output_value)))
+
+        for index, rule in enumerate(self.rules):
+            component_input = input_value[index]
+            component_output = output_value[index]
+
+            if component_input is component_output or (
+                    component_input == component_output):
+                continue
+
+            is_valid, err = rule.is_valid(
+                component_input, component_output, context)
+            if not is_valid:
+                return False, TransferError(
+                    self, 'Component %d: %s' % (index, err))
+
+        if self.constraint is not None:
+            is_valid, err = self.constraint.is_valid(
+                input_value, output_value, context)
+            if not is_valid:
+                return False, TransferError(self, 'Constraint: %s' % err)
+
+        return True, None
+
+    def check(self, input_value, output_value, context=None):
+        # type: (tuple, tuple, Optional[TransferContext]) -> bool
+        if len(output_value) != len(self.rules):
+            return False
+
+        for index, rule in enumerate(self.rules):
+            component_input = input_value[index]
+            component_output = output_value[index]
+            if component_input is component_output or (
+                    component_input == component_output):
+                continue
+            if not rule.check(component_input, component_output, context):
+                return False
+
+        return self.constraint is None or self.constraint.check(
+            input_value, output_value, context)
+
+
+class ProductFlow(FlowBase):
+    """Flow of the composite values with orthogonal components."""
+    def __init__(self, rule, init, context=None):
+        # type: (ProductRule, Sequence[Value], dict) -> None
+        """
+        :param rule: Composite values transfer rules
+        :param init: Initial components values
+        :param context: Initial context
+        """
+        super(ProductFlow, self).__init__(rule, rule.intern(init), context)
+        self._rule = rule  # type: ProductRule
+
+    @FlowBase.value.setter
+    def value(self, value):
+        # Values are interned once accepted, so the rule doesn't
+        # keep the rejected ones
+        self._transfer(tuple(value))
+        self._value = self._rule.intern(self._value)
+
+    def transfer_path(self, values):
+        # type: (Iterable[Sequence[Value]]) -> None
+        super(ProductFlow, self).transfer_path(
+            [tuple(value) for value in values])
+
+    def _apply_path(self, values, context):
+        # type: (List[tuple], StagedContext) -> None
+        super(ProductFlow, self)._apply_path(values, context)
+        self._value = self._rule.intern(self._value)
+
+    def _index(self, component):
+        # type: (Union[int, str]) -> int
+        if isinstance(component, str):
+            return self._rule.names.index(component)
+        return component
+
+    def get(self, component):
+        # type: (Union[int, str]) -> Value
+        """Value of the component, by index or name."""
+        return self._value[self._index(component)]
+
+    def update(self, changes=None, **named_changes):
+        # type: (Optional[Dict[Union[int, str], Value]], **Value) -> None
+        """Transfers the flow, changing the given components only.
+
+        :param changes: New values by the component index or name
+        :param named_changes: New values by the component name
+        """
+        value = list(self._value)
+        for component, component_value in dict(
+                changes or {}, **named_changes).items():
+            value[self._index(component)] = component_value
+        self.value = value
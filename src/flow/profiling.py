@@ -0,0 +1,208 @@
+import time
+
+from flow.bases import RuleBase
+from flow.tables import in_diagnostics
+
+try:
+    from typing import TYPE_CHECKING
+except ImportError:
+    TYPE_CHECKING = False
+
+if TYPE_CHECKING:
+    from typing import Callable
+    from typing import Dict
+    from typing import Iterator
+    from typing import List
+    from typing import Optional
+    from typing import Tuple
+
+
+def iter_rules(rule, path='rule'):
+    # type: (RuleBase, str) -> Iterator[Tuple[str, RuleBase]]
+    """Walks the rule tree depth first.
+
+    :param rule: Root rule
+    :param path: Path of the root rule
+    :return: (path, rule) pairs, nested rules are taken from `rules`
+    """
+    yield path, rule
+    for index, inner_rule in enumerate(getattr(rule, 'rules', ())):
+        for item in iter_rules(inner_rule, '%s.rules[%d]' % (path, index)):
+            yield item
+
+
+class RuleStats(object):
+    """Collected statistics of the single rule instance."""
+    def __init__(self, rule, path):
+        # type: (RuleBase, str) -> None
+        """
+        :param rule: Rule
+        :param path: Path of the rule in the tree
+        """
+        self.rule = rule  # type: RuleBase
+        self.path = path  # type: str
+        self.calls = 0  # type: int
+        self.passed = 0  # type: int
+        self.failed = 0  # type: int
+        self.total_time = 0.0  # type: float
+
+    def reset(self):
+        # type: () -> None
+        self.calls = self.passed = self.failed = 0
+        self.total_time = 0.0
+
+    def as_dict(self):
+        # type: () -> dict
+        return {
+            'path': self.path,
+            'rule': repr(self.rule),
+            'calls': self.calls,
+            'passed': self.passed,
+            'failed': self.failed,
+            'total_time': self.total_time,
+        }
+
+    def __repr__(self):
+        return '<RuleStats %s: calls=%d passed=%d failed=%d time=%.6f>' % (
+            self.path, self.calls, self.passed, self.failed, self.total_time)
+
+
+class RuleProfiler(object):
+    """Opt-in per rule instance instrumentation of the rule tree.
+
+    While enabled, `is_valid` and `check` of every rule in the tree are
+    shadowed by the counting wrappers on the instance, disabling removes
+    wrappers, so the rules run without any overhead.
+
+    Time is cumulative: time of the RuleList includes its inner rules.
+    """
+    SORT_KEYS = {
+        'time': lambda stats: stats.total_time,
+        'calls': lambda stats: stats.calls,
+        'passed': lambda stats: stats.passed,
+        'failed': lambda stats: stats.failed,
+    }  # type: Dict[str, Callable[[RuleStats], float]]
+
+    def __init__(self, rule, clock=time.perf_counter):
+        # type: (RuleBase, Callable[[], float]) -> None
+        """
+        :param rule: Root rule of the profiled tree
+        :param clock: Time source
+        """
+        self.rule = rule  # type: RuleBase
+        self.clock = clock  # type: Callable[[], float]
+        self._stats = {}  # type: Dict[int, RuleStats]
+        self.enabled = False  # type: bool
+
+        for path, inner_rule in iter_rules(rule):
+            # Shared rule instance is counted once, by its first path
+            if id(inner_rule) not in self._stats:
+                self._stats[id(inner_rule)] = RuleStats(inner_rule, path)
+
+    def _wrap(self, stats, name):
+        # type: (RuleStats, str) -> Callable
+        method = getattr(stats.rule, name)
+        clock = self.clock
+
+        def wrapper(input_value, output_value, context=None):
+            # Re-runs for the errors repeat the counted checks
+            if in_diagnostics():
+                return method(input_value, output_value, context)
+
+            stats.calls += 1
+            started = clock()
+            try:
+                result = method(input_value, output_value, context)
+            except BaseException:
+                stats.failed += 1
+                raise
+            finally:
+                stats.total_time += clock() - started
+
+            if result is True or result is not False and result[0]:
+                stats.passed += 1
+            else:
+                stats.failed += 1
+            return result
+
+        return wrapper
+
+    @staticmethod
+    def _methods(rule):
+        # type: (RuleBase) -> Tuple[str, ...]
+        # Default `check` calls `is_valid`, so it is not counted twice
+        if type(rule).check is RuleBase.check:
+            return 'is_valid',
+        return 'is_valid', 'check'
+
+    def enable(self):
+        # type: () -> None
+        """Installs the wrappers."""
+        if self.enabled:
+            return
+        for stats in self._stats.values():
+            for name in self._methods(stats.rule):
+                setattr(stats.rule, name, self._wrap(stats, name))
+        self.enabled = True
+
+    def disable(self):
+        # type: () -> None
+        """Removes the wrappers, collected statistics are kept."""
+        if not self.enabled:
+            return
+        for stats in self._stats.values():
+            for name in self._methods(stats.rule):
+                delattr(stats.rule, name)
+        self.enabled = False
+
+    def reset(self):
+        # type: () -> None
+        """Clears collected statistics."""
+        for stats in self._stats.values():
+            stats.reset()
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.disable()
+
+    def stats(self, sort='time'):
+        # type: (str) -> List[RuleStats]
+        """Statistics of every rule instance, in descending order.
+
+        :param sort: One of the `SORT_KEYS`
+        """
+        return sorted(
+            self._stats.values(), key=self.SORT_KEYS[sort], reverse=True)
+
+    def unused(self):
+        # type: () -> List[RuleStats]
+        """Statistics of the rules which were never called."""
+        return [stats for stats in self._stats.values() if not stats.calls]
+
+    def as_dict(self):
+        # type: () -> Dict[str, dict]
+        """Statistics keyed by the rule path."""
+        return {
+            stats.path: stats.as_dict() for stats in self._stats.values()}
+
+    def report(self, sort='time', limit=None):
+        # type: (str, Optional[int]) -> str
+        """Text table of the statistics.
+
+        :param sort: One of the `SORT_KEYS`
+        :param limit: Maximum number of rows
+        """
+        lines = ['%10s %10s %10s %12s %12s  %s' % (
+            'calls', 'passed', 'failed', 'total, ms', 'per call, us', 'rule')]
+
+        for stats in self.stats(sort)[:limit]:
+            per_call = stats.total_time / stats.calls if stats.calls else 0.0
+            lines.append('%10d %10d %10d %12.3f %12.3f  %s %s' % (
+                stats.calls, stats.passed, stats.failed,
+                stats.total_time * 1e3, per_call * 1e6,
+                stats.path, repr(stats.rule)))
+
+        return '\n'.join(lines)
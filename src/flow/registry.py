@@ -0,0 +1,240 @@
+import time
+
+from flow.bases import RuleBase
+from flow.bases import StagedContext
+from flow.hierarchy import Subtree
+from flow.operators import Weighted
+from flow.rules import AllToAllRule
+from flow.rules import AllToManyRule
+from flow.rules import AllToOneRule
+from flow.rules import ManyToAllRule
+from flow.rules import ManyToManyRule
+from flow.rules import ManyToOneRule
+from flow.rules import OneToAllRule
+from flow.rules import OneToManyRule
+from flow.rules import OneToOneRule
+from flow.rules import RuleList
+
+try:
+    from typing import TYPE_CHECKING
+except ImportError:
+    TYPE_CHECKING = False
+
+if TYPE_CHECKING:
+    from typing import Callable
+    from typing import Dict
+    from typing import Iterable
+    from typing import List
+    from typing import Optional
+    from typing import Set
+    from typing import Tuple
+
+    from flow.bases import Explanation
+    from flow.bases import TransferContext
+    from flow.bases import Value
+    from flow.exceptions import TransferError
+
+# Rules, which are rebuilt with the ids of their values
+_STRUCTURAL_RULES = (
+    OneToOneRule, OneToManyRule, ManyToOneRule, ManyToManyRule,
+    OneToAllRule, AllToOneRule, ManyToAllRule, AllToManyRule, AllToAllRule,
+)
+
+
+class ValueRegistry(object):
+    """Interns values to the dense integer ids.
+
+    Rule trees mapped by the registry work with the ids, so the rule
+    lookups and comparisons are done on the small ints instead of
+    the strings and tuples.
+    """
+    def __init__(self, values=()):
+        # type: (Iterable[Value]) -> None
+        """
+        :param values: Values to intern, ids are assigned in the order
+        """
+        self.values = []  # type: List[Value]
+        self._ids = {}  # type: Dict[Value, int]
+        self._rules = {}  # type: Dict[RuleBase, RuleBase]
+
+        for value in values:
+            self.intern(value)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __contains__(self, value):
+        return value in self._ids
+
+    def intern(self, value):
+        # type: (Value) -> int
+        """Id of the value, new values get the next id."""
+        value_id = self._ids.get(value)
+        if value_id is None:
+            value_id = self._ids[value] = len(self.values)
+            self.values.append(value)
+        return value_id
+
+    def get(self, value):
+        # type: (Value) -> Optional[int]
+        """Id of the value, None for the new values, which aren't added."""
+        return self._ids.get(value)
+
+    def value(self, value_id):
+        # type: (int) -> Value
+        """Value of the id."""
+        return self.values[value_id]
+
+    def _map_value(self, value):
+        # type: (Value) -> Value
+        if value is RuleBase.ALL:
+            return value
+        if isinstance(value, Subtree):
+            raise ValueError('Subtree values are not supported')
+        return self.intern(value)
+
+    def map_rule(self, rule):
+        # type: (RuleBase) -> RuleBase
+        """Rule tree working with the ids of the values.
+
+        Built-in rules and RuleLists are rebuilt with the ids, other
+        rules are wrapped, so they get the original values.
+        """
+        mapped = self._rules.get(rule)
+        if mapped is not None:
+            return mapped
+
+        if type(rule) in _STRUCTURAL_RULES:
+            mapped = type(rule)(*[
+                [self._map_value(value) for value in getattr(rule, field)]
+                if field.endswith('_values')
+                else self._map_value(getattr(rule, field))
+                for field in rule._fields
+            ])
+        elif type(rule) is RuleList and not isinstance(
+                rule.operator, Weighted):
+            mapped = RuleList(
+                [self.map_rule(nested) for nested in rule.rules],
+                rule.operator)
+        else:
+            mapped = _ValuesRule(rule, self)
+
+        self._rules[rule] = mapped
+        return mapped
+
+
+class _ValuesRule(RuleBase):
+    """Wraps the rule, converting ids back to the values."""
+    def __init__(self, rule, registry):
+        # type: (RuleBase, ValueRegistry) -> None
+        self.rule = rule  # type: RuleBase
+        self.registry = registry  # type: ValueRegistry
+        self.guard = rule.guard  # type: bool
+        self.cacheable = rule.cacheable  # type: bool
+        self.static = rule.static  # type: bool
+
+        self._inputs = {
+            registry._map_value(value) for value in rule.inputs
+        }  # type: Set[Value]
+        self._outputs = {
+            registry._map_value(value) for value in rule.outputs
+        }  # type: Set[Value]
+
+    @property
+    def inputs(self):
+        # type: () -> Set[Value]
+        return self._inputs
+
+    @property
+    def outputs(self):
+        # type: () -> Set[Value]
+        return self._outputs
+
+    def is_valid(self, input_value, output_value, context=None):
+        # type: (int, int, Optional[TransferContext]) -> Tuple[bool, Optional[TransferError]]
+        values = self.registry.values
+        return self.rule.is_valid(
+            values[input_value], values[output_value], context)
+
+    def check(self, input_value, output_value, context=None):
+        # type: (int, int, Optional[TransferContext]) -> bool
+        values = self.registry.values
+        return self.rule.check(
+            values[input_value], values[output_value], context)
+
+
+class RegisteredRule(RuleBase):
+    """The Rule, which validates transfers by the ids of the values.
+
+    Values are looked up at the boundary, the rule tree mapped by
+    the registry works with the ids. Values unknown to the registry
+    aren't added, transfers with them are validated by the original
+    tree. Errors are reported by the original tree, so they contain
+    the original values, non-static trees are re-run for them on
+    a copy of the context.
+
+    Usage: `FlowBase(RegisteredRule(rule, registry), init)`
+    """
+    def __init__(self, rule, registry=None):
+        # type: (RuleBase, Optional[ValueRegistry]) -> None
+        """
+        :param rule: Values transfer rules
+        :param registry: Registry of the values, shared between rules
+        """
+        if registry is None:
+            registry = ValueRegistry()
+        self.registry = registry  # type: ValueRegistry
+        self.rule = rule  # type: RuleBase
+        self.mapped_rule = self.registry.map_rule(rule)  # type: RuleBase
+        self.guard = rule.guard  # type: bool
+        self.cacheable = rule.cacheable  # type: bool
+        self.static = rule.static  # type: bool
+
+    @property
+    def inputs(self):
+        # type: () -> Set[Value]
+        return self.rule.inputs
+
+    @property
+    def outputs(self):
+        # type: () -> Set[Value]
+        return self.rule.outputs
+
+    def is_valid(self, input_value, output_value, context=None):
+        # type: (Value, Value, Optional[TransferContext]) -> Tuple[bool, Optional[TransferError]]
+        get = self.registry.get
+        input_id = get(input_value)
+        output_id = get(output_value)
+        if input_id is None or output_id is None:
+            return self.rule.is_valid(input_value, output_value, context)
+
+        is_valid, err = self.mapped_rule.is_valid(
+            input_id, output_id, context)
+        if is_valid:
+            return True, None
+
+        # Errors of the mapped tree contain ids, changes of the context
+        # by the re-run are staged and discarded
+        if not self.static and context is not None:
+            context = StagedContext(context)
+        is_valid, original_err = self.rule.is_valid(
+            input_value, output_value, context)
+        if not is_valid:
+            return False, original_err
+        return False, err
+
+    def explain(self, input_value, output_value, context=None,
+                clock=time.perf_counter):
+        # type: (Value, Value, Optional[TransferContext], Callable[[], float]) -> Explanation
+        """Diagnostic validation by the original tree, so errors
+        contain the values, not their ids."""
+        return self.rule.explain(input_value, output_value, context, clock)
+
+    def check(self, input_value, output_value, context=None):
+        # type: (Value, Value, Optional[TransferContext]) -> bool
+        get = self.registry.get
+        input_id = get(input_value)
+        output_id = get(output_value)
+        if input_id is None or output_id is None:
+            return self.rule.check(input_value, output_value, context)
+        return self.mapped_rule.check(input_id, output_id, context)
@@ -1,20 +1,23 @@
+import time
 from collections import defaultdict
 from itertools import chain
 
+from flow.bases import Explanation
 from flow.bases import RuleBase
+from flow.bases import TrackedContext
 from flow.exceptions import TransferError
 from flow.exceptions import RuleListTransferError
+from flow.operators import Operator
 
-try:
-    from typing import TYPE_CHECKING
-except ImportError:
-    TYPE_CHECKING = False
+# typing is slow to import, type checkers treat the name as true
+TYPE_CHECKING = False
 
 if TYPE_CHECKING:
     from typing import Callable
     from typing import Collection
     from typing import Dict
     from typing import Iterable
+    from typing import Iterator
     from typing import List
     from typing import Optional
     from typing import Set
@@ -23,9 +26,19 @@ if TYPE_CHECKING:
     from flow.bases import TransferContext
     from flow.bases import Value
 
+    Clock = Callable[[], float]
+
 
 class RuleList(RuleBase):
-    """The Rule that contains other rules, and combines them by specific logic"""
+    """The Rule that contains other rules, and combines them by specific logic
+
+    Matched rules are evaluated lazily in the list order, so the operator
+    consuming results can stop evaluation (e.g. `all` on the first
+    invalid rule, see `flow.operators` for more operators).
+    """
+    # Static if all the nested rules are static
+    static = True  # type: bool
+
     def __init__(self, rules, operator=all):
         # type: (Iterable[RuleBase], Callable[[Iterable[object]], bool]) -> None
         """
@@ -33,22 +46,76 @@ class RuleList(RuleBase):
         :param operator: Combine operator
         """
         self.operator = operator  # type: Callable[[Iterable[bool]], bool]
-        self.rules = []  # type: List[RuleBase]
-        self.rules.extend(rules)
+        self.rules = list(rules)  # type: List[RuleBase]
 
-        # Map for fast rule searching
+        # Evaluation order of the rules
+        self._positions = {}  # type: Dict[RuleBase, int]
+        # Maps for fast rule searching
         self._input_map = defaultdict(list)  # type: Dict[Value, List[RuleBase]]
-
-        for rule in self.rules:
-            for _input in rule.inputs:
-                self._input_map[_input].append(rule)
-
-        # Map for fast rule searching
         self._output_map = defaultdict(list)  # type: Dict[Value, List[RuleBase]]
 
-        for rule in self.rules:
+        guards = 0
+        cacheable = True
+        static = type(self).static
+
+        # Everything is collected in one pass over the rules
+        positions = self._positions
+        input_map = self._input_map
+        output_map = self._output_map
+        for position, rule in enumerate(self.rules):
+            positions.setdefault(rule, position)
+            for _input in rule.inputs:
+                input_map[_input].append(rule)
             for _output in rule.outputs:
-                self._output_map[_output].append(rule)
+                output_map[_output].append(rule)
+            guards += rule.guard
+            cacheable = cacheable and rule.cacheable
+            static = static and rule.static
+
+        self._has_guards = guards > 0  # type: bool
+        self.guard = self._has_guards and guards == len(self.rules)  # type: bool
+        self.cacheable = cacheable  # type: bool
+        self.static = static  # type: bool
+
+    @classmethod
+    def from_pairs(cls, pairs, operator=all):
+        # type: (Iterable[Tuple[Value, Value]], Callable[[Iterable[object]], bool]) -> RuleList
+        """RuleList of the one to one rules, e.g. loaded transition table.
+
+        Pairs are trusted to be (input, output) values, so the maps are
+        filled from them directly, without the rules properties.
+        Subclasses are built by their constructors.
+
+        :param pairs: Allowed (input, output) transfers
+        :param operator: Combine operator
+        """
+        if cls is not RuleList:
+            return cls([
+                OneToOneRule(input_value, output_value)
+                for input_value, output_value in pairs
+            ], operator)
+
+        self = cls.__new__(cls)
+        self.operator = operator
+        self.rules = []
+        self._positions = {}
+        self._input_map = defaultdict(list)
+        self._output_map = defaultdict(list)
+
+        rules = self.rules
+        positions = self._positions
+        input_map = self._input_map
+        output_map = self._output_map
+        for input_value, output_value in pairs:
+            rule = OneToOneRule(input_value, output_value)
+            positions.setdefault(rule, len(rules))
+            rules.append(rule)
+            input_map[input_value].append(rule)
+            output_map[output_value].append(rule)
+
+        self._has_guards = self.guard = False
+        self.cacheable = self.static = True
+        return self
 
     @property
     def inputs(self):
@@ -60,26 +127,107 @@ class RuleList(RuleBase):
         # type: () -> Set[Value]
         return set(chain(*(rule.outputs for rule in self.rules)))
 
-    def is_valid(self, input_value, output_value, context=None):
-        # type: (Value, Value, Optional[TransferContext]) -> Tuple[bool, Optional[TransferError]]
+    def _get_key(self):
+        # type: () -> Optional[tuple]
+        """Key of the `RulePool`, None for the subclasses,
+        which don't define their own key."""
+        if '_get_key' not in type(self).__dict__:
+            return None
+        return type(self), self.operator, tuple(self.rules)
+
+    def _rebuild(self, rules):
+        # type: (Iterable[RuleBase]) -> RuleList
+        """The same RuleList with other rules."""
+        return type(self)(rules, self.operator)
+
+    def _find_rules(self, input_value, output_value):
+        # type: (Value, Value) -> Collection[RuleBase]
+        """Rules matching the transfer."""
         input_rules = set(self._input_map[input_value]) | set(
             self._input_map[RuleBase.ALL])
         output_rules = set(self._output_map[output_value]) | set(
             self._output_map[RuleBase.ALL])
 
-        rules = input_rules & output_rules
+        return input_rules & output_rules
 
-        if not rules:
-            return False, TransferError(
-                self, 'Rules not found for the %s -> %s transfer')
-
-        validation_results = [
-            (rule, rule.is_valid(input_value, output_value, context))
+    def is_valid(self, input_value, output_value, context=None):
+        # type: (Value, Value, Optional[TransferContext]) -> Tuple[bool, Optional[TransferError]]
+        rules = self._find_rules(input_value, output_value)
+
+        if not rules or self._has_guards and all(
+                rule.guard for rule in rules):
+            return False, self._not_found(input_value, output_value)
+
+        return self._combine(
+            sorted(rules, key=self._positions.__getitem__),
+            input_value, output_value, context)
+
+    def _not_found(self, input_value, output_value):
+        # type: (Value, Value) -> TransferError
+        return TransferError(
+            self, 'Rules not found for the %s -> %s transfer' % (
+                repr(input_value), repr(output_value)))
+
+    def _apply_operator(self, rules, results):
+        # type: (List[RuleBase], Iterator[bool]) -> bool
+        if isinstance(self.operator, Operator):
+            return self.operator.combine(rules, results)
+        return self.operator(results)
+
+    def check(self, input_value, output_value, context=None):
+        # type: (Value, Value, Optional[TransferContext]) -> bool
+        if isinstance(context, TrackedContext):
+            return self.is_valid(input_value, output_value, context)[0]
+
+        rules = self._find_rules(input_value, output_value)
+        if not rules or self._has_guards and all(
+                rule.guard for rule in rules):
+            return False
+
+        rules = sorted(rules, key=self._positions.__getitem__)
+        return bool(self._apply_operator(rules, (
+            rule.check(input_value, output_value, context)
+            for rule in rules)))
+
+    def _explained_rules(self, input_value, output_value, context):
+        # type: (Value, Value, Optional[TransferContext]) -> List[RuleBase]
+        """Rules, which are evaluated by `explain`."""
+        return sorted(self._find_rules(input_value, output_value),
+                      key=self._positions.__getitem__)
+
+    def explain(self, input_value, output_value, context=None,
+                clock=time.perf_counter):
+        # type: (Value, Value, Optional[TransferContext], Callable[[], float]) -> Explanation
+        """Diagnostic validation, all the matched rules are evaluated."""
+        started = clock()
+        rules = self._explained_rules(input_value, output_value, context)
+        if not rules or self._has_guards and all(
+                rule.guard for rule in rules):
+            return Explanation(
+                self, False, self._not_found(input_value, output_value),
+                clock() - started)
+
+        children = [
+            rule.explain(input_value, output_value, context, clock)
             for rule in rules
         ]
-
-        is_valid = self.operator(
-            is_valid for _, (is_valid, _) in validation_results)
+        is_valid = bool(self._apply_operator(
+            rules, iter([child.is_valid for child in children])))
+        err = None if is_valid else RuleListTransferError(self, [
+            (child.rule, (child.is_valid, child.error))
+            for child in children
+        ])
+        return Explanation(
+            self, is_valid, err, clock() - started, children)
+
+    def _combine(self, rules, input_value, output_value, context):
+        # type: (List[RuleBase], Value, Value, Optional[TransferContext]) -> Tuple[bool, Optional[TransferError]]
+        """Evaluates rules in the given order and combines results."""
+        validation_results = []  # type: list
+        results = self._evaluate(
+            rules, input_value, output_value, context, validation_results)
+
+        is_valid = self._apply_operator(rules, results)
 
         if is_valid:
             err = None
@@ -88,9 +236,45 @@ class RuleList(RuleBase):
 
         return is_valid, err
 
-
-class OneToOneRule(RuleBase):
+    @staticmethod
+    def _evaluate(rules, input_value, output_value, context, validation_results):
+        # type: (List[RuleBase], Value, Value, Optional[TransferContext], list) -> Iterator[bool]
+        """Lazily evaluates rules, collecting their results."""
+        tracked = isinstance(context, TrackedContext)
+        for rule in rules:
+            if tracked:
+                result = context.evaluate(rule, input_value, output_value)
+            else:
+                result = rule.is_valid(input_value, output_value, context)
+            validation_results.append((rule, result))
+            yield result[0]
+
+
+class _ValueRule(RuleBase):
+    """Base class of the structural rules, which are shared
+    by the `RulePool` if their values are equal."""
+    static = True
+
+    # Attributes of the rule values, `*_values` are collections
+    _fields = ()  # type: Tuple[str, ...]
+    _key = None  # type: Optional[tuple]
+
+    def _get_key(self):
+        # type: () -> Optional[tuple]
+        """Key of the `RulePool`, None for the subclasses,
+        which don't declare their own `_fields`."""
+        if self._key is None and '_fields' in type(self).__dict__:
+            self._key = (type(self),) + tuple(
+                frozenset(getattr(self, field)) if field.endswith('_values')
+                else getattr(self, field)
+                for field in self._fields)
+        return self._key
+
+
+class OneToOneRule(_ValueRule):
     """The Rule for the one to one transfer."""
+    _fields = ('input_value', 'output_value')
+
     def __init__(self, input_value, output_value):
         # type: (Value, Value) -> None
         """
@@ -122,9 +306,16 @@ class OneToOneRule(RuleBase):
 
         return True, None
 
+    def check(self, input_value, output_value, context=None):
+        # type: (Value, Value, Optional[TransferContext]) -> bool
+        return self.input_value == input_value and (
+            self.output_value == output_value)
 
-class OneToManyRule(RuleBase):
+
+class OneToManyRule(_ValueRule):
     """The Rule for the one to many transfer."""
+    _fields = ('input_value', 'output_values')
+
     def __init__(self, input_value, output_values):
         # type: (Value, Collection[Value]) -> None
         """
@@ -156,9 +347,16 @@ class OneToManyRule(RuleBase):
 
         return True, None
 
+    def check(self, input_value, output_value, context=None):
+        # type: (Value, Value, Optional[TransferContext]) -> bool
+        return self.input_value == input_value and (
+            output_value in self.output_values)
 
-class ManyToOneRule(RuleBase):
+
+class ManyToOneRule(_ValueRule):
     """The Rule for the many to one transfer."""
+    _fields = ('input_values', 'output_value')
+
     def __init__(self, input_values, output_value):
         # type: (Collection[Value], Value) -> None
         """
@@ -190,9 +388,16 @@ class ManyToOneRule(RuleBase):
 
         return True, None
 
+    def check(self, input_value, output_value, context=None):
+        # type: (Value, Value, Optional[TransferContext]) -> bool
+        return self.output_value == output_value and (
+            input_value in self.input_values)
 
-class ManyToManyRule(RuleBase):
+
+class ManyToManyRule(_ValueRule):
     """The Rule for the many to many transfer."""
+    _fields = ('input_values', 'output_values')
+
     def __init__(self, input_values, output_values):
         # type: (Collection[Value], Collection[Value]) -> None
         """
@@ -224,9 +429,16 @@ class ManyToManyRule(RuleBase):
 
         return True, None
 
+    def check(self, input_value, output_value, context=None):
+        # type: (Value, Value, Optional[TransferContext]) -> bool
+        return input_value in self.input_values and (
+            output_value in self.output_values)
 
-class OneToAllRule(RuleBase):
+
+class OneToAllRule(_ValueRule):
     """The Rule for the one to all transfer."""
+    _fields = ('input_value',)
+
     def __init__(self, input_value):
         # type: (Value) -> None
         """
@@ -252,9 +464,15 @@ class OneToAllRule(RuleBase):
 
         return True, None
 
+    def check(self, input_value, output_value, context=None):
+        # type: (Value, Value, Optional[TransferContext]) -> bool
+        return self.input_value == input_value
 
-class AllToOneRule(RuleBase):
+
+class AllToOneRule(_ValueRule):
     """The rule for the all to one transfer."""
+    _fields = ('output_value',)
+
     def __init__(self, output_value):
         # type: (Value) -> None
         """
@@ -280,9 +498,15 @@ class AllToOneRule(RuleBase):
 
         return True, None
 
+    def check(self, input_value, output_value, context=None):
+        # type: (Value, Value, Optional[TransferContext]) -> bool
+        return self.output_value == output_value
+
 
-class ManyToAllRule(RuleBase):
+class ManyToAllRule(_ValueRule):
     """The Rule for the many to all transfer."""
+    _fields = ('input_values',)
+
     def __init__(self, input_values):
         # type: (Collection[Value]) -> None
         """
@@ -308,9 +532,15 @@ class ManyToAllRule(RuleBase):
 
         return True, None
 
+    def check(self, input_value, output_value, context=None):
+        # type: (Value, Value, Optional[TransferContext]) -> bool
+        return input_value in self.input_values
+
 
-class AllToManyRule(RuleBase):
+class AllToManyRule(_ValueRule):
     """The Rule for the all to many transfer."""
+    _fields = ('output_values',)
+
     def __init__(self, output_values):
         # type: (Collection[Value]) -> None
         """
@@ -336,9 +566,15 @@ class AllToManyRule(RuleBase):
 
         return True, None
 
+    def check(self, input_value, output_value, context=None):
+        # type: (Value, Value, Optional[TransferContext]) -> bool
+        return output_value in self.output_values
+
 
-class AllToAllRule(RuleBase):
+class AllToAllRule(_ValueRule):
     """The Rule for the all to all transfer."""
+    _fields = ()
+
     @property
     def inputs(self):
         # type: () -> Set[Value]
@@ -352,3 +588,291 @@ class AllToAllRule(RuleBase):
     def is_valid(self, input_value, output_value, context=None):
         # type: (Value, Value, Optional[TransferContext]) -> Tuple[bool, Optional[TransferError]]
         return True, None
+
+    def check(self, input_value, output_value, context=None):
+        # type: (Value, Value, Optional[TransferContext]) -> bool
+        return True
+
+
+def _stable_repr(value):
+    # type: (object) -> str
+    """Repr of the value, collections are sorted, so the repr
+    doesn't depend on the hash seed."""
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return '[%s]' % ', '.join(sorted(_stable_repr(item) for item in value))
+    return repr(value)
+
+
+class _TimedRule(RuleBase):
+    """Base class for the time dependent guard rules.
+
+    State of the rule is staged in the context, see
+    `TransferContext.stage`, so only accepted transfers change it.
+    Times are taken from the wall clock by default, so the state stays
+    valid in the contexts stored and loaded by other processes. State
+    from the future (e.g. after the clock is set back) is ignored.
+    """
+    guard = True
+    cacheable = False
+
+    # Attributes of the rule parameters, which make the default key
+    _key_fields = ('input_values', 'output_values')  # type: Tuple[str, ...]
+
+    def __init__(self, inputs=None, outputs=None, clock=None, key=None):
+        # type: (Optional[Collection[Value]], Optional[Collection[Value]], Optional[Clock], Optional[str]) -> None
+        """
+        :param inputs: Restricted inputs, all by default
+        :param outputs: Restricted outputs, all by default
+        :param clock: Time source, in seconds, `time.time` by default
+        :param key: Context key of the rule state, by default it is
+            made of the rule type and parameters, so it is the same
+            in every process, rules with the same parameters share
+            the state
+        """
+        self.input_values = inputs  # type: Optional[Collection[Value]]
+        self.output_values = outputs  # type: Optional[Collection[Value]]
+        self.clock = clock or time.time  # type: Clock
+        self.key = key or '%s(%s)' % (type(self).__name__, ', '.join(
+            _stable_repr(getattr(self, field))
+            for field in self._key_fields))  # type: str
+
+    @property
+    def inputs(self):
+        # type: () -> Set[Value]
+        if self.input_values is None:
+            return {self.ALL}
+        return set(self.input_values)
+
+    @property
+    def outputs(self):
+        # type: () -> Set[Value]
+        if self.output_values is None:
+            return {self.ALL}
+        return set(self.output_values)
+
+    def _check_values(self, input_value, output_value):
+        # type: (Value, Value) -> Tuple[bool, Optional[TransferError]]
+        if self.input_values is not None and (
+                input_value not in self.input_values):
+            return False, TransferError(self, '%s not in %s' % (
+                repr(input_value), repr(self.input_values)))
+
+        if self.output_values is not None and (
+                output_value not in self.output_values):
+            return False, TransferError(self, '%s not in %s' % (
+                repr(output_value), repr(self.output_values)))
+
+        return True, None
+
+    def _context_required(self):
+        # type: () -> Tuple[bool, Optional[TransferError]]
+        return False, TransferError(self, 'Context required')
+
+    def _store(self, context, state):
+        # type: (TransferContext, object) -> None
+        stage = getattr(context, 'stage', None)
+        if stage is None:
+            # Plain dicts are changed at once
+            context[self.key] = state
+        else:
+            stage(self.key, state)
+
+
+class CooldownRule(_TimedRule):
+    """The Rule which doesn't allow to leave values too early.
+
+    Entering time is stored in the context, so the rule is consulted
+    for all the transfers to the values, and for the transfers to
+    the outputs. Transfers not leaving the values are always valid.
+    """
+    _key_fields = ('values', 'period', 'output_values')
+
+    def __init__(self, values, period, outputs=None, clock=None, key=None):
+        # type: (Collection[Value], float, Optional[Collection[Value]], Optional[Clock], Optional[str]) -> None
+        """
+        :param values: Values to stay in
+        :param period: Minimal time in the values, in seconds
+        :param outputs: Restricted outputs, all by default
+        :param clock: Time source, in seconds, `time.time` by default
+        :param key: Context key of the rule state, unique by default
+        """
+        self.values = values  # type: Collection[Value]
+        self.period = period  # type: float
+        super(CooldownRule, self).__init__(
+            outputs=outputs, clock=clock, key=key)
+
+    @property
+    def outputs(self):
+        # type: () -> Set[Value]
+        if self.output_values is None:
+            return {self.ALL}
+        return set(self.values) | set(self.output_values)
+
+    def is_valid(self, input_value, output_value, context=None):
+        # type: (Value, Value, Optional[TransferContext]) -> Tuple[bool, Optional[TransferError]]
+        if context is None:
+            return self._context_required()
+
+        now = self.clock()
+
+        if input_value in self.values and output_value not in self.values and (
+                self.output_values is None or
+                output_value in self.output_values):
+            entered = context.get(self.key)
+            if entered is not None and 0 <= now - entered < self.period:
+                return False, TransferError(
+                    self, 'Cannot leave %s for %.3f seconds' % (
+                        repr(input_value), self.period - (now - entered)))
+
+        if output_value in self.values and input_value not in self.values:
+            self._store(context, now)
+
+        return True, None
+
+
+class RateLimitRule(_TimedRule):
+    """The Rule which limits the frequency of the transfers of the flow.
+
+    Token bucket of the `limit` size, refilled over the `period`, state
+    of the bucket is stored in the context as (tokens, update time).
+    """
+    _key_fields = ('limit', 'period', 'input_values', 'output_values')
+
+    def __init__(self, limit, period, inputs=None, outputs=None, clock=None,
+                 key=None):
+        # type: (int, float, Optional[Collection[Value]], Optional[Collection[Value]], Optional[Clock], Optional[str]) -> None
+        """
+        :param limit: Maximum number of the transfers in the period
+        :param period: Period, in seconds
+        :param inputs: Limited inputs, all by default
+        :param outputs: Limited outputs, all by default
+        :param clock: Time source, in seconds, `time.time` by default
+        :param key: Context key of the rule state, unique by default
+        """
+        self.limit = limit  # type: int
+        self.period = period  # type: float
+        super(RateLimitRule, self).__init__(inputs, outputs, clock, key)
+
+    def is_valid(self, input_value, output_value, context=None):
+        # type: (Value, Value, Optional[TransferContext]) -> Tuple[bool, Optional[TransferError]]
+        is_valid, err = self._check_values(input_value, output_value)
+        if not is_valid:
+            return is_valid, err
+
+        if context is None:
+            return self._context_required()
+
+        now = self.clock()
+        bucket = context.get(self.key)
+
+        # State from the future is left by the other clock
+        if bucket is None or now < bucket[1]:
+            tokens = float(self.limit)
+        else:
+            tokens = min(
+                float(self.limit),
+                bucket[0] + (now - bucket[1]) * self.limit / self.period)
+
+        if tokens < 1:
+            return False, TransferError(
+                self, 'Rate limit of %d transfers per %s seconds exceeded' % (
+                    self.limit, self.period))
+
+        self._store(context, (tokens - 1, now))
+        return True, None
+
+
+class TimeWindowRule(_TimedRule):
+    """The Rule which allows transfers only in the time window.
+
+    With the period window repeats, e.g. `start=9 * 3600, end=18 * 3600,
+    period=24 * 3600, clock=time.time` are working hours in UTC.
+    Window with the start after the end wraps over the period end.
+    """
+    def __init__(self, start, end, period=None, inputs=None, outputs=None,
+                 clock=None):
+        # type: (float, float, Optional[float], Optional[Collection[Value]], Optional[Collection[Value]], Optional[Clock]) -> None
+        """
+        :param start: Window start, in seconds
+        :param end: Window end, in seconds
+        :param period: Window repeat period, in seconds
+        :param inputs: Restricted inputs, all by default
+        :param outputs: Restricted outputs, all by default
+        :param clock: Time source, in seconds
+        """
+        super(TimeWindowRule, self).__init__(inputs, outputs, clock)
+        self.start = start  # type: float
+        self.end = end  # type: float
+        self.period = period  # type: Optional[float]
+
+    def is_valid(self, input_value, output_value, context=None):
+        # type: (Value, Value, Optional[TransferContext]) -> Tuple[bool, Optional[TransferError]]
+        is_valid, err = self._check_values(input_value, output_value)
+        if not is_valid:
+            return is_valid, err
+
+        now = self.clock()
+        if self.period is not None:
+            now %= self.period
+
+        if self.start <= self.end:
+            in_window = self.start <= now < self.end
+        else:
+            in_window = now >= self.start or now < self.end
+
+        if not in_window:
+            return False, TransferError(
+                self, 'Transfer is allowed only from %s to %s' % (
+                    self.start, self.end))
+
+        return True, None
+
+
+class RulePool(object):
+    """Pool of the shared rules.
+
+    Built-in rules are equal if their values are equal, RuleLists are
+    equal if their operators and nested rules (the same instances) are
+    equal. Interning replaces equal rules with one shared instance, so
+    the trees (e.g. per tenant) share memory, transition tables and
+    `TrackedContext` cache entries. Other rules (and subclasses, which
+    don't declare their keys) are never shared. Rules themselves are
+    compared by identity, which keeps the lookups of the rules cheap.
+    """
+    def __init__(self):
+        self._rules = {}  # type: Dict[tuple, RuleBase]
+
+    def __len__(self):
+        return len(self._rules)
+
+    @staticmethod
+    def _get_key(rule):
+        # type: (RuleBase) -> Optional[tuple]
+        get_key = getattr(rule, '_get_key', None)
+        return get_key() if get_key is not None else None
+
+    def intern(self, rule):
+        # type: (RuleBase) -> RuleBase
+        """Shared rule equal to the rule."""
+        key = self._get_key(rule)
+        if key is None:
+            return rule
+        return self._rules.setdefault(key, rule)
+
+    def intern_tree(self, rule):
+        # type: (RuleBase) -> RuleBase
+        """Shared rule equal to the rule, with the shared nested rules."""
+        key = self._get_key(rule)
+        if key is None:
+            return rule
+        shared = self._rules.get(key)
+        if shared is not None:
+            return shared
+
+        if isinstance(rule, RuleList):
+            rules = [self.intern_tree(nested) for nested in rule.rules]
+            if any(shared is not nested
+                   for shared, nested in zip(rules, rule.rules)):
+                rule = rule._rebuild(rules)
+
+        return self.intern(rule)
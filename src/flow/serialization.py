@@ -0,0 +1,155 @@
+import hashlib
+import os
+import pickle
+import struct
+import tempfile
+from os.path import join
+
+from flow.exceptions import SerializationError
+
+try:
+    from typing import TYPE_CHECKING
+except ImportError:
+    TYPE_CHECKING = False
+
+if TYPE_CHECKING:
+    from typing import BinaryIO
+    from typing import Callable
+    from typing import Union
+
+    from flow.bases import RuleBase
+
+MAGIC = b'FLRL'  # type: bytes
+# Version of the data format
+VERSION = 2  # type: int
+# Version of the rules layout, the rules are pickled with their
+# attributes (e.g. RuleList indexes), so it must be bumped whenever
+# the attributes of the rules change
+LAYOUT = 1  # type: int
+
+# magic, version, layout
+_HEADER = struct.Struct('<4sHH')
+
+
+def dumps(rule):
+    # type: (RuleBase) -> bytes
+    """Serializes the rule tree, including prebuilt RuleList indexes.
+
+    Rules are stored by pickle, so the data is bound to the `LAYOUT`
+    of the rules, data of the other layouts isn't loaded.
+
+    :param rule: Root rule
+    :return: Serialized data
+    """
+    return _HEADER.pack(MAGIC, VERSION, LAYOUT) + pickle.dumps(
+        rule, pickle.HIGHEST_PROTOCOL)
+
+
+def loads(data):
+    # type: (bytes) -> RuleBase
+    """Restores the rule tree serialized by the `dumps`.
+
+    Data is unpickled, load it only from trusted sources.
+
+    :param data: Serialized data
+    :return: Root rule
+    """
+    if len(data) < _HEADER.size:
+        raise SerializationError('Truncated rules data')
+
+    magic, version, layout = _HEADER.unpack_from(data)
+
+    if magic != MAGIC:
+        raise SerializationError('Not a rules data')
+
+    if version != VERSION:
+        raise SerializationError('Unsupported rules version: %s' % version)
+
+    if layout != LAYOUT:
+        raise SerializationError('Stale rules layout: %s' % layout)
+
+    try:
+        return pickle.loads(data[_HEADER.size:])
+    except Exception as e:
+        raise SerializationError('Broken rules data: %s' % e) from e
+
+
+def dump(rule, file):
+    # type: (RuleBase, BinaryIO) -> None
+    """Writes the serialized rule tree to the binary file."""
+    file.write(dumps(rule))
+
+
+def load(file):
+    # type: (BinaryIO) -> RuleBase
+    """Reads the serialized rule tree from the binary file."""
+    return loads(file.read())
+
+
+class RuleCache(object):
+    """On-disk cache of the rule trees, keyed by the hash of their source.
+
+    Source is anything the rule tree is built from (e.g. config file
+    contents), the same source always gives the same cached tree.
+    Keys include the data version and the rules layout, so entries
+    stored by other releases are never loaded.
+    """
+    SUFFIX = '.rules'  # type: str
+
+    def __init__(self, directory):
+        # type: (str) -> None
+        """
+        :param directory: Cache directory
+        """
+        self.directory = directory  # type: str
+
+    @staticmethod
+    def key(source):
+        # type: (Union[bytes, str]) -> str
+        """Cache key of the source."""
+        if isinstance(source, str):
+            source = source.encode('utf-8')
+
+        digest = hashlib.sha256(_HEADER.pack(MAGIC, VERSION, LAYOUT))
+        digest.update(source)
+        return digest.hexdigest()
+
+    def path(self, source):
+        # type: (Union[bytes, str]) -> str
+        """Path of the cache file for the source."""
+        return join(self.directory, self.key(source) + self.SUFFIX)
+
+    def get(self, source, build):
+        # type: (Union[bytes, str], Callable[[], RuleBase]) -> RuleBase
+        """Returns cached rule tree, builds and caches it on miss.
+
+        :param source: Rule tree source
+        :param build: Builds the rule tree from the source
+        """
+        path = self.path(source)
+
+        try:
+            with open(path, 'rb') as f:
+                return load(f)
+        except (OSError, SerializationError):
+            pass
+
+        rule = build()
+        self.set(source, rule)
+        return rule
+
+    def set(self, source, rule):
+        # type: (Union[bytes, str], RuleBase) -> None
+        """Stores the rule tree for the source."""
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Write and rename, so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(
+            dir=self.directory, suffix=self.SUFFIX + '.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                dump(rule, f)
+            os.replace(tmp_path, self.path(source))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
@@ -0,0 +1,204 @@
+import multiprocessing
+import os
+
+from flow.bases import FlowBase
+from flow.exceptions import EngineError
+from flow.exceptions import TransferError
+from flow.serialization import dumps
+from flow.serialization import loads
+
+try:
+    from typing import TYPE_CHECKING
+except ImportError:
+    TYPE_CHECKING = False
+
+if TYPE_CHECKING:
+    from typing import Any
+    from typing import Dict
+    from typing import Hashable
+    from typing import Iterable
+    from typing import List
+    from typing import Optional
+    from typing import Tuple
+
+    from flow.bases import RuleBase
+    from flow.bases import Value
+
+_CREATE = 'create'
+_TRANSFER = 'transfer'
+_VALUES = 'values'
+_CLOSE = 'close'
+
+
+def _create(flows, rule, flow_class, batch):
+    for key, init, context in batch:
+        flows[key] = flow_class(rule, init=init, context=context)
+
+
+def _transfer(flows, rule, flow_class, batch):
+    results = []
+    for key, value in batch:
+        flow = flows.get(key)
+        if flow is None:
+            results.append((False, 'Flow %s not found' % repr(key)))
+            continue
+        try:
+            flow.value = value
+        except TransferError as e:
+            results.append((False, str(e)))
+        else:
+            results.append((True, None))
+    return results
+
+
+def _values(flows, rule, flow_class, batch):
+    return [flows[key].value if key in flows else None for key in batch]
+
+
+_HANDLERS = {
+    _CREATE: _create,
+    _TRANSFER: _transfer,
+    _VALUES: _values,
+}
+
+
+def _worker(connection, rule_data, flow_class):
+    rule = loads(rule_data)
+    flows = {}  # type: Dict[Hashable, FlowBase]
+
+    while True:
+        command, batch = connection.recv()
+        if command == _CLOSE:
+            break
+
+        try:
+            result = _HANDLERS[command](flows, rule, flow_class, batch)
+        except Exception as e:
+            connection.send((False, '%s: %s' % (type(e).__name__, e)))
+        else:
+            connection.send((True, result))
+
+    connection.close()
+
+
+class ShardedEngine(object):
+    """Flows partitioned by the hash of their key over the worker processes.
+
+    Each worker loads the rule tree once and owns values and contexts
+    of its flows. Requests are sent in batches, a batch is split by
+    workers, processed in parallel and merged back in the request order.
+    """
+    def __init__(self, rule, workers=None, flow_class=FlowBase,
+                 start_method=None):
+        # type: (RuleBase, Optional[int], type, Optional[str]) -> None
+        """
+        :param rule: Values transfer rules, picklable
+        :param workers: Number of worker processes, CPU count by default
+        :param flow_class: Flow class, picklable
+        :param start_method: Multiprocessing start method
+        """
+        workers = workers or os.cpu_count() or 1
+        mp_context = multiprocessing.get_context(start_method)
+        rule_data = dumps(rule)
+
+        self._connections = []  # type: List[Any]
+        self._processes = []  # type: List[Any]
+
+        for _ in range(workers):
+            connection, worker_connection = mp_context.Pipe()
+            process = mp_context.Process(
+                target=_worker,
+                args=(worker_connection, rule_data, flow_class),
+                daemon=True)
+            process.start()
+            worker_connection.close()
+            self._connections.append(connection)
+            self._processes.append(process)
+
+    @property
+    def workers(self):
+        # type: () -> int
+        """Number of the worker processes."""
+        return len(self._processes)
+
+    def shard(self, key):
+        # type: (Hashable) -> int
+        """Index of the worker owning the flow."""
+        return hash(key) % len(self._connections)
+
+    def _request(self, command, items, key=lambda item: item):
+        # type: (str, Iterable[Any], Any) -> List[Any]
+        shards = [[] for _ in self._connections]  # type: List[List[Any]]
+        positions = [[] for _ in self._connections]  # type: List[List[int]]
+        count = 0
+
+        for position, item in enumerate(items):
+            shard = self.shard(key(item))
+            shards[shard].append(item)
+            positions[shard].append(position)
+            count += 1
+
+        busy = [shard for shard, batch in enumerate(shards) if batch]
+
+        for shard in busy:
+            self._connections[shard].send((command, shards[shard]))
+
+        results = [None] * count  # type: List[Any]
+        errors = []
+
+        for shard in busy:
+            success, result = self._connections[shard].recv()
+            if not success:
+                errors.append(result)
+            elif result is not None:
+                for position, item_result in zip(positions[shard], result):
+                    results[position] = item_result
+
+        if errors:
+            raise EngineError('; '.join(errors))
+
+        return results
+
+    def create(self, items):
+        # type: (Iterable[Tuple[Hashable, Value, Optional[dict]]]) -> None
+        """Creates flows, replacing existing ones with the same key.
+
+        :param items: (key, initial value, initial context) tuples
+        """
+        self._request(_CREATE, items, key=lambda item: item[0])
+
+    def transfer(self, items):
+        # type: (Iterable[Tuple[Hashable, Value]]) -> List[Tuple[bool, Optional[str]]]
+        """Transfers flows to the new values.
+
+        :param items: (key, new value) tuples
+        :return: (Is valid, Error message) for every item
+        """
+        return self._request(_TRANSFER, items, key=lambda item: item[0])
+
+    def values(self, keys):
+        # type: (Iterable[Hashable]) -> List[Value]
+        """Current values of the flows, None for unknown keys."""
+        return self._request(_VALUES, keys)
+
+    def close(self):
+        # type: () -> None
+        """Stops the worker processes."""
+        for connection in self._connections:
+            try:
+                connection.send((_CLOSE, None))
+            except OSError:  # pragma: no cover
+                pass
+            connection.close()
+
+        for process in self._processes:
+            process.join()
+
+        self._connections = []
+        self._processes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,158 @@
+"""Monte Carlo simulation of the flows population, requires NumPy."""
+import numpy
+
+from flow.tables import get_table
+
+try:
+    from typing import TYPE_CHECKING
+except ImportError:
+    TYPE_CHECKING = False
+
+if TYPE_CHECKING:
+    from typing import Dict
+    from typing import List
+    from typing import Optional
+    from typing import Sequence
+
+    from flow.analytics import TransitionMatrix
+    from flow.bases import RuleBase
+    from flow.bases import Value
+
+
+class TransitionModel(object):
+    """Markov chain of the legal transitions between values.
+
+    Every step the entity moves to one of the legal outputs of its value
+    with the probability proportional to the transition weight. Values
+    without legal outputs (or with zero weights) are absorbing.
+    """
+    def __init__(self, values, probabilities):
+        # type: (Sequence[Value], numpy.ndarray) -> None
+        """
+        :param values: Values, in the order of the matrix rows
+        :param probabilities: Square matrix of the transition probabilities
+        """
+        self.values = list(values)  # type: List[Value]
+        self.probabilities = probabilities  # type: numpy.ndarray
+        self.absorbing = numpy.diagonal(
+            probabilities) == 1.0  # type: numpy.ndarray
+
+        size = len(self.values)
+        cumulative = numpy.cumsum(probabilities, axis=1)
+        # Exact 1.0 at the end of the rows, zero tails stay unreachable
+        cumulative /= cumulative[:, -1:]
+        # Rows are shifted by their index, so the next values of the
+        # whole population are found by one sorted search
+        self._cumulative = (
+            cumulative + numpy.arange(size)[:, None]).ravel()
+
+    @classmethod
+    def from_rule(cls, rule, values, weights=None):
+        # type: (RuleBase, Sequence[Value], Optional[numpy.ndarray]) -> TransitionModel
+        """Compiles the static rule.
+
+        :param rule: Static rule
+        :param values: Values of the model
+        :param weights: Transition weights (e.g. observed counts),
+            legal transitions are equally likely by default
+        :raise ValueError: Rule is not static
+        """
+        table = get_table(rule)
+        size = len(values)
+        legal = numpy.array([
+            [table.check(input_value, output_value)
+             for output_value in values]
+            for input_value in values
+        ], dtype=bool).reshape((size, size))
+        numpy.fill_diagonal(legal, False)
+
+        if weights is None:
+            weights = legal.astype(float)
+        else:
+            weights = numpy.where(
+                legal, numpy.asarray(weights, dtype=float), 0.0)
+
+        totals = weights.sum(axis=1)
+        absorbing = totals == 0
+        totals[absorbing] = 1.0
+        probabilities = weights / totals[:, None]
+        probabilities[absorbing, absorbing] = 1.0
+        return cls(values, probabilities)
+
+    @classmethod
+    def from_matrix(cls, rule, matrix):
+        # type: (RuleBase, TransitionMatrix) -> TransitionModel
+        """Compiles the static rule with the empirical probabilities
+        of the accepted transitions, see `TransitionCollector`."""
+        accepted = matrix.to_numpy()[0]
+        return cls.from_rule(rule, matrix.values, accepted)
+
+    def simulate(self, population, steps, seed=None):
+        # type: (Dict[Value, int], int, Optional[int]) -> SimulationResult
+        """Advances the population by steps.
+
+        :param population: Number of the entities by the initial value
+        :param steps: Number of the steps
+        :param seed: Seed of the random generator
+        """
+        size = len(self.values)
+        rng = numpy.random.default_rng(seed)
+
+        states = numpy.repeat(
+            numpy.array([self.values.index(value) for value in population],
+                        dtype=numpy.intp),
+            list(population.values()))
+        occupancy = numpy.zeros((steps + 1, size), dtype=numpy.int64)
+        occupancy[0] = numpy.bincount(states, minlength=size)
+
+        absorption_times = numpy.full(len(states), -1, dtype=numpy.int64)
+        absorption_times[self.absorbing[states]] = 0
+
+        for step in range(1, steps + 1):
+            index = numpy.searchsorted(
+                self._cumulative, states + rng.random(len(states)),
+                side='right')
+            states = index - states * size
+            occupancy[step] = numpy.bincount(states, minlength=size)
+
+            absorbed = self.absorbing[states] & (absorption_times < 0)
+            absorption_times[absorbed] = step
+
+        return SimulationResult(self.values, occupancy, absorption_times)
+
+
+class SimulationResult(object):
+    """Occupancy of the values and absorption times of the entities."""
+    def __init__(self, values, occupancy, absorption_times):
+        # type: (List[Value], numpy.ndarray, numpy.ndarray) -> None
+        """
+        :param values: Values, in the order of the occupancy columns
+        :param occupancy: Number of the entities by step and value
+        :param absorption_times: Step of the absorption by entity,
+            -1 for not absorbed entities
+        """
+        self.values = values  # type: List[Value]
+        self.occupancy = occupancy  # type: numpy.ndarray
+        self.absorption_times = absorption_times  # type: numpy.ndarray
+
+    def occupancy_of(self, value):
+        # type: (Value) -> numpy.ndarray
+        """Number of the entities in the value by step."""
+        return self.occupancy[:, self.values.index(value)]
+
+    def absorption_stats(self, percentiles=(50, 90, 99)):
+        # type: (Sequence[float]) -> Dict[str, float]
+        """Statistics of the time to absorption of the absorbed entities."""
+        times = self.absorption_times[self.absorption_times >= 0]
+        stats = {
+            'absorbed': int(len(times)),
+            'not_absorbed': int(len(self.absorption_times) - len(times)),
+        }  # type: Dict[str, float]
+
+        if len(times):
+            stats['mean'] = float(times.mean())
+            for percentile, value in zip(
+                    percentiles, numpy.percentile(times, percentiles)):
+                stats['p%g' % percentile] = float(value)
+
+        return stats
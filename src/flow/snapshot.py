@@ -0,0 +1,198 @@
+import mmap
+import pickle
+import struct
+import sys
+from array import array
+
+from flow.bases import FlowBase
+from flow.exceptions import SnapshotError
+
+try:
+    from typing import TYPE_CHECKING
+except ImportError:
+    TYPE_CHECKING = False
+
+if TYPE_CHECKING:
+    from typing import Dict
+    from typing import Iterable
+    from typing import List
+    from typing import Optional
+    from typing import Tuple
+
+    from flow.bases import RuleBase
+    from flow.bases import Value
+
+MAGIC = b'FLSN'  # type: bytes
+VERSION = 1  # type: int
+
+# magic, version, byte order, state item size, states count,
+# states offset, values table offset, values table length
+_HEADER = struct.Struct('<4sHBBQQQQ')
+_BYTE_ORDER = {'little': 0, 'big': 1}
+
+
+def write_snapshot(path, values):
+    # type: (str, Iterable[Value]) -> int
+    """Writes values of the flow population to the snapshot file.
+
+    Every distinct value is stored once in the values table,
+    the population itself is stored as an array of value ids.
+
+    :param path: Snapshot file path
+    :param values: Values of the flows
+    :return: Number of stored values
+    """
+    table = []  # type: List[Value]
+    ids = {}  # type: Dict[Value, int]
+    states = array('I')
+
+    for value in values:
+        value_id = ids.get(value)
+        if value_id is None:
+            value_id = ids[value] = len(table)
+            table.append(value)
+        states.append(value_id)
+
+    table_data = pickle.dumps(table, pickle.HIGHEST_PROTOCOL)
+    states_offset = _HEADER.size
+    table_offset = states_offset + len(states) * states.itemsize
+
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(
+            MAGIC, VERSION, _BYTE_ORDER[sys.byteorder], states.itemsize,
+            len(states), states_offset, table_offset, len(table_data)))
+        states.tofile(f)
+        f.write(table_data)
+
+    return len(states)
+
+
+def dump_flows(path, flows):
+    # type: (str, Iterable[FlowBase]) -> int
+    """Writes values of the flows to the snapshot file.
+
+    :param path: Snapshot file path
+    :param flows: Flows
+    :return: Number of stored values
+    """
+    return write_snapshot(path, (flow.value for flow in flows))
+
+
+class Snapshot(object):
+    """Read-only memory-mapped view of the snapshot file.
+
+    Value ids are read directly from the mapped file, so processes
+    opening the same snapshot share its pages through the OS page cache.
+    """
+    def __init__(self, path):
+        # type: (str) -> None
+        """
+        :param path: Snapshot file path
+        """
+        self.path = path  # type: str
+
+        with open(path, 'rb') as f:
+            try:
+                self._mmap = mmap.mmap(
+                    f.fileno(), 0, access=mmap.ACCESS_READ)  # type: mmap.mmap
+            except ValueError:
+                raise SnapshotError('Empty snapshot file: %s' % path)
+
+        try:
+            self._states, self.values = self._load()
+        except Exception:
+            self._mmap.close()
+            raise
+
+    def _load(self):
+        if len(self._mmap) < _HEADER.size:
+            raise SnapshotError('Truncated snapshot header')
+
+        (magic, version, byte_order, item_size, count,
+         states_offset, table_offset, table_length) = _HEADER.unpack_from(
+            self._mmap)
+
+        if magic != MAGIC:
+            raise SnapshotError('Not a snapshot file: %s' % self.path)
+
+        if version != VERSION:
+            raise SnapshotError(
+                'Unsupported snapshot version: %s' % version)
+
+        if byte_order != _BYTE_ORDER[sys.byteorder] or (
+                item_size != array('I').itemsize):
+            raise SnapshotError(
+                'Snapshot was written on an incompatible platform')
+
+        if table_offset + table_length > len(self._mmap):
+            raise SnapshotError('Truncated snapshot file')
+
+        self._states_range = (
+            states_offset, states_offset + count * item_size)  # type: Tuple[int, int]
+        states = self._map_states()
+        values = pickle.loads(
+            self._mmap[table_offset:table_offset + table_length])
+
+        return states, values
+
+    def _map_states(self):
+        # type: () -> memoryview
+        start, end = self._states_range
+        return memoryview(self._mmap)[start:end].cast('I')
+
+    @property
+    def states(self):
+        # type: () -> memoryview
+        """Value ids of the flows, indexes in the values table."""
+        return self._states
+
+    def __len__(self):
+        # type: () -> int
+        return len(self._states)
+
+    def __getitem__(self, index):
+        # type: (int) -> Value
+        return self.values[self._states[index]]
+
+    def __iter__(self):
+        values = self.values
+        return (values[value_id] for value_id in self._states)
+
+    def flow(self, index, rule, context=None, flow_class=FlowBase):
+        # type: (int, RuleBase, Optional[dict], type) -> FlowBase
+        """Creates a flow initialized with the stored value.
+
+        :param index: Flow index in the snapshot
+        :param rule: Values transfer rules
+        :param context: Initial context
+        :param flow_class: Flow class
+        """
+        return flow_class(rule, init=self[index], context=context)
+
+    def close(self):
+        # type: () -> None
+        """Releases the mapped file.
+
+        Views taken from the `states` (e.g. slices or NumPy arrays)
+        keep the file mapped, they must be released first.
+
+        :raise SnapshotError: Views of the states are still held,
+            the snapshot stays open
+        """
+        if self._mmap.closed:
+            return
+
+        self._states.release()
+        try:
+            self._mmap.close()
+        except BufferError as e:
+            self._states = self._map_states()
+            raise SnapshotError(
+                'Views of the snapshot states are still held: %s' % (
+                    self.path)) from e
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,264 @@
+import argparse
+import csv
+import importlib
+import json
+import sys
+from collections import namedtuple
+
+from flow.bases import TransferContext
+from flow.exceptions import TransferError
+
+try:
+    from typing import TYPE_CHECKING
+except ImportError:
+    TYPE_CHECKING = False
+
+if TYPE_CHECKING:
+    from typing import Any
+    from typing import Callable
+    from typing import Dict
+    from typing import Hashable
+    from typing import Iterable
+    from typing import Iterator
+    from typing import List
+    from typing import Optional
+    from typing import Sequence
+    from typing import TextIO
+    from typing import Tuple
+
+    from flow.bases import RuleBase
+    from flow.bases import Value
+
+    Event = Tuple[int, Hashable, Value, Value]
+
+CHUNK_SIZE = 1 << 16  # type: int
+FIELDS = ('entity', 'previous', 'value')  # type: Tuple[str, str, str]
+
+Violation = namedtuple(
+    'Violation', ('line', 'entity', 'input_value', 'output_value', 'error'))
+
+
+def iter_lines(file, chunk_size=CHUNK_SIZE):
+    # type: (TextIO, int) -> Iterator[str]
+    """Reads the file by chunks of lines of about `chunk_size` characters."""
+    while True:
+        lines = file.readlines(chunk_size)
+        if not lines:
+            break
+        for line in lines:
+            yield line
+
+
+def read_jsonl(file, fields=FIELDS, chunk_size=CHUNK_SIZE):
+    # type: (TextIO, Sequence[str], int) -> Iterator[Event]
+    """Reads events from the JSON lines file.
+
+    :param file: Text file, one JSON object per line
+    :param fields: Names of the entity, previous value and new value fields
+    :param chunk_size: Read chunk size
+    :return: (line number, entity, previous value, new value) tuples
+    :raise ValueError: Line is not a JSON object with the scalar fields,
+        or the entity field is missing
+    """
+    entity_field, previous_field, value_field = fields
+
+    for number, line in enumerate(iter_lines(file, chunk_size), 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise ValueError('line %d: %s' % (number, e))
+        if not isinstance(record, dict):
+            raise ValueError('line %d: JSON object expected' % number)
+        if entity_field not in record:
+            raise ValueError('line %d: missing field %s' % (
+                number, entity_field))
+
+        event = (number, record[entity_field],
+                 record.get(previous_field), record.get(value_field))
+        for value in event[1:]:
+            if isinstance(value, (list, dict)):
+                raise ValueError('line %d: scalar expected, got %s' % (
+                    number, json.dumps(value)))
+        yield event
+
+
+def read_csv(file, fields=FIELDS, chunk_size=CHUNK_SIZE):
+    # type: (TextIO, Sequence[str], int) -> Iterator[Event]
+    """Reads events from the CSV file with header, empty cells are None.
+
+    :param file: Text file
+    :param fields: Names of the entity, previous value and new value columns
+    :param chunk_size: Read chunk size
+    :return: (line number, entity, previous value, new value) tuples
+    :raise ValueError: Column is missing in the header, or the row
+        is too short
+    """
+    reader = csv.reader(iter_lines(file, chunk_size))
+    header = next(reader, None)
+    if header is None:
+        return
+
+    for field in fields:
+        if field not in header:
+            raise ValueError('Missing CSV column: %s' % field)
+    entity_column, previous_column, value_column = columns = [
+        header.index(field) for field in fields]
+    width = max(columns) + 1
+
+    for row in reader:
+        if not row:
+            continue
+        if len(row) < width:
+            raise ValueError('line %d: expected %d columns, got %d' % (
+                reader.line_num, len(header), len(row)))
+        yield (reader.line_num, row[entity_column],
+               row[previous_column] or None, row[value_column] or None)
+
+
+def validate_events(rule, events, parse=None, contexts=False):
+    # type: (RuleBase, Iterable[Event], Optional[Callable[[Any], Value]], bool) -> Iterator[Violation]
+    """Validates events one by one, yields only the violations.
+
+    Current value of each entity is tracked as an id in the table of
+    distinct values, the first event of the entity trusts its previous
+    value. Event with previous value different from the tracked one is
+    a violation, and is not checked against the rules. Tracked value
+    follows the log even after violations. Event with the values, which
+    can't be parsed, is a violation too, and the next event of the entity
+    trusts its previous value again.
+
+    :param rule: Values transfer rules
+    :param events: (line number, entity, previous value, new value) tuples
+    :param parse: Converts not None raw values to the flow values
+    :param contexts: Keep transfer context for every entity
+    """
+    values = []  # type: List[Value]
+    value_ids = {}  # type: Dict[Value, int]
+    states = {}  # type: Dict[Hashable, int]
+    entity_contexts = {}  # type: Dict[Hashable, TransferContext]
+
+    for line, entity, previous, value in events:
+        if parse is not None:
+            try:
+                if previous is not None:
+                    previous = parse(previous)
+                if value is not None:
+                    value = parse(value)
+            except (KeyError, ValueError) as e:
+                error = TransferError(rule, 'Unknown value: %s' % e)
+                yield Violation(line, entity, previous, value, error)
+                states.pop(entity, None)
+                continue
+
+        state = states.get(entity)
+        if state is not None and values[state] != previous:
+            error = TransferError(
+                rule, 'Expected previous value %s, got %s' % (
+                    repr(values[state]), repr(previous)))
+            yield Violation(line, entity, previous, value, error)
+        else:
+            context = None
+            if contexts:
+                context = entity_contexts.get(entity)
+                if context is None:
+                    context = entity_contexts[entity] = TransferContext()
+
+            is_valid, error = rule.is_valid(previous, value, context)
+            if context is not None and context._staged is not None:
+                context._apply_staged(is_valid)
+            if not is_valid:
+                yield Violation(line, entity, previous, value, error)
+
+        value_id = value_ids.get(value)
+        if value_id is None:
+            value_id = value_ids[value] = len(values)
+            values.append(value)
+        states[entity] = value_id
+
+
+def import_object(path):
+    # type: (str) -> Any
+    """Imports object by the `package.module:attribute` path."""
+    module_name, _, attribute = path.partition(':')
+    obj = importlib.import_module(module_name)
+    for name in attribute.split('.'):
+        obj = getattr(obj, name)
+    return obj
+
+
+def load_rule(path):
+    # type: (str) -> RuleBase
+    """Loads the rule tree from the serialized file or the import path."""
+    if ':' in path:
+        return import_object(path)
+
+    from flow.serialization import load
+
+    with open(path, 'rb') as f:
+        return load(f)
+
+
+def main(argv=None):
+    # type: (Optional[List[str]]) -> int
+    """Command line entry point, returns exit code."""
+    parser = argparse.ArgumentParser(
+        prog='flow-validate',
+        description='Validates transition log against the rules.')
+    parser.add_argument(
+        'rules', help='serialized rules file or package.module:RULE path')
+    parser.add_argument('log', help='JSON lines or CSV log file, - for stdin')
+    parser.add_argument(
+        '--format', choices=('jsonl', 'csv'),
+        help='log format, detected by the file extension by default')
+    parser.add_argument(
+        '--fields', nargs=3, default=FIELDS,
+        metavar=('ENTITY', 'PREVIOUS', 'VALUE'), help='log field names')
+    parser.add_argument(
+        '--enum', help='package.module:Enum path, values are member names')
+    parser.add_argument(
+        '--contexts', action='store_true',
+        help='keep transfer context for every entity')
+    args = parser.parse_args(argv)
+
+    log_format = args.format
+    if log_format is None:
+        log_format = 'csv' if args.log.endswith('.csv') else 'jsonl'
+    reader = read_csv if log_format == 'csv' else read_jsonl
+
+    parse = None
+    if args.enum:
+        parse = import_object(args.enum).__getitem__
+
+    rule = load_rule(args.rules)
+
+    log = sys.stdin if args.log == '-' else open(args.log, newline='')
+    violations = 0
+    def read():
+        # type: () -> Iterator[Event]
+        # Only errors of the reader are the errors of the log,
+        # errors of the rules are raised as they are
+        try:
+            for event in reader(log, args.fields):
+                yield event
+        except ValueError as e:
+            parser.error('%s: %s' % (args.log, e))
+
+    try:
+        for violation in validate_events(
+                rule, read(), parse=parse, contexts=args.contexts):
+            violations += 1
+            print('%s\t%s\t%r -> %r\t%s' % (
+                violation.line, violation.entity, violation.input_value,
+                violation.output_value,
+                str(violation.error).replace('\n', ' ')))
+    finally:
+        if log is not sys.stdin:
+            log.close()
+
+    return 1 if violations else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+import weakref
+
+# typing is slow to import, type checkers treat the name as true
+TYPE_CHECKING = False
+
+if TYPE_CHECKING:
+    from typing import Dict
+    from typing import Iterable
+    from typing import Optional
+    from typing import Tuple
+
+    from flow.bases import RuleBase
+    from flow.bases import TransferContext
+    from flow.bases import Value
+    from flow.exceptions import TransferError
+
+    Result = Tuple[bool, Optional[TransferError]]
+
+_tables = weakref.WeakKeyDictionary()  # type: weakref.WeakKeyDictionary
+# Depth of the running diagnostic re-runs, see `diagnose`
+_diagnostic_depth = 0
+
+
+def diagnose(rule, input_value, output_value, context=None):
+    # type: (RuleBase, Value, Value, Optional[TransferContext]) -> Result
+    """Re-runs the rule, which rejected the transfer, for the error.
+
+    Rule is re-run by `explain`, so the error has the results of all
+    the matched rules, not only of the rules evaluated until the result
+    was decided. Re-runs repeat the checked transfer, so `RuleProfiler`
+    doesn't count them, see `in_diagnostics`.
+    """
+    global _diagnostic_depth
+    _diagnostic_depth += 1
+    try:
+        explanation = rule.explain(input_value, output_value, context)
+    finally:
+        _diagnostic_depth -= 1
+    return explanation.is_valid, explanation.error
+
+
+def in_diagnostics():
+    # type: () -> bool
+    """Is the diagnostic re-run running."""
+    return _diagnostic_depth > 0
+
+
+class TransitionTable(object):
+    """Memoized results of the static rule.
+
+    Result of the static rule depends only on the transfer values,
+    so every (input, output) transfer is evaluated once. Only verdicts
+    are memoized, errors of the rejected transfers are built again,
+    so raised errors are never shared.
+    """
+    def __init__(self, rule):
+        # type: (RuleBase) -> None
+        """
+        :param rule: Static rule
+        """
+        if not rule.static:
+            raise ValueError('Rule is not static: %s' % repr(rule))
+
+        self.rule = rule  # type: RuleBase
+        self._results = {}  # type: Dict[Tuple[Value, Value], bool]
+
+    def __len__(self):
+        return len(self._results)
+
+    def check(self, input_value, output_value):
+        # type: (Value, Value) -> bool
+        """Is transfer valid, see `RuleBase.check`."""
+        key = (input_value, output_value)
+        result = self._results.get(key)
+        if result is None:
+            result = self._results[key] = self.rule.check(
+                input_value, output_value)
+        return result
+
+    def is_valid(self, input_value, output_value):
+        # type: (Value, Value) -> Result
+        """Result of the rule for the transfer."""
+        if self.check(input_value, output_value):
+            return True, None
+        return diagnose(self.rule, input_value, output_value)
+
+    def check_path(self, input_value, values):
+        # type: (Value, Iterable[Value]) -> Tuple[int, Optional[TransferError]]
+        """Checks the path of the transfers from the input value.
+
+        :return: (Number of the valid transfers, Error of the first invalid)
+        """
+        steps = 0
+        for output_value in values:
+            if not self.check(input_value, output_value):
+                return steps, diagnose(
+                    self.rule, input_value, output_value)[1]
+            input_value = output_value
+            steps += 1
+        return steps, None
+
+
+def get_table(rule):
+    # type: (RuleBase) -> TransitionTable
+    """Shared transition table of the static rule."""
+    table = _tables.get(rule)
+    if table is None:
+        table = _tables[rule] = TransitionTable(rule)
+    return table
@@ -1,9 +1,38 @@
+import asyncio
+import contextlib
+import copy
+import gc
+import io
+import os
+import pickle
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
 import unittest
+import weakref
 from enum import Enum
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from flow.analytics import OTHER
+from flow.analytics import TransitionCollector
 from flow.bases import FlowBase
+from flow.bases import FlowHooks
 from flow.bases import RuleBase
+from flow.bases import TrackedContext
+from flow.bases import TransferContext
+from flow.derived import DerivedFlow
+from flow.derived import Propagator
+from flow.exceptions import HistoryError
 from flow.exceptions import RuleListTransferError
+from flow.exceptions import SerializationError
+from flow.exceptions import SnapshotError
+from flow.exceptions import TransactionError
 from flow.exceptions import TransferError
 from flow.rules import AllToAllRule
 from flow.rules import AllToOneRule
@@ -14,7 +43,42 @@ from flow.rules import OneToOneRule
 from flow.rules import OneToManyRule
 from flow.rules import ManyToOneRule
 from flow.rules import ManyToManyRule
+from flow.rules import CooldownRule
+from flow.rules import RateLimitRule
 from flow.rules import RuleList
+from flow.rules import RulePool
+from flow.rules import TimeWindowRule
+from flow.operators import AtLeast
+from flow.operators import First
+from flow.operators import Weighted
+from flow.product import ProductFlow
+from flow.product import ProductRule
+from flow.graph import TransitionGraph
+from flow.guards import GuardList
+from flow.guards import GuardRule
+from flow.guards import Key
+from flow.hierarchy import HierarchicalRuleList
+from flow.history import History
+from flow.history import HistoryArena
+from flow.hierarchy import Subtree
+from flow.hierarchy import SubtreeRule
+from flow.profiling import RuleProfiler
+from flow.registry import RegisteredRule
+from flow.registry import ValueRegistry
+from flow.serialization import LAYOUT
+from flow.serialization import RuleCache
+from flow.serialization import dumps
+from flow.serialization import loads
+from flow.sharding import ShardedEngine
+from flow.snapshot import Snapshot
+from flow.stream import main as stream_main
+from flow.stream import read_csv
+from flow.stream import read_jsonl
+from flow.stream import validate_events
+from flow.snapshot import dump_flows
+from flow.tables import TransitionTable
+from flow.tables import get_table
+from flow.transaction import Transaction
 
 
 class TestFlow(unittest.TestCase):
@@ -484,5 +548,1825 @@ class TestFlow(unittest.TestCase):
             warnings.warn('Check The RuleList Transfer Error format')  # pragma: no cover
 
 
+class Week(Enum):
+    MONDAY = 0
+    TUESDAY = 1
+    WEDNESDAY = 2
+    THURSDAY = 3
+    FRIDAY = 4
+    SATURDAY = 5
+    SUNDAY = 6
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'flows.snapshot')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_snapshot_round_trip(self):
+        rule = RuleList((
+            OneToOneRule(Week.MONDAY, Week.TUESDAY),
+        ))
+        values = [Week.MONDAY, None, Week.TUESDAY, Week.MONDAY] * 10
+        flows = [FlowBase(rule, init=value) for value in values]
+
+        self.assertEqual(dump_flows(self.path, flows), len(values))
+
+        with Snapshot(self.path) as snapshot:
+            self.assertEqual(len(snapshot), len(values))
+            self.assertEqual(list(snapshot), values)
+            self.assertEqual(len(snapshot.values), 3)
+            self.assertEqual(snapshot[2], Week.TUESDAY)
+
+            flow = snapshot.flow(0, rule)
+            flow.value = Week.TUESDAY
+            self.assertEqual(flow.value, Week.TUESDAY)
+
+    def test_close_with_views(self):
+        flows = [FlowBase(AllToAllRule(), init=value) for value in range(4)]
+        dump_flows(self.path, flows)
+
+        snapshot = Snapshot(self.path)
+        view = snapshot.states[1:3]
+        with self.assertRaises(SnapshotError):
+            snapshot.close()
+        self.assertEqual(snapshot[3], 3)
+
+        view.release()
+        snapshot.close()
+        snapshot.close()
+
+    def test_snapshot_invalid_file(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not a snapshot' * 10)
+
+        with self.assertRaises(SnapshotError):
+            Snapshot(self.path)
+
+
+class TestSerialization(unittest.TestCase):
+    def build_rule(self):
+        return RuleList((
+            OneToAllRule(None),
+            AllToOneRule(None),
+            RuleList((
+                OneToOneRule(Week.MONDAY, Week.TUESDAY),
+                ManyToManyRule(
+                    (Week.TUESDAY, Week.WEDNESDAY),
+                    (Week.THURSDAY, Week.FRIDAY),
+                ),
+            )),
+        ), operator=any)
+
+    def test_round_trip(self):
+        rule = loads(dumps(self.build_rule()))
+
+        self.assertIs(rule.operator, any)
+        self.assertIn(RuleBase.ALL, rule._input_map)
+        self.assertTrue(rule.is_valid(None, Week.MONDAY)[0])
+        self.assertTrue(rule.is_valid(Week.MONDAY, Week.TUESDAY)[0])
+        self.assertTrue(rule.is_valid(Week.WEDNESDAY, Week.FRIDAY)[0])
+        self.assertFalse(rule.is_valid(Week.MONDAY, Week.FRIDAY)[0])
+
+        with self.assertRaises(SerializationError):
+            loads(b'FLRL\xff\xff')
+
+        with self.assertRaises(SerializationError):
+            loads(b'????' + dumps(rule)[4:])
+
+    def test_layout(self):
+        data = dumps(self.build_rule())
+        stale = data[:6] + struct.pack('<H', LAYOUT + 1) + data[8:]
+        with self.assertRaises(SerializationError) as raised:
+            loads(stale)
+        self.assertIn('layout', str(raised.exception))
+
+        # Stale entries are rebuilt
+        with tempfile.TemporaryDirectory() as directory:
+            cache = RuleCache(directory)
+            with open(cache.path('config'), 'wb') as f:
+                f.write(stale)
+            rule = cache.get('config', self.build_rule)
+            self.assertTrue(rule.is_valid(Week.MONDAY, Week.TUESDAY)[0])
+            with open(cache.path('config'), 'rb') as f:
+                self.assertEqual(f.read(), data)
+
+    def test_rule_cache(self):
+        built = []
+
+        def build():
+            built.append(True)
+            return self.build_rule()
+
+        with tempfile.TemporaryDirectory() as directory:
+            cache = RuleCache(directory)
+
+            cache.get('config', build)
+            rule = cache.get('config', build)
+            self.assertEqual(len(built), 1)
+            self.assertTrue(rule.is_valid(Week.MONDAY, Week.TUESDAY)[0])
+
+            cache.get('other config', build)
+            self.assertEqual(len(built), 2)
+
+
+class BrokenRule(AllToAllRule):
+    """All to all rule, which fails by the error of its own."""
+    def is_valid(self, input_value, output_value, context=None):
+        raise ValueError('Broken rule')
+
+
+BROKEN_RULE = BrokenRule()
+
+
+class TestStream(unittest.TestCase):
+    def setUp(self):
+        self.rule = RuleList((
+            OneToAllRule(None),
+            OneToOneRule(Week.MONDAY, Week.TUESDAY),
+            OneToOneRule(Week.TUESDAY, Week.WEDNESDAY),
+        ))
+
+    def test_validate_jsonl(self):
+        log = io.StringIO('\n'.join((
+            '{"entity": 1, "previous": null, "value": "MONDAY"}',
+            '{"entity": 2, "previous": null, "value": "TUESDAY"}',
+            '{"entity": 1, "previous": "MONDAY", "value": "WEDNESDAY"}',
+            '',
+            '{"entity": 2, "previous": "TUESDAY", "value": "WEDNESDAY"}',
+            '{"entity": 2, "previous": "TUESDAY", "value": "WEDNESDAY"}',
+        )))
+
+        violations = list(validate_events(
+            self.rule, read_jsonl(log, chunk_size=16),
+            parse=Week.__getitem__))
+
+        self.assertEqual(
+            [(v.line, v.entity) for v in violations], [(3, 1), (6, 2)])
+        self.assertEqual(violations[0].input_value, Week.MONDAY)
+        self.assertEqual(violations[0].output_value, Week.WEDNESDAY)
+
+    def test_validate_csv(self):
+        log = io.StringIO(
+            'value,entity,previous\n'
+            'MONDAY,a,\n'
+            'TUESDAY,a,MONDAY\n'
+            'MONDAY,a,TUESDAY\n')
+
+        violations = list(validate_events(
+            self.rule, read_csv(log), parse=Week.__getitem__))
+
+        self.assertEqual(len(violations), 1)
+        self.assertEqual(violations[0].line, 4)
+        self.assertIsInstance(violations[0].error, TransferError)
+
+    def test_malformed_records(self):
+        cases = [
+            (read_jsonl, '{"entity": 1}\n{"value": "MONDAY"}\n',
+             'line 2: missing field entity'),
+            (read_jsonl, '\n[1, 2]\n', 'line 2: JSON object expected'),
+            (read_jsonl, '{"entity": 1\n', 'line 1: '),
+            (read_jsonl, '{"entity": [1]}\n', 'line 1: scalar expected'),
+            (read_csv, 'entity,previous,value\n1,,MONDAY\n1,MONDAY\n',
+             'line 3: expected 3 columns, got 2'),
+        ]
+        for reader, log, message in cases:
+            with self.assertRaises(ValueError) as raised:
+                list(reader(io.StringIO(log)))
+            self.assertIn(message, str(raised.exception))
+
+    def test_command_line(self):
+        with tempfile.TemporaryDirectory() as directory:
+            rules_path = os.path.join(directory, 'rules.bin')
+            log_path = os.path.join(directory, 'log.csv')
+
+            with open(rules_path, 'wb') as f:
+                f.write(dumps(self.rule))
+
+            with open(log_path, 'w') as f:
+                f.write('entity,previous,value\n1,,MONDAY\n1,MONDAY,TUESDAY\n')
+
+            argv = [rules_path, log_path, '--enum', 'flow.tests:Week']
+            self.assertEqual(stream_main(argv), 0)
+
+            with open(log_path, 'a') as f:
+                f.write('1,TUESDAY,MONDAY\n')
+
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                self.assertEqual(stream_main(argv), 1)
+            self.assertTrue(output.getvalue().startswith('4\t1\t'))
+
+    def test_malformed_log(self):
+        with tempfile.TemporaryDirectory() as directory:
+            rules_path = os.path.join(directory, 'rules.bin')
+            log_path = os.path.join(directory, 'log.csv')
+
+            with open(rules_path, 'wb') as f:
+                f.write(dumps(self.rule))
+
+            with open(log_path, 'w') as f:
+                f.write('entity,value\n1,MONDAY\n')
+
+            argv = [rules_path, log_path, '--enum', 'flow.tests:Week']
+            errors = io.StringIO()
+            with contextlib.redirect_stderr(errors):
+                with self.assertRaises(SystemExit) as raised:
+                    stream_main(argv)
+            self.assertEqual(raised.exception.code, 2)
+            self.assertIn('Missing CSV column: previous', errors.getvalue())
+
+            with open(log_path, 'w') as f:
+                f.write('entity,previous,value\n1,,MONDAY\n'
+                        '1,MONDAY,SOMEDAY\n2,,MONDAY\n')
+
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                self.assertEqual(stream_main(argv), 1)
+            self.assertEqual(len(output.getvalue().splitlines()), 1)
+            self.assertIn('Unknown value', output.getvalue())
+
+            with open(log_path, 'w') as f:
+                f.write('entity,previous,value\n1,,MONDAY\n1,MONDAY\n')
+
+            errors = io.StringIO()
+            with contextlib.redirect_stderr(errors):
+                with self.assertRaises(SystemExit) as raised:
+                    stream_main(argv)
+            self.assertEqual(raised.exception.code, 2)
+            self.assertIn('line 3: expected 3 columns', errors.getvalue())
+
+            # Errors of the rules are not reported as the log errors
+            with open(log_path, 'w') as f:
+                f.write('entity,previous,value\n1,MONDAY,TUESDAY\n')
+            with self.assertRaisesRegex(ValueError, 'Broken rule'):
+                stream_main(['flow.tests:BROKEN_RULE', log_path])
+
+
+class TestShardedEngine(unittest.TestCase):
+    def test_engine(self):
+        rule = RuleList((
+            OneToOneRule(Week.MONDAY, Week.TUESDAY),
+            OneToOneRule(Week.TUESDAY, Week.WEDNESDAY),
+        ))
+
+        with ShardedEngine(rule, workers=2) as engine:
+            self.assertEqual(engine.workers, 2)
+            engine.create((key, Week.MONDAY, None) for key in range(8))
+
+            results = engine.transfer([
+                (0, Week.TUESDAY),
+                (1, Week.WEDNESDAY),
+                (0, Week.WEDNESDAY),
+                ('missing', Week.TUESDAY),
+            ])
+
+            self.assertEqual([is_valid for is_valid, _ in results], [
+                True, False, True, False])
+            self.assertIsNone(results[0][1])
+            self.assertIsInstance(results[1][1], str)
+
+            self.assertEqual(engine.values([0, 1, 'missing']), [
+                Week.WEDNESDAY, Week.MONDAY, None])
+
+
+class TestRuleProfiler(unittest.TestCase):
+    def test_profiler(self):
+        monday_tuesday = OneToOneRule(Week.MONDAY, Week.TUESDAY)
+        tuesday_all = OneToAllRule(Week.TUESDAY)
+        unused = OneToOneRule(Week.SUNDAY, Week.MONDAY)
+        inner = RuleList((monday_tuesday, tuesday_all))
+        rule = RuleList((inner, unused))
+
+        ticks = iter(range(1000))
+        profiler = RuleProfiler(rule, clock=lambda: next(ticks))
+
+        with profiler:
+            rule.is_valid(Week.MONDAY, Week.TUESDAY)
+            rule.is_valid(Week.TUESDAY, Week.MONDAY)
+            rule.is_valid(Week.TUESDAY, Week.TUESDAY)
+            rule.is_valid(Week.MONDAY, Week.WEDNESDAY)
+
+        self.assertNotIn('is_valid', vars(rule))
+        rule.is_valid(Week.MONDAY, Week.TUESDAY)
+
+        stats = {item.rule: item for item in profiler.stats()}
+        self.assertEqual(stats[rule].calls, 4)
+        self.assertEqual(stats[rule].passed, 3)
+        self.assertEqual(stats[rule].failed, 1)
+        self.assertEqual(stats[monday_tuesday].calls, 1)
+        self.assertEqual(stats[tuesday_all].calls, 2)
+        self.assertEqual(stats[inner].failed, 1)
+        self.assertGreater(stats[rule].total_time, stats[inner].total_time)
+        self.assertEqual(profiler.stats()[0].rule, rule)
+
+        self.assertEqual([item.rule for item in profiler.unused()], [unused])
+        self.assertEqual(profiler.as_dict()['rule.rules[1]']['calls'], 0)
+        self.assertIn('rule.rules[0].rules[1]', profiler.report(sort='calls'))
+
+        profiler.reset()
+        self.assertEqual(stats[rule].calls, 0)
+
+    def test_check(self):
+        monday_tuesday = OneToOneRule(Week.MONDAY, Week.TUESDAY)
+        rule = RuleList((
+            monday_tuesday, OneToOneRule(Week.TUESDAY, Week.WEDNESDAY)))
+        flow = FlowBase(rule, Week.MONDAY)
+
+        with RuleProfiler(rule) as profiler:
+            flow.value = Week.TUESDAY
+            with self.assertRaises(TransferError):
+                flow.value = Week.MONDAY
+
+        self.assertNotIn('check', vars(rule))
+        stats = {item.rule: item for item in profiler.stats()}
+        # Re-run of the failed check for the error is not counted
+        self.assertEqual(stats[rule].calls, 2)
+        self.assertEqual(stats[rule].passed, 1)
+        self.assertEqual(stats[rule].failed, 1)
+        self.assertEqual(stats[monday_tuesday].calls, 1)
+
+
+class TestFlowHooks(unittest.TestCase):
+    def setUp(self):
+        self.rule = RuleList((
+            OneToOneRule(Week.MONDAY, Week.TUESDAY),
+            OneToOneRule(Week.TUESDAY, Week.WEDNESDAY),
+        ))
+
+    def test_flow_hooks(self):
+        events = []
+
+        def observer(event):
+            def callback(flow, input_value, output_value, error):
+                events.append((event, input_value, output_value, error))
+            return callback
+
+        flow = FlowBase(self.rule, Week.MONDAY)
+        callbacks = {event: observer(event) for event in FlowHooks.EVENTS}
+        for event, callback in callbacks.items():
+            flow.add_hook(event, callback)
+
+        flow.value = Week.TUESDAY
+        with self.assertRaises(TransferError) as raised:
+            flow.value = Week.FRIDAY
+
+        self.assertEqual(events, [
+            (FlowHooks.PRE_VALIDATE, Week.MONDAY, Week.TUESDAY, None),
+            (FlowHooks.POST_COMMIT, Week.MONDAY, Week.TUESDAY, None),
+            (FlowHooks.PRE_VALIDATE, Week.TUESDAY, Week.FRIDAY, None),
+            (FlowHooks.ON_REJECT, Week.TUESDAY, Week.FRIDAY,
+             raised.exception),
+        ])
+
+        for event, callback in callbacks.items():
+            flow.remove_hook(event, callback)
+        self.assertIsNone(flow.hooks)
+        self.assertNotIn('_observed', vars(flow))
+
+        with self.assertRaises(ValueError):
+            flow.add_hook('unknown', print)
+
+    def test_class_hooks(self):
+        class Flow(FlowBase):
+            pass
+
+        commits = []
+
+        def callback(flow, input_value, output_value, error):
+            commits.append(flow)
+
+        Flow.add_class_hook(FlowHooks.POST_COMMIT, callback)
+        try:
+            flow = Flow(self.rule, Week.MONDAY)
+            other = FlowBase(self.rule, Week.MONDAY)
+            flow.value = Week.TUESDAY
+            other.value = Week.TUESDAY
+            self.assertEqual(commits, [flow])
+        finally:
+            Flow.remove_class_hook(FlowHooks.POST_COMMIT, callback)
+
+        self.assertNotIn('_observed', vars(Flow))
+        self.assertFalse(Flow._observed)
+
+    def test_buffered_hooks(self):
+        batches = []
+        hooks = FlowHooks(buffer_size=3)
+        hooks.add(FlowHooks.POST_COMMIT, batches.append)
+
+        flows = [FlowBase(self.rule, Week.MONDAY) for _ in range(4)]
+        for flow in flows:
+            flow.use_hooks(hooks)
+            flow.value = Week.TUESDAY
+
+        self.assertEqual(len(batches), 1)
+        self.assertEqual([event[0] for event in batches[0]], flows[:3])
+
+        hooks.flush()
+        self.assertEqual(len(batches), 2)
+        self.assertEqual(batches[1], [
+            (flows[3], Week.MONDAY, Week.TUESDAY, None)])
+
+
+class TestTransitionCollector(unittest.TestCase):
+    def setUp(self):
+        self.rule = RuleList((
+            OneToAllRule(None),
+            AllToOneRule(None),
+            OneToOneRule(Week.MONDAY, Week.TUESDAY),
+            OneToOneRule(Week.TUESDAY, Week.WEDNESDAY),
+        ))
+        self.collector = TransitionCollector(capacity=2)
+        self.flow = FlowBase(self.rule)
+        self.collector.attach(self.flow)
+
+        for value in (Week.MONDAY, Week.TUESDAY, Week.FRIDAY,
+                      Week.WEDNESDAY):
+            try:
+                self.flow.value = value
+            except TransferError:
+                pass
+
+    def test_collector(self):
+        matrix = self.collector.snapshot(reset=True)
+
+        self.assertEqual(matrix.values, [
+            None, Week.MONDAY, Week.TUESDAY, Week.FRIDAY, Week.WEDNESDAY])
+        self.assertEqual(matrix.count(None, Week.MONDAY), 1)
+        self.assertEqual(matrix.count(Week.TUESDAY, Week.WEDNESDAY), 1)
+        self.assertEqual(
+            matrix.count(Week.TUESDAY, Week.FRIDAY, accepted=False), 1)
+        self.assertEqual(matrix.count(Week.SUNDAY, Week.MONDAY), 0)
+        self.assertEqual(len(list(matrix.rows())), 4)
+
+        output = io.StringIO()
+        matrix.write_csv(output)
+        self.assertEqual(len(output.getvalue().splitlines()), 5)
+
+        self.flow.value = None
+        matrix = self.collector.snapshot()
+        self.assertEqual(list(matrix.rows()), [
+            (Week.WEDNESDAY, None, 1, 0)])
+
+        self.collector.detach(self.flow)
+        self.assertIsNone(self.flow.hooks)
+
+    def test_max_values(self):
+        collector = TransitionCollector(
+            capacity=2, values=[Week.MONDAY, Week.TUESDAY], max_values=3)
+        flow = FlowBase(self.rule, Week.MONDAY)
+        collector.attach(flow)
+        for value in range(1000):
+            with self.assertRaises(TransferError):
+                flow.value = value
+        flow.value = Week.TUESDAY
+
+        matrix = collector.snapshot()
+        self.assertEqual(
+            matrix.values, [Week.MONDAY, Week.TUESDAY, 0, OTHER])
+        self.assertEqual(len(collector._accepted), 16)
+        self.assertEqual(matrix.count(Week.MONDAY, 0, accepted=False), 1)
+        self.assertEqual(
+            matrix.count(Week.MONDAY, OTHER, accepted=False), 999)
+        self.assertEqual(matrix.count(Week.MONDAY, Week.TUESDAY), 1)
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_collector_numpy(self):
+        accepted, rejected = self.collector.snapshot().to_numpy()
+
+        self.assertEqual(accepted.shape, (5, 5))
+        self.assertEqual(int(accepted.sum()), 3)
+        self.assertEqual(int(rejected[2, 3]), 1)
+
+
+class TestTimedRules(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.clock = lambda: self.now
+        self.ring = RuleList((
+            OneToOneRule(Week.MONDAY, Week.TUESDAY),
+            OneToOneRule(Week.TUESDAY, Week.MONDAY),
+        ))
+
+    def test_cooldown_rule(self):
+        rule = RuleList((
+            self.ring,
+            CooldownRule({Week.TUESDAY}, 10, clock=self.clock),
+        ))
+        flow = FlowBase(rule, Week.MONDAY)
+
+        flow.value = Week.TUESDAY
+        self.now = 9
+        with self.assertRaises(TransferError):
+            flow.value = Week.MONDAY
+
+        self.now = 10
+        flow.value = Week.MONDAY
+
+        # Not covered by the structural rules
+        with self.assertRaises(TransferError):
+            flow.value = Week.FRIDAY
+
+        self.assertFalse(rule.is_valid(Week.MONDAY, Week.TUESDAY)[0])
+
+    def test_rate_limit_rule(self):
+        limit = RateLimitRule(
+            2, 60, outputs={Week.TUESDAY}, clock=self.clock)
+        rule = RuleList((self.ring, limit))
+        self.assertIn(limit, rule._output_map[Week.TUESDAY])
+        self.assertNotIn(limit, rule._output_map[Week.MONDAY])
+
+        flow = FlowBase(rule, Week.MONDAY)
+        for _ in range(2):
+            flow.value = Week.TUESDAY
+            flow.value = Week.MONDAY
+
+        with self.assertRaises(TransferError):
+            flow.value = Week.TUESDAY
+
+        self.now = 30
+        flow.value = Week.TUESDAY
+        flow.value = Week.MONDAY
+
+        with self.assertRaises(TransferError):
+            flow.value = Week.TUESDAY
+
+        other = FlowBase(rule, Week.MONDAY)
+        other.value = Week.TUESDAY
+
+    def test_rejected_transfers(self):
+        limit = RateLimitRule(1, 60, clock=self.clock)
+        cooldown = CooldownRule({Week.TUESDAY}, 10, clock=self.clock)
+        rule = RuleList((
+            self.ring, limit, cooldown, GuardRule([Key('open').isin({True})])))
+        flow = FlowBase(rule, Week.MONDAY, {'open': False})
+
+        with self.assertRaises(TransferError):
+            flow.value = Week.TUESDAY
+        with self.assertRaises(TransferError):
+            flow.transfer_path([Week.TUESDAY])
+        self.assertEqual(flow.context, {'open': False})
+
+        flow.context['open'] = True
+        flow.value = Week.TUESDAY
+        self.assertEqual(set(flow.context), {'open', limit.key, cooldown.key})
+
+    def test_plain_context(self):
+        class PlainFlow(FlowBase):
+            def init_context(self, context):
+                self._context = dict(context)
+
+        limit = RateLimitRule(1, 60, clock=self.clock)
+        flow = PlainFlow(RuleList((self.ring, limit)), Week.MONDAY)
+        flow.value = Week.TUESDAY
+        self.assertIs(type(flow.context), dict)
+        self.assertEqual(flow.context[limit.key], (0.0, 0.0))
+
+    def test_clock_set_back(self):
+        limit = RateLimitRule(1, 60, clock=self.clock)
+        cooldown = CooldownRule({Week.TUESDAY}, 10, clock=self.clock)
+        flow = FlowBase(RuleList((self.ring, limit, cooldown)), Week.MONDAY)
+
+        self.now = 1000.0
+        flow.value = Week.TUESDAY
+        self.now = 10.0
+        flow.value = Week.MONDAY
+        self.assertEqual(flow.context[limit.key], (0.0, 10.0))
+        with self.assertRaises(TransferError):
+            flow.value = Week.TUESDAY
+
+    def test_default_key(self):
+        limit = RateLimitRule(2, 60, outputs={Week.TUESDAY, Week.MONDAY})
+        self.assertEqual(limit.key, RateLimitRule(
+            2, 60, outputs=[Week.MONDAY, Week.TUESDAY]).key)
+        self.assertNotEqual(limit.key, RateLimitRule(3, 60).key)
+        self.assertNotIn('%x' % id(limit), limit.key)
+        self.assertEqual(RateLimitRule(2, 60, key='limit').key, 'limit')
+
+    def test_time_window_rule(self):
+        rule = TimeWindowRule(22, 6, period=24, clock=self.clock)
+
+        for now, result in ((23, True), (49, True), (5.5, True),
+                            (6, False), (12, False)):
+            self.now = now
+            self.assertEqual(rule.is_valid(None, None)[0], result)
+
+        rule = TimeWindowRule(9, 18, inputs={Week.MONDAY}, clock=self.clock)
+        self.now = 10
+        self.assertTrue(rule.is_valid(Week.MONDAY, Week.FRIDAY)[0])
+        self.assertFalse(rule.is_valid(Week.TUESDAY, Week.FRIDAY)[0])
+
+
+class TestProductFlow(unittest.TestCase):
+    def test_product_flow(self):
+        class NoWeekendRule(RuleBase):
+            inputs = outputs = {RuleBase.ALL}
+
+            def is_valid(self, input_value, output_value, context=None):
+                if Week.SATURDAY in output_value:
+                    return False, TransferError(self, 'Weekend')
+                return True, None
+
+        days = RuleList((
+            OneToOneRule(Week.MONDAY, Week.TUESDAY),
+            OneToOneRule(Week.FRIDAY, Week.SATURDAY),
+        ))
+        switch = RuleList((
+            OneToOneRule(False, True),
+            OneToOneRule(True, False),
+        ))
+
+        rule = ProductRule(
+            (days, days, switch), constraint=NoWeekendRule(),
+            names=('first', 'second', 'switch'))
+        flow = ProductFlow(rule, (Week.MONDAY, Week.FRIDAY, False))
+
+        flow.update(first=Week.TUESDAY, switch=True)
+        self.assertEqual(flow.value, (Week.TUESDAY, Week.FRIDAY, True))
+        self.assertIs(flow.get('switch'), True)
+
+        with self.assertRaises(TransferError):
+            flow.update({0: Week.WEDNESDAY})
+
+        with self.assertRaises(TransferError):
+            flow.update(second=Week.SATURDAY)
+
+        with self.assertRaises(TransferError):
+            flow.value = (Week.TUESDAY, Week.FRIDAY)
+
+        self.assertEqual(flow.value, (Week.TUESDAY, Week.FRIDAY, True))
+
+        other = ProductFlow(rule, (Week.MONDAY, Week.FRIDAY, False))
+        other.value = [Week.TUESDAY, Week.FRIDAY, True]
+        self.assertIs(other.value, flow.value)
+
+        # Rejected values are not interned
+        self.assertEqual(len(rule._states), 2)
+        other.transfer_path([(Week.TUESDAY, Week.FRIDAY, False)])
+        self.assertIs(other.value, rule.intern(
+            [Week.TUESDAY, Week.FRIDAY, False]))
+        self.assertEqual(len(rule._states), 3)
+
+
+class TestHierarchicalRuleList(unittest.TestCase):
+    def test_subtree_rules(self):
+        close = SubtreeRule({Subtree('order.open')}, {'order.closed'})
+        pay = OneToOneRule('order.open.pending', 'order.open.paid')
+        rule = HierarchicalRuleList((
+            close,
+            pay,
+            SubtreeRule({None}, {Subtree(('order', 'open'))}),
+        ))
+
+        cases = [
+            ('order.open.pending', 'order.closed', True),
+            ('order.open.paid', 'order.closed', True),
+            ('order.open', 'order.closed', True),
+            ('order.open.pending', 'order.open.paid', True),
+            (None, 'order.open.pending', True),
+            ('order.openly', 'order.closed', False),
+            ('order.closed', 'order.open.paid', False),
+            ('order.open.paid', 'order.open.pending', False),
+            (object(), 'order.closed', False),
+        ]
+
+        for input_value, output_value, result in cases:
+            self.assertEqual(
+                rule.is_valid(input_value, output_value)[0], result,
+                (input_value, output_value))
+
+        self.assertEqual(
+            rule._find_rules('order.open.pending', 'order.closed'), {close})
+
+    def test_most_specific(self):
+        allow_all = SubtreeRule({Subtree('order')}, {RuleBase.ALL})
+        deny_paid = RuleList((
+            OneToOneRule('order.open.paid', 'order.open.pending'),
+            AllToOneRule('order.open.pending'),
+        ), operator=lambda results: False)
+        rules = (allow_all, deny_paid)
+
+        generic = HierarchicalRuleList(rules, operator=any)
+        specific = HierarchicalRuleList(
+            rules, operator=any, most_specific=True)
+
+        self.assertTrue(
+            generic.is_valid('order.open.paid', 'order.open.pending')[0])
+        self.assertFalse(
+            specific.is_valid('order.open.paid', 'order.open.pending')[0])
+        self.assertTrue(
+            specific.is_valid('order.open.paid', 'order.closed')[0])
+
+
+class CountingRule(RuleBase):
+    """Rule with the fixed result, which counts its calls."""
+    inputs = outputs = {RuleBase.ALL}
+
+    def __init__(self, result):
+        self.result = result
+        self.calls = 0
+
+    def is_valid(self, input_value, output_value, context=None):
+        self.calls += 1
+        if self.result:
+            return True, None
+        return False, TransferError(self, 'Failed')
+
+
+class TestOperators(unittest.TestCase):
+    def evaluate(self, operator, results):
+        rules = [CountingRule(result) for result in results]
+        is_valid, err = RuleList(rules, operator=operator).is_valid(
+            Week.MONDAY, Week.TUESDAY)
+        return is_valid, [rule.calls for rule in rules]
+
+    def test_lazy_evaluation(self):
+        self.assertEqual(
+            self.evaluate(all, (True, False, True)), (False, [1, 1, 0]))
+        self.assertEqual(
+            self.evaluate(any, (False, True, True)), (True, [1, 1, 0]))
+
+    def test_at_least(self):
+        self.assertEqual(
+            self.evaluate(AtLeast(2), (True, True, False)), (True, [1, 1, 0]))
+        self.assertEqual(
+            self.evaluate(AtLeast(2), (False, False, True)),
+            (False, [1, 1, 0]))
+        self.assertEqual(
+            self.evaluate(AtLeast(2), (False, True, True)), (True, [1, 1, 1]))
+        self.assertTrue(AtLeast(1)([False, True]))
+
+    def test_weighted(self):
+        rules = [CountingRule(result) for result in (False, True, True)]
+        operator = Weighted({rules[0]: 5, rules[1]: 1}, threshold=5)
+        is_valid, err = RuleList(rules, operator=operator).is_valid(None, None)
+
+        self.assertFalse(is_valid)
+        self.assertEqual([rule.calls for rule in rules], [1, 0, 0])
+        self.assertEqual(len(err.validation_data), 1)
+
+        operator = Weighted({}, threshold=2, default=1)
+        self.assertTrue(operator([True, False, True]))
+
+    def test_first(self):
+        self.assertEqual(
+            self.evaluate(First(), (False, True)), (False, [1, 0]))
+        self.assertEqual(
+            self.evaluate(First(), (True, False)), (True, [1, 0]))
+
+
+class ContextRule(CountingRule):
+    """Rule, which is valid if the context key is set."""
+    def __init__(self, key):
+        super(ContextRule, self).__init__(True)
+        self.key = key
+
+    def is_valid(self, input_value, output_value, context=None):
+        self.calls += 1
+        if context.get(self.key):
+            return True, None
+        return False, TransferError(self, '%s is not set' % self.key)
+
+
+class TestTrackedContext(unittest.TestCase):
+    def test_cached_results(self):
+        first, second = ContextRule('first'), ContextRule('second')
+        nested = RuleList([second])
+        rule = RuleList([first, nested])
+        context = TrackedContext(first=True, second=True)
+
+        for _ in range(3):
+            self.assertTrue(rule.is_valid(1, 2, context)[0])
+        self.assertEqual((first.calls, second.calls), (1, 1))
+
+        # Nested rule list depends on the keys of its rules
+        context['second'] = False
+        self.assertFalse(rule.is_valid(1, 2, context)[0])
+        self.assertEqual((first.calls, second.calls), (1, 2))
+
+        context['first'] = True
+        self.assertFalse(rule.is_valid(1, 2, context)[0])
+        self.assertEqual((first.calls, second.calls), (2, 2))
+
+        # Other transfer
+        self.assertFalse(rule.is_valid(2, 3, context)[0])
+        self.assertEqual((first.calls, second.calls), (3, 3))
+
+    def test_whole_context_reads(self):
+        class NotBlockedRule(CountingRule):
+            def __init__(self, keys):
+                super(NotBlockedRule, self).__init__(True)
+                self.keys = keys
+
+            def is_valid(self, input_value, output_value, context=None):
+                self.calls += 1
+                return 'blocked' not in self.keys(context), None
+
+        reads = (
+            lambda context: context.keys(),
+            lambda context: [key for key, _ in context.items()],
+            lambda context: list(context),
+            lambda context: context.copy(),
+        )
+        for keys in reads:
+            rule = NotBlockedRule(keys)
+            context = TrackedContext(other=1)
+
+            self.assertTrue(context.evaluate(rule, 1, 2)[0])
+            self.assertTrue(context.evaluate(rule, 1, 2)[0])
+            self.assertEqual(rule.calls, 1)
+
+            context['blocked'] = 1
+            self.assertFalse(context.evaluate(rule, 1, 2)[0])
+            self.assertEqual(rule.calls, 2)
+
+    def test_not_cached(self):
+        clock = iter(range(0, 100, 10))
+        window = TimeWindowRule(0, 15, period=100, clock=lambda: next(clock))
+        rule = RuleList([AllToAllRule(), window])
+        context = TrackedContext()
+
+        self.assertTrue(rule.is_valid(1, 2, context)[0])
+        self.assertTrue(rule.is_valid(1, 2, context)[0])
+        self.assertFalse(rule.is_valid(1, 2, context)[0])
+
+        writer = CountingRule(True)
+        writer.is_valid = lambda *args: (
+            context.__setitem__('written', True) or (True, None))
+        self.assertTrue(context.evaluate(writer, 1, 2)[0])
+        self.assertNotIn((writer, 1, 2), context._cache)
+
+    def test_flow(self):
+        class TrackedFlow(FlowBase):
+            context_class = TrackedContext
+
+        flow = TrackedFlow(RuleList([AllToAllRule()]), 1, {'key': 1})
+        self.assertIsInstance(flow.context, TrackedContext)
+        self.assertEqual(flow.context.version('key'), 0)
+        flow.context['key'] = 2
+        flow.context.pop('key')
+        self.assertEqual(flow.context.version('key'), 2)
+
+
+class CounterRule(RuleBase):
+    """Rule, which counts transfers in the context, up to the limit."""
+    inputs = outputs = None
+
+    def __init__(self, limit, inputs=(RuleBase.ALL,), outputs=(RuleBase.ALL,)):
+        self.limit = limit
+        self.inputs = set(inputs)
+        self.outputs = set(outputs)
+
+    def is_valid(self, input_value, output_value, context=None):
+        count = context.get('count', 0)
+        if count >= self.limit:
+            return False, TransferError(self, 'Limit reached')
+        context['count'] = count + 1
+        return True, None
+
+
+class RoleRule(OneToOneRule):
+    """One to one rule, which is allowed for the role in the context."""
+    def __init__(self, input_value, output_value, role):
+        super(RoleRule, self).__init__(input_value, output_value)
+        self.role = role
+
+    def is_valid(self, input_value, output_value, context=None):
+        is_valid, err = super(RoleRule, self).is_valid(
+            input_value, output_value, context)
+        if is_valid and context.get('role') != self.role:
+            return False, TransferError(self, 'Role is not %s' % self.role)
+        return is_valid, err
+
+
+class TestTransferPath(unittest.TestCase):
+    def setUp(self):
+        self.rule = RuleList([
+            OneToOneRule(Week.MONDAY, Week.TUESDAY),
+            OneToOneRule(Week.TUESDAY, Week.WEDNESDAY),
+        ])
+
+    def test_static(self):
+        self.assertTrue(self.rule.static)
+        self.assertFalse(RuleList([self.rule, CounterRule(1)]).static)
+        with self.assertRaises(ValueError):
+            TransitionTable(CounterRule(1))
+
+        flow = FlowBase(self.rule, Week.MONDAY)
+        events = []
+        flow.add_hook(FlowHooks.POST_COMMIT, lambda *args: events.append(
+            args[1:3]))
+        flow.transfer_path([Week.TUESDAY, Week.WEDNESDAY])
+
+        self.assertEqual(flow.value, Week.WEDNESDAY)
+        self.assertEqual(events, [
+            (Week.MONDAY, Week.TUESDAY), (Week.TUESDAY, Week.WEDNESDAY)])
+        # Tables are shared by the interned rules
+        pool = RulePool()
+        self.assertIs(
+            get_table(pool.intern(self.rule)),
+            get_table(pool.intern(RuleList(self.rule.rules))))
+        self.assertEqual(get_table(self.rule).is_valid(
+            Week.MONDAY, Week.TUESDAY), (True, None))
+
+        with self.assertRaises(TransferError):
+            flow.transfer_path([Week.TUESDAY])
+        self.assertEqual(flow.value, Week.WEDNESDAY)
+
+    def test_fresh_errors(self):
+        flow = FlowBase(self.rule, Week.MONDAY)
+        errors = []
+        for _ in range(2):
+            with self.assertRaises(TransferError) as raised:
+                flow.transfer_path([Week.WEDNESDAY])
+            errors.append(raised.exception)
+
+        self.assertIsNot(errors[0], errors[1])
+        self.assertIsNot(
+            get_table(self.rule).is_valid(Week.MONDAY, Week.FRIDAY)[1],
+            get_table(self.rule).is_valid(Week.MONDAY, Week.FRIDAY)[1])
+
+    def test_subclass(self):
+        rule = RoleRule(Week.MONDAY, Week.TUESDAY, 'admin')
+        self.assertFalse(rule.static)
+        self.assertFalse(RuleList([rule]).static)
+
+        admin = FlowBase(rule, Week.MONDAY, TransferContext(role='admin'))
+        admin.transfer_path([Week.TUESDAY])
+        self.assertEqual(admin.value, Week.TUESDAY)
+
+        user = FlowBase(rule, Week.MONDAY, TransferContext(role='user'))
+        with self.assertRaises(TransferError):
+            user.transfer_path([Week.TUESDAY])
+        self.assertEqual(user.value, Week.MONDAY)
+
+    def test_atomic(self):
+        rule = RuleList([self.rule, CounterRule(2)])
+        flow = FlowBase(rule, Week.MONDAY)
+        rejected = []
+        flow.add_hook(FlowHooks.ON_REJECT, lambda *args: rejected.append(
+            args[1:3]))
+
+        with self.assertRaises(TransferError):
+            flow.transfer_path([Week.TUESDAY, Week.WEDNESDAY, Week.THURSDAY])
+        self.assertEqual(flow.value, Week.MONDAY)
+        self.assertEqual(flow.context, {})
+        self.assertEqual(rejected, [(Week.WEDNESDAY, Week.THURSDAY)])
+
+        flow.transfer_path([Week.TUESDAY, Week.WEDNESDAY])
+        self.assertEqual(flow.value, Week.WEDNESDAY)
+        self.assertEqual(flow.context, {'count': 2})
+
+    def test_uncopyable_context(self):
+        lock = threading.Lock()
+        rule = RuleList([
+            OneToOneRule(Week.MONDAY, Week.TUESDAY),
+            OneToOneRule(Week.TUESDAY, Week.WEDNESDAY),
+            RateLimitRule(2, 60, clock=lambda: 0.0, key='rate'),
+        ])
+        flow = FlowBase(rule, Week.MONDAY, {'lock': lock})
+
+        explanation = flow.explain(Week.TUESDAY)
+        self.assertTrue(explanation.is_valid)
+        self.assertNotIn('rate', flow.context)
+
+        flow.transfer_path([Week.TUESDAY, Week.WEDNESDAY])
+        self.assertEqual(flow.value, Week.WEDNESDAY)
+        self.assertIs(flow.context['lock'], lock)
+        self.assertEqual(flow.context['rate'], (0.0, 0.0))
+
+        registered = FlowBase(
+            RegisteredRule(rule), Week.MONDAY, {'lock': lock})
+        with self.assertRaises(TransferError):
+            registered.value = Week.WEDNESDAY
+        self.assertEqual(set(registered.context), {'lock'})
+
+    def test_tracked_context(self):
+        context = TrackedContext(count=1)
+        rule = CounterRule(5)
+        context.evaluate(rule, 1, 2)
+        context.evaluate(AllToAllRule(), 1, 2)
+
+        staged = copy.deepcopy(context)
+        self.assertEqual(staged, context)
+        self.assertEqual(staged.version('count'), context.version('count'))
+        staged['count'] = 0
+        self.assertEqual(context['count'], 2)
+        self.assertEqual(len(staged._cache), 1)
+
+
+class TestRulePool(unittest.TestCase):
+    def build(self, tenant):
+        return RuleList([
+            RuleList([
+                OneToOneRule(Week.MONDAY, Week.TUESDAY),
+                ManyToManyRule([Week.TUESDAY, Week.WEDNESDAY], {Week.FRIDAY}),
+                AllToAllRule(),
+            ], operator=any),
+            OneToOneRule(tenant, Week.MONDAY),
+        ])
+
+    def test_intern(self):
+        pool = RulePool()
+        rule = pool.intern(
+            ManyToManyRule([Week.MONDAY, Week.TUESDAY], [Week.FRIDAY]))
+        self.assertIs(pool.intern(ManyToManyRule(
+            {Week.TUESDAY, Week.MONDAY}, (Week.FRIDAY,))), rule)
+        self.assertIsNot(
+            pool.intern(OneToOneRule(Week.MONDAY, Week.TUESDAY)),
+            pool.intern(OneToManyRule(Week.MONDAY, [Week.TUESDAY])))
+
+        nested = pool.intern(AllToAllRule())
+        self.assertIsNot(
+            pool.intern(RuleList([nested])),
+            pool.intern(RuleList([nested], any)))
+        self.assertIs(
+            pool.intern(RuleList([nested])), pool.intern(RuleList([nested])))
+        self.assertIsNot(
+            pool.intern(HierarchicalRuleList([nested])),
+            pool.intern(HierarchicalRuleList([nested], separator='/')))
+        # Rules are compared by identity out of the pool
+        self.assertNotEqual(AllToAllRule(), AllToAllRule())
+
+    def test_subclasses(self):
+        class Rules(RuleList):
+            pass
+
+        pool = RulePool()
+        admin = RoleRule(Week.MONDAY, Week.TUESDAY, 'admin')
+        user = RoleRule(Week.MONDAY, Week.TUESDAY, 'user')
+        self.assertIs(pool.intern(admin), admin)
+        self.assertIs(pool.intern(user), user)
+        self.assertEqual(len(RuleList([admin, user], any)._find_rules(
+            Week.MONDAY, Week.TUESDAY)), 2)
+
+        rules = Rules([pool.intern(AllToAllRule())])
+        self.assertIs(pool.intern_tree(rules), rules)
+        self.assertEqual(len(pool), 1)
+
+    def test_intern_tree(self):
+        pool = RulePool()
+        first = pool.intern_tree(self.build(1))
+        second = pool.intern_tree(self.build(2))
+
+        self.assertIs(first.rules[0], second.rules[0])
+        self.assertIsNot(first.rules[1], second.rules[1])
+        self.assertIs(pool.intern_tree(self.build(1)), first)
+        self.assertEqual(len(pool), 8)
+        self.assertTrue(second.is_valid(2, Week.MONDAY)[0])
+
+
+class TestValueRegistry(unittest.TestCase):
+    def setUp(self):
+        self.values = [('order', state) for state in ('new', 'paid', 'sent')]
+        new, paid, sent = self.values
+        self.counter = CounterRule(1, [paid], [sent])
+        self.rule = RuleList([
+            OneToOneRule(new, paid),
+            RuleList([ManyToOneRule([new, paid], sent)], any),
+            self.counter,
+        ])
+
+    def test_map_rule(self):
+        registry = ValueRegistry(self.values)
+        mapped = registry.map_rule(self.rule)
+
+        self.assertEqual(registry.intern(self.values[1]), 1)
+        self.assertEqual(registry.value(2), self.values[2])
+        self.assertEqual(
+            mapped.rules[0]._get_key(), OneToOneRule(0, 1)._get_key())
+        self.assertEqual(mapped.rules[1].rules[0]._get_key(),
+                         ManyToOneRule([0, 1], 2)._get_key())
+        self.assertEqual(mapped.rules[2].inputs, {1})
+        self.assertIs(registry.map_rule(self.rule), mapped)
+
+    def test_flow(self):
+        new, paid, sent = self.values
+        flow = FlowBase(RegisteredRule(self.rule), new)
+        flow.value = paid
+        flow.value = sent
+        self.assertEqual(flow.value, sent)
+        self.assertEqual(flow.context, {'count': 1})
+
+        with self.assertRaises(TransferError) as err:
+            flow.value = new
+        self.assertIn(repr(new), str(err.exception))
+
+        flow = FlowBase(RegisteredRule(self.rule), paid, {'count': 1})
+        with self.assertRaises(RuleListTransferError) as err:
+            flow.value = sent
+        self.assertIn('Limit reached', str(err.exception))
+        self.assertIs(err.exception.rule, self.rule)
+
+    def test_unknown_values(self):
+        new, paid, _ = self.values
+        registry = ValueRegistry()
+        rule = RegisteredRule(self.rule, registry)
+        size = len(registry)
+
+        lost = ('order', 'lost')
+        is_valid, err = rule.is_valid(new, lost, {})
+        self.assertFalse(is_valid)
+        self.assertIn(repr(lost), str(err))
+        self.assertFalse(rule.check(lost, paid, {}))
+        self.assertTrue(RegisteredRule(AllToAllRule(), registry).check(
+            lost, new))
+        self.assertEqual(len(registry), size)
+
+    def test_side_effects(self):
+        new, paid, _ = self.values
+        rule = RuleList([CounterRule(5), CounterRule(0)])
+        expected, context = {}, {}
+        self.assertFalse(rule.is_valid(new, paid, expected)[0])
+        self.assertFalse(RegisteredRule(rule).is_valid(new, paid, context)[0])
+        self.assertEqual(context, expected)
+
+
+@unittest.skipIf(numpy is None, 'NumPy is not installed')
+class TestSimulation(unittest.TestCase):
+    def setUp(self):
+        from flow.simulation import TransitionModel
+
+        self.values = ['new', 'paid', 'sent', 'done', 'cancelled']
+        self.rule = RuleList([
+            OneToManyRule('new', ['paid', 'cancelled']),
+            OneToOneRule('paid', 'sent'),
+            OneToManyRule('sent', ['done', 'paid']),
+        ])
+        self.model = TransitionModel.from_rule(self.rule, self.values)
+
+    def test_model(self):
+        from flow.simulation import TransitionModel
+
+        self.assertEqual(
+            self.model.probabilities[0].tolist(), [0, 0.5, 0, 0, 0.5])
+        self.assertEqual(
+            self.model.absorbing.tolist(), [False, False, False, True, True])
+
+        weights = numpy.ones((5, 5))
+        weights[0, 4] = 3
+        model = TransitionModel.from_rule(self.rule, self.values, weights)
+        self.assertEqual(
+            model.probabilities[0].tolist(), [0, 0.25, 0, 0, 0.75])
+
+        with self.assertRaises(ValueError):
+            TransitionModel.from_rule(RuleList([CounterRule(1)]), self.values)
+
+    def test_simulate(self):
+        result = self.model.simulate({'new': 10000, 'sent': 10}, 30, seed=1)
+        again = self.model.simulate({'new': 10000, 'sent': 10}, 30, seed=1)
+
+        self.assertTrue((result.occupancy == again.occupancy).all())
+        self.assertTrue((result.occupancy.sum(axis=1) == 10010).all())
+        self.assertEqual(result.occupancy_of('new')[1], 0)
+        self.assertEqual(result.occupancy_of('sent')[1], 0)
+        self.assertAlmostEqual(
+            result.occupancy_of('cancelled')[1] / 10000, 0.5, delta=0.05)
+
+        stats = result.absorption_stats()
+        self.assertEqual(stats['absorbed'] + stats['not_absorbed'], 10010)
+        self.assertGreaterEqual(stats['mean'], 1)
+        absorbed = result.occupancy[1, self.model.absorbing].sum()
+        self.assertEqual((result.absorption_times == 1).sum(), absorbed)
+
+
+class TestDerivedFlow(unittest.TestCase):
+    def setUp(self):
+        self.propagator = Propagator()
+        self.items = [FlowBase(AllToAllRule(), 'new') for _ in range(3)]
+        self.calls = []
+
+        def aggregate(*values):
+            self.calls.append(values)
+            if all(value == 'sent' for value in values):
+                return 'sent'
+            if any(value == 'sent' for value in values):
+                return 'partial'
+            return 'new'
+
+        self.order = DerivedFlow(
+            RuleList([
+                OneToOneRule('new', 'partial'),
+                OneToOneRule('partial', 'sent'),
+            ]),
+            self.items, aggregate, propagator=self.propagator)
+
+    def test_propagation(self):
+        self.items[0].value = 'sent'
+        self.assertEqual(self.order.value, 'partial')
+        self.assertEqual(len(self.calls), 2)
+
+        with self.propagator.batch():
+            for item in self.items:
+                item.value = 'sent'
+            self.assertEqual(self.order.value, 'partial')
+        self.assertEqual(self.order.value, 'sent')
+        self.assertEqual(len(self.calls), 3)
+
+    def test_rejected(self):
+        with self.propagator.batch():
+            for item in self.items:
+                item.value = 'sent'
+        self.assertEqual(self.order.value, 'new')
+        self.assertIsInstance(self.order.error, TransferError)
+
+        self.order.close()
+        self.items[0].value = 'new'
+        self.assertEqual(len(self.calls), 2)
+
+    def test_collected(self):
+        source = FlowBase(AllToAllRule(), 1)
+        double = DerivedFlow(
+            AllToAllRule(), [source], lambda value: value * 2,
+            propagator=self.propagator)
+        ref = weakref.ref(double)
+        source.value = 2
+        self.assertEqual(double.value, 4)
+
+        del double
+        gc.collect()
+        self.assertIsNone(ref())
+        self.assertNotIn(id(source), self.propagator._dependents)
+        self.assertIsNone(source.hooks)
+        source.value = 3
+
+    def test_glitch_free(self):
+        source = FlowBase(AllToAllRule(), 1)
+        double = DerivedFlow(
+            AllToAllRule(), [source], lambda value: value * 2,
+            propagator=self.propagator)
+        seen = []
+        total = DerivedFlow(
+            AllToAllRule(), [double, source],
+            lambda doubled, value: seen.append((doubled, value)) or (
+                doubled + value),
+            propagator=self.propagator)
+
+        source.value = 2
+        self.assertEqual(total.rank, 2)
+        self.assertEqual(total.value, 6)
+        self.assertEqual(seen, [(2, 1), (4, 2)])
+
+
+class TestHistory(unittest.TestCase):
+    def setUp(self):
+        self.rule = RuleList([
+            RuleList([
+                OneToOneRule(Week.MONDAY, Week.TUESDAY),
+                OneToOneRule(Week.TUESDAY, Week.WEDNESDAY),
+                OneToOneRule(Week.WEDNESDAY, Week.THURSDAY),
+            ]),
+            CounterRule(10),
+        ])
+
+    def assertState(self, flow, value, context):
+        self.assertEqual((flow.value, flow.context), (value, context))
+
+    def test_undo_redo(self):
+        flow = FlowBase(self.rule, Week.MONDAY)
+        history = History(flow, depth=2, validate=False)
+        flow.value = Week.TUESDAY
+        flow.value = Week.WEDNESDAY
+        flow.value = Week.THURSDAY
+        self.assertEqual(len(history), 2)
+
+        history.undo()
+        self.assertState(flow, Week.WEDNESDAY, {'count': 2})
+        history.undo()
+        self.assertState(flow, Week.TUESDAY, {'count': 1})
+        with self.assertRaises(HistoryError):
+            history.undo()
+
+        history.redo()
+        self.assertState(flow, Week.WEDNESDAY, {'count': 2})
+        flow.value = Week.THURSDAY
+        self.assertFalse(history.can_redo)
+        with self.assertRaises(HistoryError):
+            history.redo()
+
+    def test_validate(self):
+        flow = FlowBase(self.rule, Week.MONDAY)
+        history = History(flow)
+        flow.transfer_path([Week.TUESDAY, Week.WEDNESDAY])
+
+        with self.assertRaises(TransferError):
+            history.undo()
+        self.assertState(flow, Week.WEDNESDAY, {'count': 2})
+
+        history.undo(validate=False)
+        history.undo(validate=False)
+        self.assertState(flow, Week.MONDAY, {})
+        # The first step of the path keeps context changes of the path
+        history.redo()
+        self.assertState(flow, Week.TUESDAY, {'count': 2})
+
+    def test_journal(self):
+        class Flow(FlowBase):
+            context_class = TrackedContext
+
+        flow = Flow(self.rule, Week.MONDAY, {'note': 'x'})
+        history = History(flow)
+        flow.value = Week.TUESDAY
+        flow.value = Week.WEDNESDAY
+
+        context = flow.context
+        self.assertIs(type(context), TrackedContext)
+        self.assertEqual(dict(pickle.loads(pickle.dumps(context))),
+                         {'note': 'x', 'count': 2})
+        self.assertEqual(flow._journal, [])
+
+        history.undo(validate=False)
+        self.assertIs(flow.context, context)
+        self.assertState(flow, Week.TUESDAY, {'note': 'x', 'count': 1})
+        history.close()
+        self.assertIsNone(flow._journal)
+
+    def test_replay_notifies(self):
+        flow = FlowBase(self.rule, Week.MONDAY)
+        history = History(flow)
+        flow.value = Week.TUESDAY
+        events = []
+        flow.add_hook(FlowHooks.POST_COMMIT, lambda *args: events.append(
+            args[1:3]))
+
+        history.undo(validate=False)
+        history.redo()
+        self.assertEqual(events, [
+            (Week.TUESDAY, Week.MONDAY), (Week.MONDAY, Week.TUESDAY)])
+        self.assertEqual(len(history), 1)
+        self.assertFalse(history.can_redo)
+
+    def test_arena(self):
+        arena = HistoryArena(depth=4)
+        flows = [FlowBase(self.rule, Week.MONDAY) for _ in range(3)]
+        histories = [History(flow, arena=arena) for flow in flows]
+        for flow in flows[:2]:
+            flow.value = Week.TUESDAY
+
+        self.assertEqual(len(arena), 2)
+        self.assertEqual(len(arena.inputs), 8)
+        self.assertEqual(len(arena.registry), 2)
+
+        histories[0].close()
+        flows[2].value = Week.TUESDAY
+        self.assertEqual(len(arena), 2)
+        histories[2].undo(validate=False)
+        self.assertEqual(flows[2].value, Week.MONDAY)
+        self.assertIsNone(flows[0].hooks)
+
+
+class TestTransaction(unittest.TestCase):
+    def setUp(self):
+        self.rule = RuleList([
+            OneToOneRule(Week.MONDAY, Week.TUESDAY),
+            OneToOneRule(Week.TUESDAY, Week.WEDNESDAY),
+        ])
+        self.counted = RuleList([self.rule, CounterRule(1)])
+
+    def test_commit(self):
+        flows = [FlowBase(self.rule, Week.MONDAY) for _ in range(3)]
+        counted = FlowBase(self.counted, Week.MONDAY)
+        events = []
+        flows[0].add_hook(
+            FlowHooks.POST_COMMIT, lambda *args: events.append(args[2]))
+
+        with Transaction() as transaction:
+            for flow in flows + [counted]:
+                transaction.transfer(flow, Week.TUESDAY)
+            transaction.transfer(flows[0], Week.WEDNESDAY)
+            self.assertEqual(len(transaction), 4)
+            self.assertEqual(transaction.validate(), [])
+            self.assertEqual(flows[1].value, Week.MONDAY)
+
+        self.assertEqual(
+            [flow.value for flow in flows],
+            [Week.WEDNESDAY, Week.TUESDAY, Week.TUESDAY])
+        self.assertEqual(counted.context, {'count': 1})
+        self.assertEqual(events, [Week.TUESDAY, Week.WEDNESDAY])
+
+    def test_notify_committed(self):
+        flows = [FlowBase(self.rule, Week.MONDAY) for _ in range(2)]
+        seen = []
+        flows[0].add_hook(FlowHooks.POST_COMMIT, lambda *args: seen.append(
+            [flow.value for flow in flows]))
+
+        with Transaction() as transaction:
+            for flow in flows:
+                transaction.transfer(flow, Week.TUESDAY)
+
+        self.assertEqual(seen, [[Week.TUESDAY, Week.TUESDAY]])
+
+    def test_rollback(self):
+        flows = [FlowBase(self.rule, Week.MONDAY) for _ in range(3)]
+        counted = FlowBase(self.counted, Week.MONDAY)
+        flows[2].value = Week.TUESDAY
+        rejected = []
+        flows[2].add_hook(
+            FlowHooks.ON_REJECT, lambda *args: rejected.append(args[1:3]))
+
+        transaction = Transaction()
+        transaction.transfer(counted, Week.TUESDAY)
+        for flow in flows:
+            transaction.transfer(flow, Week.TUESDAY)
+
+        with self.assertRaises(TransactionError) as err:
+            transaction.commit()
+        self.assertEqual(len(err.exception.errors), 1)
+        self.assertIs(err.exception.errors[0][0], flows[2])
+        self.assertEqual(rejected, [(Week.TUESDAY, Week.TUESDAY)])
+        self.assertEqual(
+            [flow.value for flow in flows],
+            [Week.MONDAY, Week.MONDAY, Week.TUESDAY])
+        self.assertEqual((counted.value, counted.context), (Week.MONDAY, {}))
+
+
+class TestGuardList(unittest.TestCase):
+    def setUp(self):
+        self.admin = GuardRule([Key('role') == 'admin'])
+        self.manager = GuardRule(
+            [Key('role').isin({'manager', 'owner'}), Key('amount') < 100])
+        self.eu = GuardRule([Key('region') == 'eu', Key('amount') >= 10])
+        self.any = GuardRule([Key('amount') > 0])
+        self.guards = [self.admin, self.manager, self.eu, self.any]
+
+    def test_guard_rule(self):
+        self.assertTrue(self.manager.is_valid(
+            1, 2, {'role': 'owner', 'amount': 10})[0])
+        is_valid, err = self.manager.is_valid(1, 2, {'role': 'owner'})
+        self.assertFalse(is_valid)
+        self.assertEqual(str(err), "context['amount'] < 100 is false")
+        self.assertEqual(
+            self.manager.discriminators,
+            {'role': frozenset({'manager', 'owner'})})
+
+    def test_failing_guards(self):
+        rule = GuardList(self.guards)
+        self.assertEqual(rule.keys, ['role', 'region'])
+        self.assertEqual(
+            rule.failing_guards({'role': 'admin', 'region': 'eu'}),
+            {self.manager})
+        self.assertEqual(
+            rule.failing_guards({'role': 'owner'}), {self.admin, self.eu})
+        self.assertEqual(
+            rule.failing_guards({}), {self.admin, self.manager, self.eu})
+
+    def test_unhashable_context(self):
+        context = {'role': ['admin'], 'amount': 10}
+        self.assertFalse(self.admin.is_valid(1, 2, context)[0])
+
+        rule = GuardList([AllToAllRule()] + self.guards)
+        self.assertEqual(
+            rule.failing_guards(context), {self.admin, self.manager, self.eu})
+        self.assertEqual(
+            rule.is_valid(1, 2, context)[0],
+            RuleList([AllToAllRule()] + self.guards).is_valid(
+                1, 2, context)[0])
+        self.assertFalse(rule.check(1, 2, context))
+
+    def test_is_valid(self):
+        structural = AllToAllRule()
+        for operator in (all, any):
+            plain = RuleList([structural] + self.guards, operator)
+            compiled = GuardList([structural] + self.guards, operator)
+            for context in (
+                    {'role': 'admin', 'region': 'eu', 'amount': 10},
+                    {'role': 'owner', 'region': 'us', 'amount': 10},
+                    {'role': 'owner', 'amount': 0},
+                    {}):
+                self.assertEqual(
+                    plain.is_valid(1, 2, context)[0],
+                    compiled.is_valid(1, 2, context)[0])
+
+        calls = []
+        is_valid = self.admin.is_valid
+        self.admin.is_valid = lambda *args: calls.append(args) or is_valid(
+            *args)
+        rule = GuardList([structural, self.admin])
+        self.assertFalse(rule.is_valid(1, 2, {'role': 'user'})[0])
+        self.assertTrue(rule.is_valid(1, 2, {'role': 'admin'})[0])
+        self.assertEqual(len(calls), 1)
+        self.assertFalse(GuardList(self.guards).is_valid(1, 2, {})[0])
+
+
+class TestWaitFor(unittest.TestCase):
+    def setUp(self):
+        self.rule = AllToAllRule()
+
+    def test_value(self):
+        flow = FlowBase(self.rule, Week.MONDAY)
+
+        async def run():
+            waiter = flow.wait_for(Week.WEDNESDAY)
+            other = flow.wait_for(Week.FRIDAY)
+            flow.value = Week.TUESDAY
+            self.assertFalse(waiter.done())
+            flow.value = Week.WEDNESDAY
+            self.assertEqual(await waiter, Week.WEDNESDAY)
+            self.assertFalse(other.done())
+            self.assertEqual(await flow.wait_for(Week.WEDNESDAY),
+                             Week.WEDNESDAY)
+            other.cancel()
+
+        asyncio.run(run())
+        self.assertIsNone(flow._waiters)
+        self.assertNotIn('_observed', flow.__dict__)
+
+    def test_predicate(self):
+        flow = FlowBase(self.rule, 1)
+
+        async def run():
+            waiter = flow.wait_for(lambda value: value > 2)
+            flow.value = 2
+            self.assertFalse(waiter.done())
+            flow.value = 3
+            return await waiter
+
+        self.assertEqual(asyncio.run(run()), 3)
+
+    def test_timeout(self):
+        flow = FlowBase(self.rule, Week.MONDAY)
+
+        async def run():
+            with self.assertRaises(asyncio.TimeoutError):
+                await flow.wait_for(Week.FRIDAY, timeout=0.01)
+            await asyncio.sleep(0)
+
+        asyncio.run(run())
+        self.assertIsNone(flow._waiters)
+
+    def test_many_waiters(self):
+        flows = [FlowBase(self.rule, 0) for _ in range(100)]
+
+        async def run():
+            waiters = [
+                flow.wait_for(value)
+                for flow in flows for value in range(1, 101)
+            ]
+            for flow in flows:
+                flow.value = 50
+            self.assertEqual(sum(waiter.done() for waiter in waiters), 100)
+            self.assertEqual(len(flows[0]._waiters.values), 99)
+
+        asyncio.run(run())
+
+
+class TestStartup(unittest.TestCase):
+    def test_core_imports(self):
+        script = (
+            'import sys\n'
+            'before = set(sys.modules)\n'
+            'import flow.bases, flow.rules, flow.exceptions\n'
+            'print(\' \'.join(sorted(set(sys.modules) - before)))\n'
+        )
+        path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.check_output(
+            [sys.executable, '-c', script],
+            env=dict(os.environ, PYTHONPATH=path))
+        modules = output.decode().split()
+
+        self.assertIn('flow.rules', modules)
+        for heavy in ('asyncio', 'numpy', 'typing'):
+            self.assertNotIn(heavy, modules)
+
+    def test_from_pairs(self):
+        pairs = [(1, 2), (2, 3), (1, 2), (3, 1)]
+        rule = RuleList.from_pairs(pairs, any)
+        expected = RuleList([OneToOneRule(*pair) for pair in pairs], any)
+
+        def keys(rules):
+            return [nested._get_key() for nested in rules]
+
+        self.assertEqual(keys(rule.rules), keys(expected.rules))
+        for value in (1, 2, 3):
+            self.assertEqual(keys(rule._input_map[value]),
+                             keys(expected._input_map[value]))
+            self.assertEqual(keys(rule._output_map[value]),
+                             keys(expected._output_map[value]))
+        self.assertEqual(
+            sorted(rule._positions.values()),
+            sorted(expected._positions.values()))
+        self.assertTrue(rule.static)
+        self.assertFalse(rule.guard)
+        self.assertTrue(rule.is_valid(1, 2)[0])
+        self.assertFalse(rule.is_valid(1, 3)[0])
+
+    def test_from_pairs_subclass(self):
+        rule = HierarchicalRuleList.from_pairs([('a.b', 'a.c')])
+
+        self.assertIsInstance(rule, HierarchicalRuleList)
+        self.assertTrue(rule.is_valid('a.b', 'a.c')[0])
+
+
+class TestTransitionGraph(unittest.TestCase):
+    def setUp(self):
+        self.domain = [0, 1, 2, 3, 4, 5, 7]
+        self.rule = RuleList([
+            RuleList([OneToOneRule(0, 1), OneToOneRule(2, 3)]),
+            OneToManyRule(0, [1, 3]),
+            ManyToAllRule([4]),
+            RuleList([
+                OneToOneRule(1, 2), AllToOneRule(5), OneToOneRule(3, 7),
+            ], AtLeast(1)),
+        ])
+
+    def brute_force(self, rule, values):
+        return {
+            (input_value, output_value)
+            for input_value in values for output_value in values
+            if rule.is_valid(input_value, output_value)[0]
+        }
+
+    def test_edges(self):
+        graph = TransitionGraph.from_rule(self.rule, self.domain)
+
+        self.assertEqual(graph.values, self.domain)
+        self.assertEqual(set(graph.edges()), self.brute_force(
+            self.rule, graph.values))
+        self.assertNotIn((0, 3), set(graph.edges()))
+        self.assertEqual(len(graph), len(set(graph.edges())))
+        self.assertEqual(graph.unknown_rules, [])
+        self.assertEqual(list(graph.rows), sorted(graph.rows))
+
+        graph = TransitionGraph.from_rule(self.rule, range(6))
+        self.assertEqual(graph.values, [0, 1, 2, 3, 4, 5, 7])
+
+    def test_csr(self):
+        graph = TransitionGraph.from_rule(self.rule, self.domain)
+        indptr, indices = graph.csr()
+
+        self.assertEqual(len(indptr), len(graph.values) + 1)
+        for row, value in enumerate(graph.values):
+            outputs = {
+                graph.values[col]
+                for col in indices[indptr[row]:indptr[row + 1]]
+            }
+            self.assertEqual(outputs, {
+                output for input_value, output in graph.edges()
+                if input_value == value
+            })
+
+    def test_unknown(self):
+        limit = RateLimitRule(1, 60, outputs={1}, clock=lambda: 0.0)
+        rule = RuleList([self.rule, limit])
+        graph = TransitionGraph.from_rule(rule, self.domain)
+        edges = self.brute_force(self.rule, graph.values)
+        unknown = {edge for edge in edges if edge[1] == 1}
+
+        self.assertEqual(graph.unknown_rules, [limit])
+        self.assertEqual(set(graph.edges(unknown=True)), unknown)
+        self.assertEqual(set(graph.edges()), edges - unknown)
+        self.assertEqual(len(graph.csr(unknown=True)[1]), len(unknown))
+
+class TestExplain(unittest.TestCase):
+    def setUp(self):
+        self.inner = RuleList([
+            OneToOneRule(1, 2), ManyToManyRule([1, 2], [3])])
+        self.rule = RuleList([
+            self.inner,
+            OneToManyRule(1, [2, 3]),
+            AllToOneRule(4),
+            RuleList([OneToOneRule(2, 3), ManyToAllRule([3])], any),
+        ])
+
+    def test_check(self):
+        rules = [
+            self.rule,
+            RuleList(self.rule.rules, First()),
+            RuleList(self.rule.rules, AtLeast(2)),
+            HierarchicalRuleList([
+                SubtreeRule([Subtree('a')], [Subtree('b')]),
+                OneToOneRule('a.x', 'a.y'),
+            ]),
+            GuardList([self.rule, GuardRule([Key('role') == 'admin'])]),
+            ProductRule([self.rule, self.inner]),
+        ]
+        values = [1, 2, 3, 4, 'a.x', 'a.y', 'b.z', (1, 1), (2, 3), (3, 1)]
+        for context in ({}, {'role': 'admin'}):
+            for rule in rules:
+                for input_value in values:
+                    for output_value in values:
+                        if isinstance(rule, ProductRule) != (
+                                isinstance(input_value, tuple) and
+                                isinstance(output_value, tuple)):
+                            continue
+                        self.assertEqual(
+                            rule.check(input_value, output_value, context),
+                            rule.is_valid(
+                                input_value, output_value, context)[0])
+
+    def test_subclass(self):
+        rule = RuleList([RoleRule(1, 2, 'admin'), OneToOneRule(2, 3)])
+        self.assertIs(RoleRule.check, RuleBase.check)
+
+        self.assertFalse(rule.check(1, 2, {'role': 'user'}))
+        self.assertTrue(rule.check(1, 2, {'role': 'admin'}))
+        flow = FlowBase(rule, 1, TransferContext(role='user'))
+        with self.assertRaises(TransferError):
+            flow.value = 2
+        self.assertEqual(flow.value, 1)
+
+    def test_transfer(self):
+        calls = []
+        explain = self.rule.explain
+        self.rule.explain = lambda *args: calls.append(args) or explain(
+            *args)
+        flow = FlowBase(self.rule, 1)
+
+        flow.value = 2
+        self.assertEqual(calls, [])
+
+        with self.assertRaises(RuleListTransferError) as context:
+            flow.value = 1
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(
+            str(context.exception), str(explain(2, 1).error))
+
+    def test_full_error(self):
+        class BadRule(OneToOneRule):
+            def is_valid(self, input_value, output_value, context=None):
+                return False, TransferError(self, 'Bad rule')
+
+        bad = [BadRule(1, 2) for _ in range(3)]
+        rule = RuleList([OneToOneRule(1, 2)] + bad)
+        self.assertFalse(rule.static)
+
+        for flow in (FlowBase(rule, 1), FlowBase(RegisteredRule(rule), 1)):
+            with self.assertRaises(RuleListTransferError) as context:
+                flow.value = 2
+            self.assertEqual(
+                [data[0] for data in context.exception.validation_data],
+                [rule.rules[0]] + bad)
+
+            with self.assertRaises(RuleListTransferError) as context:
+                flow.transfer_path([2])
+            self.assertEqual(len(context.exception.validation_data), 4)
+
+    def test_explain(self):
+        ticks = iter(range(1000))
+        explanation = self.rule.explain(2, 2, clock=lambda: next(ticks))
+
+        self.assertFalse(explanation.is_valid)
+        self.assertIsInstance(explanation.error, RuleListTransferError)
+        # All the matched rules are evaluated, not only the first failed
+        self.assertEqual(
+            [child.rule for child in explanation.children],
+            [self.inner, self.rule.rules[3]])
+        self.assertEqual(
+            [child.is_valid for child in explanation.children],
+            [False, False])
+        self.assertEqual(
+            len(self.rule.is_valid(2, 2)[1].validation_data), 1)
+        self.assertEqual(len(explanation.error.validation_data), 2)
+
+        inner = explanation.children[0]
+        self.assertEqual(inner.children, [])
+        self.assertIn('Rules not found', str(inner.error))
+        self.assertGreater(explanation.time, inner.time)
+
+        explanation = self.rule.explain(1, 3)
+        self.assertTrue(explanation.is_valid)
+        self.assertIsNone(explanation.error)
+        self.assertEqual(
+            [child.rule for child in explanation.children[0].children],
+            [self.inner.rules[1]])
+
+        data = explanation.as_dict()
+        self.assertEqual(data['rule'], repr(self.rule))
+        self.assertEqual(len(data['children']), 2)
+        self.assertIsNone(data['children'][1]['error'])
+
+    def test_not_found(self):
+        explanation = self.rule.explain(4, 1)
+
+        self.assertFalse(explanation.is_valid)
+        self.assertEqual(explanation.children, [])
+        self.assertIn('Rules not found', str(explanation.error))
+
+    def test_flow(self):
+        counter = CounterRule(1)
+        flow = FlowBase(RuleList([self.rule, counter]), 1, {'count': 0})
+
+        explanation = flow.explain(2)
+        self.assertTrue(explanation.is_valid)
+        self.assertEqual(
+            [child.rule for child in explanation.children],
+            [self.rule, counter])
+        self.assertEqual(flow.value, 1)
+        self.assertEqual(flow.context, {'count': 0})
+
+    def test_guards(self):
+        guard = GuardRule([Key('role') == 'admin'])
+        rule = GuardList([self.rule, guard])
+
+        explanation = rule.explain(1, 2, {'role': 'user'})
+        self.assertFalse(explanation.is_valid)
+        self.assertEqual(explanation.children[1].rule, guard)
+        self.assertIn('is false', str(explanation.children[1].error))
+        self.assertTrue(rule.explain(1, 2, {'role': 'admin'}).is_valid)
+
+
 if __name__ == '__main__':
     unittest.main()
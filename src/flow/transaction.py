@@ -0,0 +1,128 @@
+from flow.bases import FlowHooks
+from flow.bases import StagedContext
+from flow.exceptions import TransactionError
+from flow.tables import diagnose
+from flow.tables import get_table
+
+try:
+    from typing import TYPE_CHECKING
+except ImportError:
+    TYPE_CHECKING = False
+
+if TYPE_CHECKING:
+    from typing import Dict
+    from typing import Iterable
+    from typing import List
+    from typing import Tuple
+
+    from flow.bases import FlowBase
+    from flow.bases import RuleBase
+    from flow.bases import Value
+    from flow.exceptions import TransferError
+
+
+class Transaction(object):
+    """All-or-nothing transfers of several flows.
+
+    Usage:
+        with Transaction() as transaction:
+            for item in items:
+                transaction.transfer(item, Status.SHIPPED)
+
+    All the transfers are validated first, context changes are staged,
+    and flows are changed only if all the transfers are valid.
+    Observers are notified once all the flows are changed.
+    Single transfers of the flows with static rules are grouped by
+    the (rule, input, output), so every group is validated once.
+    """
+    def __init__(self):
+        self._paths = {}  # type: Dict[int, Tuple[FlowBase, List[Value]]]
+
+    def __len__(self):
+        return len(self._paths)
+
+    def transfer(self, flow, value):
+        # type: (FlowBase, Value) -> None
+        """Adds the transfer, transfers of the same flow form a path."""
+        self.transfer_path(flow, [value])
+
+    def transfer_path(self, flow, values):
+        # type: (FlowBase, Iterable[Value]) -> None
+        """Adds the path of the transfers, see `FlowBase.transfer_path`."""
+        path = self._paths.get(id(flow))
+        if path is None:
+            path = self._paths[id(flow)] = (flow, [])
+        path[1].extend(values)
+
+    def _validate(self, dispatch):
+        # type: (bool) -> Tuple[List[Tuple[FlowBase, List[Value], StagedContext]], List[Tuple[FlowBase, TransferError]]]
+        staged = []  # type: List[Tuple[FlowBase, List[Value], StagedContext]]
+        errors = []  # type: List[Tuple[FlowBase, TransferError]]
+        groups = {}  # type: Dict[Tuple[RuleBase, Value, Value], bool]
+
+        for flow, values in self._paths.values():
+            if not values:
+                continue
+
+            if dispatch:
+                flow._dispatch_path(FlowHooks.PRE_VALIDATE, values)
+            rule = flow._rule
+            if rule.static and len(values) == 1:
+                key = (rule, flow._value, values[0])
+                result = groups.get(key)
+                if result is None:
+                    result = groups[key] = get_table(rule).check(
+                        flow._value, values[0])
+                # Errors are built per flow, see `TransitionTable`
+                err = None if result else diagnose(
+                    rule, flow._value, values[0])[1]
+                context, steps = StagedContext(flow._context), 0
+            else:
+                context, steps, err = flow._validate_path(values)
+
+            if err is None:
+                staged.append((flow, values, context))
+            else:
+                if dispatch:
+                    flow._reject_path(values, steps, err)
+                errors.append((flow, err))
+
+        return staged, errors
+
+    def validate(self):
+        # type: () -> List[Tuple[FlowBase, TransferError]]
+        """Validates the transfers without committing them,
+        observers are not notified.
+
+        :return: Failed flows with their transfer errors
+        """
+        return self._validate(False)[1]
+
+    def commit(self):
+        # type: () -> None
+        """Validates and commits all the transfers.
+
+        :raise TransactionError: Some transfers are invalid,
+            none of the flows is changed
+        """
+        staged, errors = self._validate(True)
+        if errors:
+            raise TransactionError(errors)
+
+        # All the flows are changed before the observers are notified,
+        # so observers never see the transaction partially committed
+        inputs = []
+        for flow, values, context in staged:
+            inputs.append(flow._value)
+            flow._apply_path(values, context)
+        self._paths.clear()
+
+        for (flow, values, _), input_value in zip(staged, inputs):
+            flow._notify_path(input_value, values)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.commit()